@@ -0,0 +1,184 @@
+import json
+import mmap
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from compact_schema import compact_user_table
+from data_loader import load_user_data, source_cache_dir, source_digest
+from profiling import stage
+
+# 派生数组存储：紧凑用户表（注册日、注册秒、付费/登录时间差、注册周等）按列保存为 .npy 文件，
+# 放在源文件缓存目录下以源文件内容哈希命名的目录中；读取时用只读内存映射，不解析、不拷贝，
+# 同一台机器上的多次分析、多进程分片（见 parallel_cohorts）和看板查询服务共享页缓存中的同一份数据
+# 文本列（用户ID为文本、渠道等维度）无法直接映射，按 pd.factorize 的编码保存，取值表存为字符串数组和类型码数组，
+# 读取时还原为对象数组；目录中全部是 .npy 文件，读取时不反序列化任何 pickle
+# 映射出的列是只读的，分析中不能原地修改紧凑用户表
+
+# 存储格式变化时递增，旧目录自动失效
+ARRAY_STORE_VERSION = 2
+_META_NAME = 'meta.json'
+# 文本列取值的类型码 -> 由字符串还原取值；其他类型（如日期）按字符串保存
+_LABEL_TYPES = {0: str, 1: int, 2: float, 3: bool}
+
+
+def array_store_path(file_path, digest):
+    """
+    源文件内容哈希为 digest 时的派生数组目录
+    """
+    file_name = os.path.basename(file_path)
+    return os.path.join(source_cache_dir(file_path), f"{file_name}.v{ARRAY_STORE_VERSION}.{digest[:16]}.arrays")
+
+
+def _read_store_meta(directory):
+    try:
+        with open(os.path.join(directory, _META_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _label_kind(value):
+    if isinstance(value, (bool, np.bool_)):
+        return 3
+    if isinstance(value, (int, np.integer)):
+        return 1
+    if isinstance(value, (float, np.floating)):
+        return 2
+    return 0
+
+
+def _encode_labels(uniques):
+    # 取值表转换为 (字符串数组, 类型码数组)；str(float) 是可精确还原的最短表示
+    labels = np.array([str(value) for value in uniques], dtype=str)
+    kinds = np.array([_label_kind(value) for value in uniques], dtype='i1')
+    return labels, kinds
+
+
+def _decode_labels(labels, kinds):
+    # _encode_labels 的逆运算，按类型码整批转换
+    values = labels.astype(object)
+    for kind in np.unique(kinds):
+        if _LABEL_TYPES[int(kind)] is str:
+            continue
+        selected = kinds == kind
+        if _LABEL_TYPES[int(kind)] is bool:
+            values[selected] = labels[selected] == 'True'
+        else:
+            values[selected] = labels[selected].astype('i8' if _LABEL_TYPES[int(kind)] is int else 'f8').astype(object)
+    return values
+
+
+def write_arrays(compact, directory, extra_columns=()):
+    """
+    把紧凑用户表按列写入派生数组目录；先写临时目录再整体改名，读者不会看到写了一半的目录
+    extra_columns: 生成该表时请求的维度列（包括源数据中不存在的列），用于判断之后的请求能否直接映射
+    """
+    tmp_dir = f'{directory}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = []
+    for position, column in enumerate(compact.columns):
+        values = compact[column].to_numpy()
+        entry = {'name': column, 'file': f'{position}.npy', 'encoded': values.dtype.kind == 'O'}
+        if entry['encoded']:
+            codes, uniques = pd.factorize(compact[column])
+            values = codes.astype('i4')
+            labels, kinds = _encode_labels(uniques)
+            entry['labels'], entry['kinds'] = f'{position}.labels.npy', f'{position}.kinds.npy'
+            np.save(os.path.join(tmp_dir, entry['labels']), labels, allow_pickle=False)
+            np.save(os.path.join(tmp_dir, entry['kinds']), kinds, allow_pickle=False)
+        np.save(os.path.join(tmp_dir, entry['file']), np.ascontiguousarray(values), allow_pickle=False)
+        columns.append(entry)
+    with open(os.path.join(tmp_dir, _META_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'version': ARRAY_STORE_VERSION, 'rows': len(compact), 'columns': columns,
+                   'extra_columns': list(extra_columns)}, f, ensure_ascii=False, indent=2)
+
+    # 已有目录（维度列较少的旧版本）先移走再换入；已映射旧文件的进程不受影响
+    old_dir = f'{directory}.old{os.getpid()}'
+    if os.path.isdir(directory):
+        os.rename(directory, old_dir)
+    try:
+        os.rename(tmp_dir, directory)
+    except OSError:
+        # 其他进程同时写好了同一份目录
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def map_arrays(directory, extra_columns=None):
+    """
+    只读内存映射派生数组目录，返回紧凑用户表；数值列是映射文件的零拷贝视图
+    extra_columns: 需要的维度列，默认全部；基础列（注册日、时间差、注册周、用户ID）总是包含
+    """
+    meta = _read_store_meta(directory)
+    if meta is None:
+        raise FileNotFoundError(f"派生数组目录不存在或不完整: {directory}")
+    stored_extra = set(meta['extra_columns'])
+    wanted = None if extra_columns is None else set(extra_columns)
+    data = {}
+    for entry in meta['columns']:
+        name = entry['name']
+        if wanted is not None and name in stored_extra and name not in wanted:
+            continue
+        # 空数组无法映射；映射转为普通 ndarray 视图，切片等运算不再带 memmap 子类
+        values = np.asarray(np.load(os.path.join(directory, entry['file']), mmap_mode='r' if meta['rows'] else None,
+                                    allow_pickle=False))
+        if entry['encoded']:
+            labels = _decode_labels(np.load(os.path.join(directory, entry['labels']), allow_pickle=False),
+                                    np.load(os.path.join(directory, entry['kinds']), allow_pickle=False))
+            # 编码 -1（空值）取到追加在末尾的 NaN
+            values = np.append(labels, np.nan)[values]
+        data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def mapped_file(values):
+    """
+    values 为派生数组文件映射（或其连续切片）时返回 (文件路径, 数据在文件中的字节偏移)，否则返回 None
+    """
+    if not values.flags['C_CONTIGUOUS']:
+        return None
+    base = values
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap) and isinstance(base.base, mmap.mmap):
+            offset = base.offset + values.__array_interface__['data'][0] - base.__array_interface__['data'][0]
+            return base.filename, offset
+        base = base.base
+    return None
+
+
+def _remove_stale_stores(cache_dir, file_name, keep_dir):
+    prefix = file_name + '.'
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and name.endswith('.arrays') and path != keep_dir:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_compact_table(file_path, extra_columns=(), use_cache=True):
+    """
+    读取用户导出文件的紧凑用户表，等价于 compact_user_table(load_user_data(file_path), extra_columns=...)
+
+    首次读取时把紧凑用户表写入派生数组目录（源文件同级的 .cache 目录，目录名包含源文件内容哈希），
+    之后直接内存映射；请求的维度列不在已保存的目录中时，连同已保存的维度列一起重新生成。
+    源文件内容变化后生成新目录并清理旧目录。use_cache=False 时不读写任何缓存
+    """
+    extra_columns = list(extra_columns)
+    if not use_cache:
+        return compact_user_table(load_user_data(file_path, use_cache=False), extra_columns=extra_columns)
+
+    directory = array_store_path(file_path, source_digest(file_path))
+    meta = _read_store_meta(directory)
+    if meta is not None and set(extra_columns) <= set(meta['extra_columns']):
+        with stage('映射派生数组', rows=meta['rows']):
+            return map_arrays(directory, extra_columns)
+
+    stored = meta['extra_columns'] if meta is not None else []
+    extras = stored + [column for column in extra_columns if column not in stored]
+    compact = compact_user_table(load_user_data(file_path), extra_columns=extras)
+    with stage('写入派生数组', rows=len(compact)):
+        write_arrays(compact, directory, extras)
+    _remove_stale_stores(source_cache_dir(file_path), os.path.basename(file_path), directory)
+    # 本进程也改用映射，与之后的读者共享页缓存
+    return map_arrays(directory, extra_columns)
@@ -0,0 +1,224 @@
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from calculate_conversion_rates import report_conversion_rates
+from cohort_engine import build_conversion_table
+from compact_schema import compact_user_table
+from data_loader import load_user_data
+from generate_conversion_trend_data import TREND_HORIZONS, write_conversion_trend_data
+from generate_pay_time_charts import pay_time_counts, write_pay_time_data
+from retention import retention_partials
+from retention_analysis import report_retention
+from synthetic_data import write_user_export
+
+# 默认基准规模（行数）
+DEFAULT_SIZES = [10000, 1000000, 10000000]
+# 基准结果默认保存目录，文件名为 {时间}_{提交}.json
+RESULTS_DIR = 'benchmark_results'
+# 对比时耗时增长超过该比例视为性能回退
+REGRESSION_THRESHOLD = 1.2
+
+# 各分析的聚合和写出阶段：分析名 -> (聚合函数(紧凑表), 写出函数(聚合结果, 输出目录))
+ANALYSES = {
+    'calculate_conversion_rates': (
+        build_conversion_table,
+        lambda results_df, out_dir: report_conversion_rates(
+            results_df, os.path.join(out_dir, 'conversion_rates_detailed.xlsx')),
+    ),
+    'analyze_retention': (
+        retention_partials,
+        lambda partials, out_dir: report_retention(partials, os.path.join(out_dir, '付费用户留存分析.xlsx')),
+    ),
+    'generate_pay_time_data': (
+        pay_time_counts,
+        lambda counts, out_dir: write_pay_time_data(*counts, os.path.join(out_dir, 'pay_time_data.json')),
+    ),
+    'generate_conversion_trend_data': (
+        lambda compact: build_conversion_table(compact, TREND_HORIZONS),
+        lambda results_df, out_dir: write_conversion_trend_data(
+            results_df, os.path.join(out_dir, 'conversion_trend_data.json')),
+    ),
+}
+
+
+def parse_size(text):
+    """
+    解析行数，支持 10k、1M 这样的写法
+    """
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+def measure_stage(func, rows, trace_memory=True):
+    """
+    运行一个阶段并记录耗时、吞吐和峰值内存（tracemalloc 统计的Python/NumPy分配峰值）
+    tracemalloc 会明显拖慢分配密集的阶段，因此计时在不跟踪内存的一次运行中完成，
+    trace_memory 时再单独运行一次只统计峰值内存（不记录时为 None）
+    阶段内的打印输出被丢弃，返回 (计时那次运行的返回值, 记录)
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return result, {
+        'seconds': round(seconds, 4),
+        'rows': rows,
+        'rows_per_second': round(rows / seconds) if seconds > 0 else None,
+        'peak_memory_mb': round(peak / 2 ** 20, 2) if peak is not None else None,
+    }
+
+
+def _print_stage(label, record):
+    memory = record['peak_memory_mb']
+    memory_text = f"{memory:>12.1f}MB" if memory is not None else f"{'-':>14}"
+    print(f"{label:<40}{record['seconds']:>10.3f}s{memory_text}")
+
+
+def run_size(n_rows, work_dir, seed=0, trace_memory=True):
+    """
+    对一个数据规模跑完整基准：生成合成导出 -> 读取 -> 转换紧凑表 -> 各分析聚合与写出
+    trace_memory 为 False 时不额外运行各阶段统计峰值内存
+    """
+    source_path = os.path.join(work_dir, f'synthetic_{n_rows}.csv')
+    out_dir = os.path.join(work_dir, f'output_{n_rows}')
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"\n=== {n_rows} 行 ===")
+    print("正在生成合成数据...")
+    write_user_export(n_rows, source_path, seed)
+
+    record = {'rows': n_rows, 'stages': {}, 'analyses': {}}
+    df, record['stages']['load'] = measure_stage(functools.partial(load_user_data, source_path, use_cache=False),
+                                                 n_rows, trace_memory)
+    compact, record['stages']['derive'] = measure_stage(functools.partial(compact_user_table, df), n_rows,
+                                                        trace_memory)
+    del df
+    for name, (aggregate, write) in ANALYSES.items():
+        aggregated, aggregate_record = measure_stage(functools.partial(aggregate, compact), n_rows, trace_memory)
+        _, write_record = measure_stage(functools.partial(write, aggregated, out_dir), n_rows, trace_memory)
+        record['analyses'][name] = {'aggregate': aggregate_record, 'write': write_record}
+
+    for stage, stage_record in record['stages'].items():
+        _print_stage(stage, stage_record)
+    for name, stages in record['analyses'].items():
+        for stage, stage_record in stages.items():
+            _print_stage(f'{name}.{stage}', stage_record)
+    return record
+
+
+def git_commit():
+    """
+    当前代码的提交号，不在git仓库中时返回 None
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=None, output_path=None, work_dir=None, seed=0, trace_memory=True):
+    """
+    按给定规模运行基准并把结果保存为JSON，返回结果
+    work_dir 存放合成数据和输出，默认使用临时目录并在结束后删除
+    trace_memory 为 False 时跳过各阶段的峰值内存统计（省去每个阶段的第二次运行）
+    """
+    sizes = sizes or DEFAULT_SIZES
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sizes': [],
+    }
+
+    with contextlib.ExitStack() as stack:
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='benchmark_'))
+        for n_rows in sizes:
+            results['sizes'].append(run_size(n_rows, work_dir, seed, trace_memory))
+
+    # ru_maxrss 在Linux上单位是KB，在macOS上是字节
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results['peak_rss_mb'] = round(max_rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 2)
+
+    if output_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_path = os.path.join(RESULTS_DIR, f"{stamp}_{commit or 'nogit'}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n基准结果已保存到: {output_path}（进程峰值RSS {results['peak_rss_mb']}MB）")
+    return results
+
+
+def _flatten(results):
+    flat = {}
+    for size in results['sizes']:
+        for stage, record in size['stages'].items():
+            flat[(size['rows'], stage)] = record
+        for name, stages in size['analyses'].items():
+            for stage, record in stages.items():
+                flat[(size['rows'], f'{name}.{stage}')] = record
+    return flat
+
+
+def compare_benchmarks(old_path, new_path, threshold=REGRESSION_THRESHOLD):
+    """
+    对比两次基准结果，打印各阶段耗时变化，返回耗时增长超过 threshold 倍的阶段列表
+    """
+    with open(old_path, encoding='utf-8') as f:
+        old = _flatten(json.load(f))
+    with open(new_path, encoding='utf-8') as f:
+        new = _flatten(json.load(f))
+
+    regressions = []
+    print(f"{'规模':>10}  {'阶段':<40}{'旧(s)':>10}{'新(s)':>10}{'倍数':>8}")
+    for key in sorted(set(old) & set(new)):
+        old_seconds, new_seconds = old[key]['seconds'], new[key]['seconds']
+        ratio = new_seconds / old_seconds if old_seconds > 0 else float('inf')
+        flag = '  变慢' if ratio > threshold else ''
+        print(f"{key[0]:>10}  {key[1]:<40}{old_seconds:>10.3f}{new_seconds:>10.3f}{ratio:>8.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == "__main__":
+    # python benchmark.py                         默认规模 10k、1M、10M
+    # python benchmark.py --sizes=10k,1M          指定规模
+    # python benchmark.py --output=result.json    指定结果文件
+    # python benchmark.py --skip-memory         只计时，不额外运行统计峰值内存
+    # python benchmark.py --compare old.json new.json
+    args = sys.argv[1:]
+    if args and args[0] == '--compare':
+        sys.exit(1 if compare_benchmarks(args[1], args[2]) else 0)
+    options = dict(arg[2:].split('=', 1) for arg in args if arg.startswith('--') and '=' in arg)
+    sizes = [parse_size(size) for size in options['sizes'].split(',')] if 'sizes' in options else None
+    run_benchmarks(sizes, options.get('output'), options.get('workdir'), trace_memory='--skip-memory' not in args)
@@ -0,0 +1,88 @@
+import json
+from openpyxl.chart import BarChart, LineChart
+
+# 图表输出方式：
+#   image  用matplotlib渲染PNG后嵌入Excel（原有方式）
+#   native 生成openpyxl原生图表，引用表格中的数据，不需要matplotlib
+#   spec   输出图表描述JSON，由前端渲染
+CHART_MODES = ('image', 'native', 'spec')
+DEFAULT_CHART_MODE = 'image'
+
+# matplotlib 中文字体
+CHINESE_FONTS = ['SimHei', 'Microsoft YaHei']
+
+
+def check_chart_mode(chart_mode):
+    if chart_mode not in CHART_MODES:
+        raise ValueError(f"不支持的图表模式: {chart_mode}，可选: {', '.join(CHART_MODES)}")
+    return chart_mode
+
+
+def chart_spec(chart_type, title, x_title, y_title, categories, series):
+    """
+    与渲染方式无关的图表描述
+    chart_type: line / bar
+    series: [{'name': 系列名, 'values': 数值列表, 'color': 可选颜色}]，缺失值为 None
+    """
+    return {
+        'type': chart_type,
+        'title': title,
+        'x_title': x_title,
+        'y_title': y_title,
+        'categories': list(categories),
+        'series': series,
+    }
+
+
+def write_chart_spec(spec, output_path):
+    """
+    把图表描述写成JSON，供前端直接渲染
+    """
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, ensure_ascii=False, indent=2)
+    return output_path
+
+
+def native_chart(spec, width=None, height=None):
+    """
+    按图表描述生成未绑定数据的openpyxl原生图表，数据由 excel_report.report_sheet 按列引用
+    """
+    chart = LineChart() if spec['type'] == 'line' else BarChart()
+    chart.title = spec['title']
+    chart.x_axis.title = spec['x_title']
+    chart.y_axis.title = spec['y_title']
+    if width:
+        chart.width = width
+    if height:
+        chart.height = height
+    return chart
+
+
+def render_png(spec, output_path, figsize=(12, 6)):
+    """
+    用matplotlib把图表描述渲染为PNG；matplotlib在这里才导入，其他模式不需要安装或加载它
+    折线图带圆点标记、图例和网格；柱状图的横轴标签旋转45度
+    """
+    import matplotlib
+    matplotlib.rcParams['font.sans-serif'] = CHINESE_FONTS
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=figsize)
+    for series in spec['series']:
+        if spec['type'] == 'line':
+            plt.plot(spec['categories'], series['values'], marker='o', label=series['name'])
+        else:
+            plt.bar(spec['categories'], series['values'], color=series.get('color'))
+    plt.title(spec['title'])
+    plt.xlabel(spec['x_title'])
+    plt.ylabel(spec['y_title'])
+    if spec['type'] == 'line':
+        plt.legend()
+        plt.grid(True, linestyle='--', alpha=0.5)
+    else:
+        plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig(output_path)
+    plt.close()
+    return output_path
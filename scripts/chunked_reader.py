@@ -0,0 +1,57 @@
+import pandas as pd
+from data_loader import parse_datetime_columns
+from profiling import stage
+
+# 默认每块行数，峰值内存约为 分块行数 × 每行大小 + 聚合结果大小
+DEFAULT_CHUNK_SIZE = 200000
+
+
+def iter_user_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    按固定行数分块读取用户导出，每块的时间列已解析为datetime64
+    .csv 使用 read_csv 分块读取；.xlsx 使用openpyxl只读模式逐行读取，不会整表载入内存
+    """
+    if file_path.lower().endswith('.csv'):
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+            yield parse_datetime_columns(chunk)
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = list(header)
+        buffer = []
+        for row in rows:
+            # 跳过只读模式下可能出现的空行
+            if all(value is None for value in row):
+                continue
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield parse_datetime_columns(pd.DataFrame(buffer, columns=columns))
+                buffer = []
+        if buffer:
+            yield parse_datetime_columns(pd.DataFrame(buffer, columns=columns))
+    finally:
+        workbook.close()
+
+
+def fold_user_chunks(file_path, partial, merge, chunk_size=DEFAULT_CHUNK_SIZE, empty=None):
+    """
+    对每个分块计算部分聚合 partial(chunk)，再用 merge(累计结果, 本块结果) 逐块合并
+    内存占用只与分块大小和聚合结果大小有关，与文件总行数无关
+    文件为空或只有表头时返回 empty（调用方传入与部分聚合同形状的空结果）
+    """
+    result = None
+    with stage('分块读取并聚合') as record:
+        record['rows'] = 0
+        record['chunks'] = 0
+        for chunk in iter_user_chunks(file_path, chunk_size):
+            part = partial(chunk)
+            result = part if result is None else merge(result, part)
+            record['rows'] += len(chunk)
+            record['chunks'] += 1
+    return empty if result is None else result
@@ -0,0 +1,294 @@
+# 数据看板分析统一命令行入口
+#
+#     python cli.py --help
+#     python cli.py pipeline --incremental --workers=8
+#     python cli.py conversion-trend --input ../data/3月以来的付费用户情况.xlsx --output ../public/conversion_trend_data.json
+#     python cli.py conversion-rates --input ../data/Result_10.xlsx --charts native
+#     python cli.py store-ingest ../data/3月以来的付费用户情况.xlsx ../data/Result_10.xlsx
+#     python cli.py pipeline --store ../data/.cache/events.sqlite --weeks 8
+#
+# 本模块只在顶层导入标准库；pandas、openpyxl、matplotlib 等在执行对应子命令时才导入，
+# 因此 --help 和只输出JSON的子命令启动很快
+import argparse
+import sys
+
+# 与 charts.CHART_MODES 一致，这里单独列出以免 --help 时导入openpyxl
+CHART_MODE_CHOICES = ['image', 'native', 'spec']
+PERIOD_FREQ_CHOICES = ['weekly', 'biweekly', 'monthly']
+
+
+def _period_spec(args):
+    # 只返回命令行中给出的周期配置项，其余沿用 periods.DEFAULT_PERIOD_SPEC
+    spec = {'freq': args.period_freq, 'count': args.period_count, 'anchor': args.period_anchor}
+    spec = {key: value for key, value in spec.items() if value is not None}
+    return spec or None
+
+
+def run_pipeline_command(args):
+    from pipeline import run_pipeline
+    # run_pipeline 自己管理阶段耗时记录
+    return run_pipeline(args.data_dir, args.public_dir, args.report_dir, args.artifacts or None,
+                        args.incremental, _period_spec(args), args.workers, args.profile, args.trace_memory,
+                        args.timings_dir, args.charts, store_path=args.store, start=args.since, weeks=args.weeks)
+
+
+def run_store_ingest(args):
+    from event_store import ingest_user_export, list_sources, open_store
+    conn = open_store(args.store)
+    try:
+        for path in args.inputs:
+            ingest_user_export(conn, path, chunk_size=args.chunk_size, force=args.force)
+        print(list_sources(conn).to_string(index=False))
+    finally:
+        conn.close()
+
+
+def run_watch(args):
+    from watch import watch
+    return watch(args.data_dir, args.public_dir, args.report_dir, args.artifacts or None, args.interval, args.debounce,
+                 incremental=args.incremental, period_spec=_period_spec(args), workers=args.workers,
+                 profile=args.profile, trace_memory=args.trace_memory, timings_dir=args.timings_dir,
+                 chart_mode=args.charts)
+
+
+def run_merge_exports(args):
+    from merge_exports import merge_user_exports
+    rules = dict(item.split('=', 1) for item in args.rule or [])
+    return merge_user_exports(args.inputs, args.output, rules)
+
+
+def run_survival(args):
+    from survival_analysis import analyze_survival
+    return analyze_survival(args.input, args.output, args.grain, args.observed_until)
+
+
+def run_serve(args):
+    from query_service import serve
+    return serve(args.data_dir, args.host, args.port, int(args.cache_mb * 2 ** 20), args.ttl)
+
+
+def run_conversion_trend(args):
+    from generate_conversion_trend_data import generate_conversion_trend_data
+    return generate_conversion_trend_data(args.input, args.output, args.state, args.chunk_size, _period_spec(args))
+
+
+def run_conversion_rates(args):
+    from calculate_conversion_rates import calculate_conversion_rates
+    return calculate_conversion_rates(args.input, args.output, args.state, args.chunk_size, _period_spec(args),
+                                      args.charts)
+
+
+def run_pay_time(args):
+    from generate_pay_time_charts import generate_pay_time_data
+    return generate_pay_time_data(args.input, args.output, args.chunk_size)
+
+
+def run_retention(args):
+    from retention_analysis import analyze_retention
+    if args.thresholds:
+        return analyze_retention(args.input, args.output, args.chunk_size,
+                                 [int(days) for days in args.thresholds.split(',')])
+    return analyze_retention(args.input, args.output, args.chunk_size)
+
+
+def run_login_retention(args):
+    from login_retention import analyze_login_retention
+    return analyze_login_retention(args.users, args.events, args.output, args.horizon, args.chunk_size)
+
+
+def run_cube_build(args):
+    from cohort_cube import DEFAULT_DIMENSIONS, build_cube_from_file
+    dimensions = dict(item.split('=', 1) for item in args.dimensions.split(',')) if args.dimensions else DEFAULT_DIMENSIONS
+    cube = build_cube_from_file(args.input, dimensions, output_path=args.output)
+    print(f"立方体已保存到: {args.output}（{cube['storage']}，形状 {cube['shape']}，维度 {cube['dimensions']}）")
+    return cube
+
+
+def run_cube_query(args):
+    from cohort_cube import cube_query, load_cube
+    filters = {}
+    for item in args.filter or []:
+        name, values = item.split('=', 1)
+        filters[name] = values.split(',')
+    result = cube_query(load_cube(args.cube), [name for name in args.group_by.split(',') if name], filters,
+                        (args.start, args.end))
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"查询结果已保存到: {args.output}（{len(result)} 行）")
+    else:
+        print(result.to_string(index=False))
+    return result
+
+
+def run_pay_time_analysis(args):
+    from calculate_pay_time_analysis import analyze_pay_time
+    return analyze_pay_time(args.input, args.output)
+
+
+def run_pay_time_distribution(args):
+    from pay_time_distribution_analysis import analyze_pay_time_distribution
+    return analyze_pay_time_distribution(args.input, args.output, args.charts)
+
+
+def run_benchmark(args):
+    from benchmark import compare_benchmarks, parse_size, run_benchmarks
+    if args.compare:
+        # 发现性能回退时返回非零退出码，便于在CI中使用
+        sys.exit(1 if compare_benchmarks(*args.compare) else 0)
+    sizes = [parse_size(size) for size in args.sizes.split(',')] if args.sizes else None
+    return run_benchmarks(sizes, args.output, args.workdir, trace_memory=not args.skip_memory)
+
+
+def _add_period_options(parser):
+    parser.add_argument('--period-freq', choices=PERIOD_FREQ_CHOICES, help='分时间段中位数的周期，默认 weekly')
+    parser.add_argument('--period-count', type=int, help='只取最近N个完整周期，默认 11')
+    parser.add_argument('--period-anchor', help='周期对齐的日期，如 2025-01-06；默认周一/每月1日')
+
+
+def _add_io_options(parser, default_input, default_output, chunked=True):
+    parser.add_argument('--input', default=default_input, help=f'用户导出文件（.xlsx/.csv），默认 {default_input}')
+    parser.add_argument('--output', default=default_output, help=f'输出文件，默认 {default_output}')
+    if chunked:
+        parser.add_argument('--chunk-size', type=int, help='分块流式读取的每块行数，不指定时整表读取')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description='数据看板分析命令行工具')
+    parser.add_argument('--profile', action='store_true', help='用 cProfile 采集整次运行并保存 .prof 文件')
+    parser.add_argument('--trace-memory', action='store_true', help='用 tracemalloc 记录各阶段内存分配峰值')
+    parser.add_argument('--timings-dir', default='timings', help='阶段耗时文件保存目录，默认 timings')
+    subparsers = parser.add_subparsers(dest='command', metavar='<子命令>')
+    subparsers.required = True
+
+    pipeline = subparsers.add_parser('pipeline', help='一次运行生成全部看板产物')
+    pipeline.add_argument('artifacts', nargs='*',
+                          help='只生成指定产物：conversion_trend pay_time retention conversion_rates survival')
+    pipeline.add_argument('--data-dir', default='../data', help='输入文件目录，默认 ../data')
+    pipeline.add_argument('--public-dir', default='../public', help='网页数据输出目录，默认 ../public')
+    pipeline.add_argument('--report-dir', default='.', help='Excel报告输出目录，默认当前目录')
+    pipeline.add_argument('--incremental', action='store_true', help='转化队列使用增量状态，只重算受影响的注册日')
+    pipeline.add_argument('--workers', type=int, help='按注册日期分片并行计算的进程数')
+    pipeline.add_argument('--charts', choices=CHART_MODE_CHOICES, help='报告图表输出方式，默认 image')
+    pipeline.add_argument('--store', help='从事件库读取（先用 store-ingest 入库），如 ../data/.cache/events.sqlite')
+    pipeline.add_argument('--since', help='配合 --store：只读取该日期及以后注册的用户')
+    pipeline.add_argument('--weeks', type=int, help='配合 --store：只读取最近N个自然周注册的用户')
+    _add_period_options(pipeline)
+    pipeline.set_defaults(handler=run_pipeline_command, run_name=None)
+
+    store_ingest = subparsers.add_parser('store-ingest', help='把用户导出分批写入事件库（SQLite，按注册/付费时间和用户ID建索引）')
+    store_ingest.add_argument('inputs', nargs='+', help='用户导出文件（.xlsx/.csv），以文件名作为来源名')
+    store_ingest.add_argument('--store', default='../data/.cache/events.sqlite', help='事件库路径')
+    store_ingest.add_argument('--chunk-size', type=int, default=200000, help='每次读取的行数，默认 200000')
+    store_ingest.add_argument('--force', action='store_true', help='文件未变化时也重新入库')
+    store_ingest.set_defaults(handler=run_store_ingest, run_name='store_ingest')
+
+    watch = subparsers.add_parser('watch', help='监视输入目录，文件变化后只重新生成依赖它的产物')
+    watch.add_argument('artifacts', nargs='*', help='只监视指定产物，默认全部')
+    watch.add_argument('--data-dir', default='../data', help='监视的输入文件目录，默认 ../data')
+    watch.add_argument('--public-dir', default='../public', help='网页数据输出目录，默认 ../public')
+    watch.add_argument('--report-dir', default='.', help='Excel报告输出目录，默认当前目录')
+    watch.add_argument('--interval', type=float, default=1.0, help='轮询间隔（秒），默认 1')
+    watch.add_argument('--debounce', type=float, default=2.0, help='文件稳定多少秒后才处理，默认 2')
+    watch.add_argument('--incremental', action='store_true', help='转化队列使用增量状态')
+    watch.add_argument('--workers', type=int, help='按注册日期分片并行计算的进程数')
+    watch.add_argument('--charts', choices=CHART_MODE_CHOICES, help='报告图表输出方式，默认 image')
+    _add_period_options(watch)
+    watch.set_defaults(handler=run_watch, run_name=None)
+
+    merge = subparsers.add_parser('merge-exports', help='合并多份有重叠用户的导出并按用户ID去重')
+    merge.add_argument('inputs', nargs='+', help='用户导出文件（.xlsx/.csv），按从旧到新的顺序给出')
+    merge.add_argument('--output', default='../data/合并用户表.csv', help='合并结果路径（.csv/.xlsx）')
+    merge.add_argument('--rule', action='append',
+                       help='列的合并规则 列名=last/first/min/max，可重复；默认首次付费时间取min、最后登录时间取max，其余取last')
+    merge.set_defaults(handler=run_merge_exports, run_name='merge_exports')
+
+    survival = subparsers.add_parser('survival', help='按注册队列计算注册到首次付费的KM生存分析（未付费用户右删失）')
+    _add_io_options(survival, '../data/Result_10.xlsx', '付费生存分析.xlsx')
+    survival.add_argument('--grain', choices=['date', 'week', 'month'], default='week', help='队列粒度，默认 week')
+    survival.add_argument('--observed-until', help='观察截止时间（导出时间），默认取数据中最晚的事件时间')
+    survival.set_defaults(handler=run_survival, run_name='analyze_survival')
+
+    serve = subparsers.add_parser('serve', help='启动本地聚合查询服务（/api/conversion、/api/pay-time、/api/retention）')
+    serve.add_argument('--data-dir', default='../data', help='输入文件目录，默认 ../data')
+    serve.add_argument('--host', default='127.0.0.1', help='监听地址，默认 127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765, help='监听端口，默认 8765')
+    serve.add_argument('--cache-mb', type=float, default=64, help='结果缓存内存上限（MB），默认 64')
+    serve.add_argument('--ttl', type=float, default=300, help='缓存结果有效期（秒），默认 300')
+    serve.set_defaults(handler=run_serve, run_name=None)
+
+    trend = subparsers.add_parser('conversion-trend', help='生成D7/D14/D30转化率趋势JSON')
+    _add_io_options(trend, '../data/3月以来的付费用户情况.xlsx', '../public/conversion_trend_data.json')
+    trend.add_argument('--state', help='增量状态文件路径，指定后只重算有变化的注册日')
+    _add_period_options(trend)
+    trend.set_defaults(handler=run_conversion_trend, run_name='generate_conversion_trend_data')
+
+    rates = subparsers.add_parser('conversion-rates', help='计算各转化窗口转化率并生成Excel报告')
+    _add_io_options(rates, '../data/Result_10.xlsx', 'conversion_rates_detailed.xlsx')
+    rates.add_argument('--state', help='增量状态文件路径，指定后只重算有变化的注册日')
+    rates.add_argument('--charts', choices=CHART_MODE_CHOICES, default='image', help='趋势图输出方式，默认 image')
+    _add_period_options(rates)
+    rates.set_defaults(handler=run_conversion_rates, run_name='calculate_conversion_rates')
+
+    pay_time = subparsers.add_parser('pay-time', help='生成付费时长分布JSON')
+    _add_io_options(pay_time, '../data/Result_10.xlsx', '../public/pay_time_data.json')
+    pay_time.set_defaults(handler=run_pay_time, run_name='generate_pay_time_data')
+
+    retention = subparsers.add_parser('retention', help='付费用户留存分析Excel报告')
+    _add_io_options(retention, '../data/3月以来的付费用户情况.xlsx', '付费用户留存分析.xlsx')
+    retention.add_argument('--thresholds', help='留存阈值（天），逗号分隔，如 1,3,7,14,30,60；默认 1,7,30')
+    retention.set_defaults(handler=run_retention, run_name='analyze_retention')
+
+    login = subparsers.add_parser('login-retention', help='由登录事件日志计算按注册周的N日留存和滚动留存矩阵')
+    login.add_argument('--users', default='../data/3月以来的付费用户情况.xlsx', help='用户导出文件（需要用户ID列）')
+    login.add_argument('--events', default='../data/login_events.csv',
+                       help='登录事件日志（.csv/.parquet，列 user_id, timestamp）')
+    login.add_argument('--output', default='登录留存矩阵.xlsx', help='输出Excel，默认 登录留存矩阵.xlsx')
+    login.add_argument('--horizon', type=int, default=90, help='观察注册后多少天，默认 90')
+    login.add_argument('--chunk-size', type=int, default=5000000, help='事件日志每块读取行数，默认 5000000')
+    login.set_defaults(handler=run_login_retention, run_name='analyze_login_retention')
+
+    cube_build = subparsers.add_parser('cube-build', help='构建按注册日×渠道×平台×转化窗口的转化队列立方体')
+    cube_build.add_argument('--input', default='../data/Result_10.xlsx', help='用户导出文件（.xlsx/.csv）')
+    cube_build.add_argument('--output', default='../data/.cache/cohort_cube.npz', help='立方体保存路径')
+    cube_build.add_argument('--dimensions', help='维度名=列名，逗号分隔，如 channel=渠道,platform=平台；默认 渠道/平台/套餐')
+    cube_build.set_defaults(handler=run_cube_build, run_name='build_cohort_cube')
+
+    cube = subparsers.add_parser('cube-query', help='在转化队列立方体上上卷/下钻/过滤查询')
+    cube.add_argument('--cube', default='../data/.cache/cohort_cube.npz', help='立方体文件')
+    cube.add_argument('--group-by', default='date', help='分组维度，逗号分隔，日期可用 date/week/month，如 week,channel')
+    cube.add_argument('--filter', action='append', help='维度过滤，如 --filter channel=搜索,社群，可重复')
+    cube.add_argument('--start', help='注册日期起（含）')
+    cube.add_argument('--end', help='注册日期止（含）')
+    cube.add_argument('--output', help='结果CSV路径，默认打印到终端')
+    cube.set_defaults(handler=run_cube_query, run_name=None)
+
+    pay_time_analysis = subparsers.add_parser('pay-time-analysis', help='付费时长（自然日/小时）分布Excel报告')
+    _add_io_options(pay_time_analysis, '../data/Result_10.xlsx', 'pay_time_analysis.xlsx', chunked=False)
+    pay_time_analysis.set_defaults(handler=run_pay_time_analysis, run_name='calculate_pay_time_analysis')
+
+    distribution = subparsers.add_parser('pay-time-distribution', help='付费时长分布Excel报告（含图表）')
+    _add_io_options(distribution, '../data/Result_10.xlsx', 'pay_time_distribution.xlsx', chunked=False)
+    distribution.add_argument('--charts', choices=CHART_MODE_CHOICES, default='image', help='图表输出方式，默认 image')
+    distribution.set_defaults(handler=run_pay_time_distribution, run_name='pay_time_distribution_analysis')
+
+    benchmark = subparsers.add_parser('benchmark', help='用合成数据运行性能基准')
+    benchmark.add_argument('--sizes', help='数据规模，逗号分隔，如 10k,1M,10M')
+    benchmark.add_argument('--output', help='基准结果JSON路径，默认 benchmark_results/{时间}_{提交}.json')
+    benchmark.add_argument('--workdir', help='合成数据和输出的存放目录，默认临时目录')
+    benchmark.add_argument('--skip-memory', action='store_true', help='只计时，不额外运行各阶段统计峰值内存')
+    benchmark.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='对比两次基准结果')
+    benchmark.set_defaults(handler=run_benchmark, run_name=None)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_name is None:
+        return args.handler(args)
+    from profiling import profile_run
+    with profile_run(args.run_name, args.profile, args.trace_memory, args.timings_dir):
+        return args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from array_store import load_compact_table
+from cohort_engine import DEFAULT_HORIZONS, add_conversion_rates, assign_horizon_bins, sorted_horizon_order
+from compact_schema import days_to_dates, observation_cutoff
+from profiling import stage, timed
+
+# 多维转化队列立方体：注册日 × 各维度（渠道、平台、套餐……）× 转化窗口编号 的人数
+# 窗口编号同 cohort_engine.assign_horizon_bins（按上界升序的最小覆盖窗口，最后一个编号为不在任何窗口内），
+# 查询时沿窗口方向累加得到各窗口的累计付费人数
+# 单元格总数不超过 DENSE_CELL_LIMIT 时用稠密 NumPy 数组保存，否则用稀疏 COO（非零单元格坐标 + 人数）
+# 上卷、下钻、任意维度值过滤都只在立方体上计算，不再回到用户明细
+
+# 源数据中可作为维度的列：维度名 -> 列名（存在哪些列就用哪些）
+DEFAULT_DIMENSIONS = {
+    'channel': '渠道',
+    'platform': '平台',
+    'plan': '套餐',
+}
+# 稠密存储的单元格数上限（int64 约 400MB）
+DENSE_CELL_LIMIT = 50000000
+# 维度值缺失时的标签
+MISSING_LABEL = '未知'
+# 注册日期可上卷的粒度及输出列名（周、月以起始日期表示）
+DATE_GRAINS = {'date': '注册日期', 'week': '注册周', 'month': '注册月'}
+CUBE_VERSION = 2
+
+
+def _encode(values):
+    # 维度值编码为 0..n-1 的整数，标签按字符串排序，缺失值记为 MISSING_LABEL
+    labels = pd.Series(values, dtype=object).where(pd.notna(values), MISSING_LABEL).astype(str)
+    codes, uniques = pd.factorize(labels, sort=True)
+    return codes.astype('i8'), np.asarray(uniques, dtype=str)
+
+
+@timed('构建转化队列立方体')
+def build_cohort_cube(compact, dimensions=None, horizons=DEFAULT_HORIZONS, dense_cell_limit=DENSE_CELL_LIMIT):
+    """
+    由紧凑用户表（含维度列，见 compact_user_table 的 extra_columns）构建立方体
+    dimensions: {维度名: 列名}，默认取 DEFAULT_DIMENSIONS 中在表里存在的列
+    一次 bincount（稠密）或一次 np.unique（稀疏）完成全部计数
+    """
+    if dimensions is None:
+        dimensions = {name: column for name, column in DEFAULT_DIMENSIONS.items() if column in compact.columns}
+    reg_day = compact['reg_day'].to_numpy(dtype='i8')
+    first_day = int(reg_day.min()) if len(reg_day) else 0
+    n_days = int(reg_day.max()) - first_day + 1 if len(reg_day) else 0
+
+    codes = [reg_day - first_day]
+    labels = {}
+    for name, column in dimensions.items():
+        dimension_codes, labels[name] = _encode(compact[column].to_numpy())
+        codes.append(dimension_codes)
+    codes.append(assign_horizon_bins(compact['pay_delta'].to_numpy(), horizons))
+    shape = (n_days,) + tuple(len(labels[name]) for name in dimensions) + (len(horizons) + 1,)
+
+    cube = {
+        'version': CUBE_VERSION,
+        'dimensions': list(dimensions),
+        'columns': dict(dimensions),
+        'labels': labels,
+        'first_day': first_day,
+        'shape': shape,
+        'horizons': [tuple(h) for h in horizons],
+        # 观察截止时间（最晚事件时间），查询时判断转化率是否成熟，与报告和生存分析同一口径
+        'observed_until': observation_cutoff(compact),
+    }
+    size = int(np.prod(shape))
+    flat = np.ravel_multi_index(codes, shape) if len(reg_day) else np.zeros(0, dtype='i8')
+    if size <= dense_cell_limit:
+        cube['storage'] = 'dense'
+        cube['counts'] = np.bincount(flat, minlength=size).reshape(shape)
+    else:
+        cube['storage'] = 'sparse'
+        cells, counts = np.unique(flat, return_counts=True)
+        cube['coords'] = np.stack(np.unravel_index(cells, shape), axis=1)
+        cube['values'] = counts.astype('i8')
+    return cube
+
+
+def _axis(cube, name):
+    if name == 'date':
+        return 0
+    if name not in cube['dimensions']:
+        raise ValueError(f"立方体没有维度: {name}，可选: {', '.join(('date',) + tuple(cube['dimensions']))}")
+    return cube['dimensions'].index(name) + 1
+
+
+def _filter_codes(cube, name, values):
+    # 过滤条件（单个值或值列表）换算为维度编码；不存在的值被忽略
+    values = [values] if isinstance(values, (str, int, float)) else list(values)
+    labels = cube['labels'][name]
+    return np.flatnonzero(np.isin(labels, [str(value) for value in values]))
+
+
+def grain_start_days(days, grain):
+    """
+    注册日（1970-01-01起的天数数组）按粒度上卷为所在日/周（周一）/月（1日）的起始日
+    """
+    days = np.asarray(days, dtype='i8')
+    if grain == 'date':
+        return days
+    if grain == 'week':
+        return (days + 3) // 7 * 7 - 3
+    if grain == 'month':
+        months = days.astype('datetime64[D]').astype('datetime64[M]')
+        return months.astype('datetime64[D]').astype('i8')
+    raise ValueError(f"不支持的日期粒度: {grain}，可选: {', '.join(DATE_GRAINS)}")
+
+
+def _date_codes(cube, grain):
+    # 注册日编号 -> 粒度编号，以及每个粒度编号对应的起始日（天数）
+    days = cube['first_day'] + np.arange(cube['shape'][0])
+    starts, codes = np.unique(grain_start_days(days, grain), return_inverse=True)
+    return codes, starts
+
+
+def cube_query(cube, group_by=('date',), filters=None, date_range=None):
+    """
+    在立方体上查询：按 group_by 中的维度分组（其余维度上卷求和），filters 过滤维度值
+    group_by: 维度名，注册日期可用 date / week / month 三种粒度之一
+    filters: {维度名: 值或值列表}
+    date_range: (起始日期, 结束日期)，含端点，任一端可为 None
+    返回列：各分组维度, 注册人数, {前缀}付费人数..., {前缀}转化率...；只包含有注册用户的组合
+    """
+    filters = filters or {}
+    grain = next((name for name in group_by if name in DATE_GRAINS), None)
+    group_dims = [name for name in group_by if name not in DATE_GRAINS]
+    group_axes = [_axis(cube, name) for name in group_dims]
+    n_axes = len(cube['shape'])
+
+    # 日期范围换算为注册日编号的上下界
+    day_low, day_high = 0, cube['shape'][0] - 1
+    if date_range is not None:
+        start, end = date_range
+        if start is not None:
+            day_low = max(day_low, int(np.datetime64(pd.Timestamp(start).date(), 'D').astype('i8')) - cube['first_day'])
+        if end is not None:
+            day_high = min(day_high, int(np.datetime64(pd.Timestamp(end).date(), 'D').astype('i8')) - cube['first_day'])
+    filter_codes = {_axis(cube, name): _filter_codes(cube, name, values) for name, values in filters.items()}
+    date_codes, date_starts = _date_codes(cube, grain or 'date')
+
+    # 输出维度：日期（可选）、分组维度、窗口编号
+    out_axes = ([0] if grain else []) + group_axes
+    out_sizes = [len(date_starts) if axis == 0 else cube['shape'][axis] for axis in out_axes]
+    n_bins = cube['shape'][-1]
+
+    if cube['storage'] == 'dense':
+        counts = cube['counts'][day_low:day_high + 1]
+        for axis, selected in filter_codes.items():
+            counts = np.take(counts, selected, axis=axis)
+        counts = counts.sum(axis=tuple(axis for axis in range(1, n_axes - 1) if axis not in group_axes))
+        if grain:
+            keys = date_codes[day_low:day_high + 1]
+            boundaries = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype='i8')
+            reduced = np.add.reduceat(counts, boundaries, axis=0) if len(keys) else counts
+            full = np.zeros((len(date_starts),) + reduced.shape[1:], dtype='i8')
+            full[keys[boundaries]] = reduced
+            counts = full
+        else:
+            counts = counts.sum(axis=0)
+        # 保留维度按原轴顺序排列，调整为 group_by 中给定的顺序
+        kept = ([0] if grain else []) + sorted(group_axes)
+        counts = np.moveaxis(counts, [kept.index(axis) for axis in out_axes], range(len(out_axes)))
+        hist = counts.reshape(-1, n_bins)
+        group_codes = np.unravel_index(np.arange(len(hist)), out_sizes) if out_axes else ()
+    else:
+        coords, values = cube['coords'], cube['values']
+        mask = (coords[:, 0] >= day_low) & (coords[:, 0] <= day_high)
+        for axis, selected in filter_codes.items():
+            mask &= np.isin(coords[:, axis], selected)
+        coords, values = coords[mask], values[mask]
+        columns = [date_codes[coords[:, 0]] if axis == 0 else coords[:, axis] for axis in out_axes]
+        group_key = np.ravel_multi_index(columns, out_sizes) if out_axes else np.zeros(len(values), dtype='i8')
+        groups, inverse = np.unique(group_key, return_inverse=True)
+        hist = np.bincount(inverse * n_bins + coords[:, -1], weights=values,
+                           minlength=len(groups) * n_bins).astype('i8').reshape(len(groups), n_bins)
+        group_codes = np.unravel_index(groups, out_sizes) if out_axes else ()
+        if not out_axes and len(hist) == 0:
+            hist = np.zeros((1, n_bins), dtype='i8')
+
+    reg_counts = hist.sum(axis=1)
+    present = reg_counts > 0 if out_axes else np.ones(len(hist), dtype=bool)
+    result = pd.DataFrame()
+    for axis, codes in zip(out_axes, group_codes):
+        codes = np.asarray(codes)[present]
+        if axis == 0:
+            result[DATE_GRAINS[grain]] = days_to_dates(date_starts[codes])
+        else:
+            result[cube['dimensions'][axis - 1]] = cube['labels'][cube['dimensions'][axis - 1]][codes]
+    result['注册人数'] = reg_counts[present]
+
+    horizons = cube['horizons']
+    order, _ = sorted_horizon_order(horizons)
+    cumulative = hist[present][:, :len(horizons)].cumsum(axis=1)
+    for position, h in enumerate(order):
+        result[f'{horizons[h][0]}付费人数'] = cumulative[:, position]
+    paid_columns = [f'{prefix}付费人数' for prefix, _, _ in horizons]
+    result = result[[column for column in result.columns if column not in paid_columns] + paid_columns]
+    return add_conversion_rates(result, horizons)
+
+
+def save_cube(cube, path):
+    """
+    保存立方体为 .npz（数组）+ 元数据JSON，先写临时文件再重命名
+    """
+    meta = {key: cube[key] for key in ('version', 'dimensions', 'columns', 'first_day', 'shape', 'horizons', 'storage',
+                                       'observed_until')}
+    arrays = {f'labels_{i}': cube['labels'][name] for i, name in enumerate(cube['dimensions'])}
+    if cube['storage'] == 'dense':
+        arrays['counts'] = cube['counts']
+    else:
+        arrays['coords'] = cube['coords']
+        arrays['values'] = cube['values']
+    arrays['meta'] = np.array(json.dumps(meta, ensure_ascii=False))
+    tmp_path = path + '.tmp.npz'
+    with stage('保存立方体'):
+        np.savez_compressed(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+    return path
+
+
+def load_cube(path):
+    """
+    读取 save_cube 保存的立方体；版本不符时抛出 ValueError
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['version'] != CUBE_VERSION:
+            raise ValueError(f"立方体文件版本不符: {meta['version']}")
+        cube = dict(meta)
+        cube['shape'] = tuple(meta['shape'])
+        cube['horizons'] = [tuple(h) for h in meta['horizons']]
+        cube['labels'] = {name: data[f'labels_{i}'] for i, name in enumerate(meta['dimensions'])}
+        if meta['storage'] == 'dense':
+            cube['counts'] = data['counts']
+        else:
+            cube['coords'] = data['coords']
+            cube['values'] = data['values']
+    return cube
+
+
+def build_cube_from_file(file_path, dimensions=None, horizons=DEFAULT_HORIZONS, output_path=None):
+    """
+    读取用户导出并构建立方体；指定 output_path 时保存到磁盘
+    """
+    dimensions = dimensions or DEFAULT_DIMENSIONS
+    compact = load_compact_table(file_path, extra_columns=list(dimensions.values()))
+    cube = build_cohort_cube(compact, {name: column for name, column in dimensions.items() if column in compact.columns},
+                             horizons)
+    if output_path:
+        save_cube(cube, output_path)
+    return cube
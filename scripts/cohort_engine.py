@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from compact_schema import SECONDS_PER_DAY, SECONDS_PER_HOUR, compact_user_table, days_to_dates, ensure_compact
+from profiling import timed
+
+# 转化窗口定义：(列名前缀, 数值, 单位)
+# 小时窗口口径：0 <= 注册到付费小时数 <= N
+# 天窗口口径：0 <= 注册到付费天数(向下取整) <= N
+DEFAULT_HORIZONS = [
+    ('D12h', 12, 'h'),
+    ('D24h', 24, 'h'),
+    ('D7', 7, 'd'),
+    ('D14', 14, 'd'),
+    ('D30', 30, 'd'),
+    ('D90', 90, 'd'),
+]
+
+def horizon_upper_bound(value, unit):
+    """
+    将转化窗口换算为注册到付费时长（秒）的开区间上界
+    小时窗口是闭区间，所以上界 +1秒；天窗口按整天数向下取整，所以上界是 N+1 天
+    """
+    if unit == 'h':
+        return value * SECONDS_PER_HOUR + 1
+    if unit == 'd':
+        return (value + 1) * SECONDS_PER_DAY
+    raise ValueError(f"不支持的转化窗口单位: {unit}")
+
+
+def sorted_horizon_order(horizons):
+    """
+    返回按上界升序排列的窗口下标，以及排序后的上界数组
+    """
+    bounds = np.array([horizon_upper_bound(value, unit) for _, value, unit in horizons], dtype='i8')
+    order = np.argsort(bounds, kind='stable')
+    return order, bounds[order]
+
+
+def assign_horizon_bins(pay_delta, horizons=DEFAULT_HORIZONS):
+    """
+    把每个用户分到能覆盖其付费时长的最小窗口（按上界升序编号）
+    pay_delta: 紧凑用户表的注册到付费秒数
+    未付费、付费时间早于注册时间或超出所有窗口的用户编号为 len(horizons)
+    """
+    _, sorted_bounds = sorted_horizon_order(horizons)
+    pay_delta = np.asarray(pay_delta)
+    bins = np.searchsorted(sorted_bounds, pay_delta, side='right')
+    bins[pay_delta < 0] = len(horizons)
+    return bins
+
+
+def counts_from_histogram(days, reg_counts, hist, horizons=DEFAULT_HORIZONS):
+    """
+    由按窗口编号的直方图（日期数 × (窗口数+1)，最后一列为不在任何窗口内）
+    沿窗口方向累加，生成 注册日期, 注册人数, {前缀}付费人数... 结果表
+    """
+    order, _ = sorted_horizon_order(horizons)
+    cumulative = np.asarray(hist, dtype='i8')[:, :len(horizons)].cumsum(axis=1)
+
+    result = pd.DataFrame({
+        '注册日期': days_to_dates(days),
+        '注册人数': np.asarray(reg_counts, dtype='i8'),
+    })
+    for position, h in enumerate(order):
+        result[f'{horizons[h][0]}付费人数'] = cumulative[:, position]
+    # 恢复调用方给定的窗口顺序
+    paid_columns = [f'{prefix}付费人数' for prefix, _, _ in horizons]
+    return result[['注册日期', '注册人数'] + paid_columns]
+
+
+def cohort_histogram(reg_day, pay_delta, horizons=DEFAULT_HORIZONS):
+    """
+    对 (注册日, 窗口编号) 做一次 bincount，返回有注册用户的日期、各日注册人数和
+    日期数 × (窗口数+1) 的直方图；输入为 reg_day、pay_delta 两个数组
+    """
+    reg_day = np.asarray(reg_day, dtype='i8')
+    n_bins = len(horizons) + 1
+    if len(reg_day) == 0:
+        return np.zeros(0, dtype='i8'), np.zeros(0, dtype='i8'), np.zeros((0, n_bins), dtype='i8')
+
+    first_day = reg_day.min()
+    n_days = int(reg_day.max() - first_day) + 1
+    bins = assign_horizon_bins(pay_delta, horizons)
+    hist = np.bincount((reg_day - first_day) * n_bins + bins, minlength=n_days * n_bins).reshape(n_days, n_bins)
+
+    # 只保留有注册用户的日期
+    reg_counts = hist.sum(axis=1)
+    present = reg_counts > 0
+    return np.arange(first_day, first_day + n_days)[present], reg_counts[present], hist[present]
+
+
+def compute_cohort_counts(compact, horizons=DEFAULT_HORIZONS):
+    """
+    一次分组统计每个注册日期的注册人数和各转化窗口内的付费人数
+    做法：先用 searchsorted 把每个用户分到能覆盖其付费时长的最小窗口，
+    再对 (注册日, 窗口) 做一次 bincount，最后沿窗口方向累加得到累计付费人数。
+    复杂度 O(行数 + 日期跨度 × 窗口数)，不再对每个日期重新扫描全表。
+
+    compact: 紧凑用户表（见 compact_schema），只用到 reg_day、pay_delta 两列
+    返回列：注册日期, 注册人数, {前缀}付费人数...
+    """
+    days, reg_counts, hist = cohort_histogram(compact['reg_day'].to_numpy(), compact['pay_delta'].to_numpy(), horizons)
+    return counts_from_histogram(days, reg_counts, hist, horizons)
+
+
+def add_conversion_rates(counts_df, horizons=DEFAULT_HORIZONS):
+    """
+    在分组计数结果上追加 {前缀}转化率 列（付费人数 ÷ 注册人数）
+    """
+    result = counts_df.copy()
+    reg_count = result['注册人数'].to_numpy()
+    for prefix, _, _ in horizons:
+        paid = result[f'{prefix}付费人数'].to_numpy()
+        result[f'{prefix}转化率'] = np.divide(paid, reg_count, out=np.zeros(len(result)), where=reg_count > 0)
+    return result
+
+
+@timed('按注册日统计转化')
+def build_conversion_table(df, horizons=DEFAULT_HORIZONS, workers=None):
+    """
+    由紧凑用户表（或时间列已解析的用户明细）生成按注册日期的转化明细表
+    workers 大于1时按注册日期分片并行统计（见 parallel_cohorts），结果与串行完全一致
+    """
+    compact = ensure_compact(df)
+    if workers and workers > 1:
+        from parallel_cohorts import parallel_cohort_counts
+        counts_df = parallel_cohort_counts(compact, horizons, workers)
+    else:
+        counts_df = compute_cohort_counts(compact, horizons)
+    return add_conversion_rates(counts_df, horizons)
+
+
+def merge_cohort_counts(left, right):
+    """
+    合并两份按注册日期的计数结果（如不同分块、不同分片的部分结果）
+    """
+    merged = pd.concat([left, right], ignore_index=True)
+    return merged.groupby('注册日期', as_index=False, sort=True).sum()
+
+
+def stream_cohort_counts(file_path, horizons=DEFAULT_HORIZONS, chunk_size=None):
+    """
+    分块读取用户导出并逐块合并转化计数，结果与整表计算的 compute_cohort_counts 相同
+    文件中没有数据行时返回同样列的空表
+    """
+    from chunked_reader import DEFAULT_CHUNK_SIZE, fold_user_chunks
+
+    def partial(chunk):
+        return compute_cohort_counts(compact_user_table(chunk), horizons)
+
+    empty = counts_from_histogram(*cohort_histogram([], [], horizons), horizons)
+    return fold_user_chunks(file_path, partial, merge_cohort_counts, chunk_size or DEFAULT_CHUNK_SIZE, empty)
@@ -0,0 +1,183 @@
+import os
+import numpy as np
+from cohort_engine import (DEFAULT_HORIZONS, add_conversion_rates, cohort_histogram, counts_from_histogram,
+                           sorted_horizon_order)
+from compact_schema import SECONDS_PER_DAY, USER_ID_COLUMN, compact_user_table, is_compact
+
+# 增量状态：按注册日的窗口直方图 + 注册日水位线
+# 注册日早于水位线的队列已过完最长转化窗口，之后的导出不会再改变它们的直方图（冻结）；
+# 每次运行只对注册日不早于上次水位线的行重新统计，替换状态中这些日期的直方图。不需要用户ID，也不保存逐用户的数据
+# 只有统计（直方图）这一步是增量的：每次运行仍读取并转换完整导出（解析结果按文件内容缓存，见 data_loader/array_store），
+# 按水位线筛选行、求最后注册日和观察截止时间都要扫描全部行，这部分耗时仍与历史总行数成正比
+# 假设：冻结日期的行不会被补录或修改，需要回补历史时删除状态文件即可全量重算
+
+# 状态文件格式变化时递增，旧状态自动失效
+STATE_VERSION = 3
+# 水位线初值：没有冻结的注册日
+NO_WATERMARK = np.iinfo(np.int64).min
+
+
+def empty_state(horizons=DEFAULT_HORIZONS):
+    """
+    空的增量状态
+    days: 有注册用户的注册日（天数，升序）
+    hist: 按注册日的窗口直方图，列 0..len(horizons)，最后一列为不在任何窗口内
+    watermark: 早于该注册日的直方图已冻结
+    """
+    return {
+        'version': STATE_VERSION,
+        'horizons': [tuple(h) for h in horizons],
+        'days': np.zeros(0, dtype='i8'),
+        'hist': np.zeros((0, len(horizons) + 1), dtype='i8'),
+        'watermark': NO_WATERMARK,
+    }
+
+
+def load_cohort_state(state_path, horizons=DEFAULT_HORIZONS):
+    """
+    读取增量状态（.npz）；文件不存在、无法读取、版本不符或窗口定义变化时返回空状态（即全量重算）
+    """
+    if not os.path.exists(state_path):
+        return empty_state(horizons)
+    try:
+        with np.load(state_path, allow_pickle=False) as data:
+            state = {
+                'version': int(data['version']),
+                'horizons': list(zip(data['horizon_prefixes'].tolist(), data['horizon_values'].tolist(),
+                                     data['horizon_units'].tolist())),
+                'days': data['days'],
+                'hist': data['hist'],
+                'watermark': int(data['watermark']),
+            }
+    except (OSError, ValueError, KeyError):
+        print("增量状态无法读取，将全量重算")
+        return empty_state(horizons)
+    if state['version'] != STATE_VERSION or state['horizons'] != [tuple(h) for h in horizons]:
+        print("增量状态与当前窗口定义不一致，将全量重算")
+        return empty_state(horizons)
+    return state
+
+
+def save_cohort_state(state, state_path):
+    """
+    原子写入增量状态（先写临时文件再重命名），格式为不含pickle的 .npz
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    tmp_path = state_path + '.tmp'
+    prefixes, values, units = zip(*state['horizons']) if state['horizons'] else ((), (), ())
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, version=state['version'], horizon_prefixes=np.array(prefixes, dtype=str),
+                 horizon_values=np.array(values, dtype='i8'), horizon_units=np.array(units, dtype=str),
+                 days=state['days'], hist=state['hist'], watermark=state['watermark'])
+    os.replace(tmp_path, state_path)
+
+
+def freeze_days(horizons=DEFAULT_HORIZONS):
+    """
+    注册日早于 最后注册日 - freeze_days 的队列已过完最长窗口（导出时间不早于最后注册日0点）
+    """
+    _, bounds = sorted_horizon_order(horizons)
+    return int(-(-bounds[-1] // SECONDS_PER_DAY))
+
+
+def _add_histograms(days, hist, new_days, new_hist):
+    # 按注册日合并两组直方图
+    all_days = np.union1d(days, new_days)
+    merged = np.zeros((len(all_days), hist.shape[1]), dtype='i8')
+    merged[np.searchsorted(all_days, days)] += hist
+    merged[np.searchsorted(all_days, new_days)] += new_hist
+    return all_days, merged
+
+
+def update_cohort_state(state, df, user_id_column=USER_ID_COLUMN, snapshot=True):
+    """
+    把一份用户导出合并进增量状态
+
+    df: 紧凑用户表，或时间列已解析的用户明细
+    snapshot: True 表示 df 是完整快照，只重新统计注册日不早于水位线的行，替换状态中这些日期的直方图，
+              再把水位线推进到 最后注册日 - freeze_days；
+              False 表示 df 只是新增的行，其直方图直接累加到状态上
+    返回被重新统计的注册日（天数）数组
+    """
+    horizons = state['horizons']
+    compact = df if is_compact(df) else compact_user_table(df, user_id_column)
+    reg_day = compact['reg_day'].to_numpy()
+    pay_delta = compact['pay_delta'].to_numpy()
+
+    if not snapshot:
+        days, _, hist = cohort_histogram(reg_day, pay_delta, horizons)
+        state['days'], state['hist'] = _add_histograms(state['days'], state['hist'], days, hist)
+        print(f"增量更新: 追加 {len(reg_day)} 人, 影响注册日 {len(days)} 个")
+        return days
+
+    watermark = state['watermark']
+    last_day = int(reg_day.max()) if len(reg_day) else None
+    if last_day is None or last_day < watermark:
+        # 导出为空或早于状态：冻结日期不再可信，全量重算
+        watermark = NO_WATERMARK
+    rows = np.flatnonzero(reg_day >= watermark) if watermark != NO_WATERMARK else slice(None)
+    days, _, hist = cohort_histogram(reg_day[rows], pay_delta[rows], horizons)
+    return _replace_unfrozen(state, days, hist, last_day)
+
+
+def _replace_unfrozen(state, days, hist, last_day):
+    # 用快照的直方图替换状态中未冻结（注册日不早于水位线）的日期，再推进水位线
+    # days/hist 至少覆盖快照中注册日不早于水位线的全部日期；last_day 为快照的最后注册日，空快照为 None
+    watermark = state['watermark']
+    if last_day is None or last_day < watermark:
+        watermark = NO_WATERMARK
+    unfrozen = days >= watermark
+    days, hist = days[unfrozen], hist[unfrozen]
+    frozen = state['days'] < watermark
+    state['days'] = np.concatenate([state['days'][frozen], days])
+    state['hist'] = np.concatenate([state['hist'][frozen], hist])
+    if last_day is not None:
+        watermark = max(watermark, last_day - freeze_days(state['horizons']))
+    state['watermark'] = watermark
+
+    print(f"增量更新: 重新统计 {len(days)} 个注册日（{int(hist.sum())} 人）, "
+          f"冻结注册日 {int(frozen.sum())} 个")
+    return days
+
+
+def state_to_counts(state):
+    """
+    由增量状态生成与 compute_cohort_counts 相同格式的结果表
+    """
+    hist = state['hist']
+    return counts_from_histogram(state['days'], hist.sum(axis=1), hist, state['horizons'])
+
+
+def build_conversion_table_incremental(df, state_path, horizons=DEFAULT_HORIZONS,
+                                       user_id_column=USER_ID_COLUMN, snapshot=True):
+    """
+    增量版 build_conversion_table：读取状态、合并本次数据、保存状态，返回转化明细表
+    df 是完整导出，只有按注册日的统计是增量的，读取和转换导出的耗时仍与总行数成正比
+    """
+    state = load_cohort_state(state_path, horizons)
+    update_cohort_state(state, df, user_id_column, snapshot)
+    save_cohort_state(state, state_path)
+    return add_conversion_rates(state_to_counts(state), state['horizons'])
+
+
+def stream_conversion_table_incremental(file_path, state_path, horizons=DEFAULT_HORIZONS, chunk_size=None):
+    """
+    分块读取版 build_conversion_table_incremental：逐块统计按注册日的直方图并合并，
+    再用未冻结日期的部分更新状态；导出文件是完整快照
+    """
+    from chunked_reader import DEFAULT_CHUNK_SIZE, fold_user_chunks
+
+    def partial(chunk):
+        compact = compact_user_table(chunk)
+        days, _, hist = cohort_histogram(compact['reg_day'].to_numpy(), compact['pay_delta'].to_numpy(), horizons)
+        return days, hist
+
+    def merge(left, right):
+        return _add_histograms(left[0], left[1], right[0], right[1])
+
+    state = load_cohort_state(state_path, horizons)
+    empty = (np.zeros(0, dtype='i8'), np.zeros((0, len(horizons) + 1), dtype='i8'))
+    days, hist = fold_user_chunks(file_path, partial, merge, chunk_size or DEFAULT_CHUNK_SIZE, empty)
+    _replace_unfrozen(state, days, hist, int(days.max()) if len(days) else None)
+    save_cohort_state(state, state_path)
+    return add_conversion_rates(state_to_counts(state), state['horizons'])
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from profiling import timed
+
+# 紧凑用户表：每个用户约18字节（不含用户ID）
+#   reg_day      int32  注册日，1970-01-01起的天数
+#   reg_second   int32  注册时刻在当天的秒数
+#   pay_delta    int32  注册到首次付费的秒数，未付费为 NEVER
+#   login_delta  int32  注册到最后登录的秒数，无登录记录为 NEVER（源数据有最后登录时间列时才有）
+#   week         int16  注册周编号，1969-12-29(周一)起的周数，与ISO周一一对应
+#   user_id             用户ID原值（源数据有该列时才有）
+#   其他维度列          调用方通过 extra_columns 指定时原样保留（如渠道、平台）
+# 时间差精确到秒，与原先基于datetime的口径（如12小时内含边界）完全一致
+
+# “从未发生”的哨兵值，小于任何真实时间差，因此 delta >= 0 的判断会自然排除它
+NEVER = np.iinfo(np.int32).min
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 86400
+USER_ID_COLUMN = '新用户手机号'
+
+_NAT = np.iinfo(np.int64).min
+
+
+def _epoch_seconds(series):
+    """
+    datetime64列换算为1970-01-01起的秒数（int64），NaT保持为int64最小值
+    """
+    return series.to_numpy(dtype='datetime64[s]').view('i8')
+
+
+def _delta_seconds(event_seconds, reg_seconds):
+    """
+    计算事件相对注册的秒数，并压缩为int32；事件缺失记为 NEVER
+    """
+    delta = np.full(len(reg_seconds), NEVER, dtype='i4')
+    happened = event_seconds != _NAT
+    delta[happened] = np.clip(event_seconds[happened] - reg_seconds[happened],
+                              NEVER + 1, np.iinfo(np.int32).max)
+    return delta
+
+
+@timed('转换紧凑用户表')
+def compact_user_table(df, user_id_column=USER_ID_COLUMN, extra_columns=()):
+    """
+    把用户明细（时间列已解析为datetime）转换为紧凑用户表
+    注册时间为空的行被丢弃，其余分析都不会使用这些行
+    extra_columns: 需要一并保留的维度列（源数据中不存在的列被忽略）
+    """
+    reg_seconds = _epoch_seconds(df['注册时间'])
+    keep = reg_seconds != _NAT
+    reg_seconds = reg_seconds[keep]
+
+    reg_day = np.floor_divide(reg_seconds, SECONDS_PER_DAY)
+    compact = pd.DataFrame({
+        'reg_day': reg_day.astype('i4'),
+        'reg_second': (reg_seconds - reg_day * SECONDS_PER_DAY).astype('i4'),
+    })
+    if '首次付费时间' in df.columns:
+        compact['pay_delta'] = _delta_seconds(_epoch_seconds(df['首次付费时间'])[keep], reg_seconds)
+    else:
+        compact['pay_delta'] = np.full(len(compact), NEVER, dtype='i4')
+    if '最后登录时间' in df.columns:
+        compact['login_delta'] = _delta_seconds(_epoch_seconds(df['最后登录时间'])[keep], reg_seconds)
+    # 1970-01-01 是周四，+3 后按7天整除即得到以周一为起点的周编号
+    compact['week'] = np.floor_divide(reg_day + 3, 7).astype('i2')
+    if user_id_column in df.columns:
+        compact['user_id'] = df[user_id_column].to_numpy()[keep]
+    for column in extra_columns:
+        if column in df.columns:
+            compact[column] = df[column].to_numpy()[keep]
+    return compact
+
+
+def is_compact(df):
+    """
+    判断是否已经是紧凑用户表
+    """
+    return 'reg_day' in df.columns and 'pay_delta' in df.columns
+
+
+def ensure_compact(df):
+    """
+    传入紧凑用户表时原样返回，传入用户明细时转换为紧凑用户表
+    """
+    return df if is_compact(df) else compact_user_table(df)
+
+
+def days_to_dates(days):
+    """
+    1970-01-01起的天数数组转换为 datetime.date 对象数组（用于输出表格）
+    """
+    return pd.to_datetime(np.asarray(days, dtype='datetime64[D]')).date
+
+
+def dates_to_days(dates):
+    """
+    date 对象序列（如结果表的注册日期列）转换为1970-01-01起的天数数组，days_to_dates 的逆运算
+    """
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]').astype('i8')
+
+
+def observation_cutoff(compact):
+    """
+    紧凑用户表中最晚的事件时间（注册、首次付费、最后登录，1970-01-01起的秒数），作为导出时间的估计
+    """
+    reg_seconds = compact['reg_day'].to_numpy(dtype='i8') * SECONDS_PER_DAY + compact['reg_second'].to_numpy(dtype='i8')
+    if len(reg_seconds) == 0:
+        return None
+    latest = reg_seconds.max()
+    for column in ('pay_delta', 'login_delta'):
+        if column in compact.columns:
+            delta = compact[column].to_numpy(dtype='i8')
+            happened = delta != NEVER
+            if happened.any():
+                latest = max(latest, (reg_seconds[happened] + delta[happened]).max())
+    return int(latest)
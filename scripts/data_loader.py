@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from profiling import stage
+
+# 用户明细中需要解析为datetime的列
+DATETIME_COLUMNS = ['注册时间', '上传简历时间', '首次付费时间', '最后登录时间']
+
+# 缓存目录放在源文件同级目录下
+CACHE_DIR_NAME = '.cache'
+# 解析逻辑变化时递增，旧缓存自动失效
+CACHE_VERSION = 1
+
+
+def file_sha256(file_path, chunk_size=1 << 20):
+    """
+    计算文件内容的SHA-256
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_datetime_columns(df):
+    """
+    将已知的时间列统一解析为datetime64，无法解析的值置为NaT
+    """
+    for column in DATETIME_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    return df
+
+
+def read_source(file_path):
+    """
+    直接读取原始导出文件（.xlsx 或 .csv）并解析时间列，不经过缓存
+    """
+    with stage('读取源文件') as record:
+        if file_path.lower().endswith('.csv'):
+            df = pd.read_csv(file_path)
+        else:
+            df = pd.read_excel(file_path)
+        record['rows'] = len(df)
+    with stage('解析时间列', rows=len(df)):
+        return parse_datetime_columns(df)
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def _remove_stale_caches(cache_dir, file_name, keep_path):
+    prefix = file_name + '.'
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(prefix) and name.endswith('.parquet') and path != keep_path:
+            os.remove(path)
+
+
+def source_cache_dir(file_path):
+    """
+    源文件对应的缓存目录（源文件同级的 .cache 目录）
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+
+
+def _source_meta(file_path):
+    # 返回 (元数据路径, 内容哈希, 已记录的元数据是否仍有效, 最新元数据)
+    file_name = os.path.basename(file_path)
+    meta_path = os.path.join(source_cache_dir(file_path), file_name + '.meta.json')
+    stat = os.stat(file_path)
+    meta = _read_meta(meta_path)
+    meta_fresh = (
+        meta is not None
+        and meta.get('version') == CACHE_VERSION
+        and meta.get('mtime_ns') == stat.st_mtime_ns
+        and meta.get('size') == stat.st_size
+    )
+    digest = meta['sha256'] if meta_fresh else file_sha256(file_path)
+    new_meta = {
+        'version': CACHE_VERSION,
+        'source': file_name,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': digest,
+    }
+    return meta_path, digest, meta_fresh, new_meta
+
+
+def source_digest(file_path):
+    """
+    源文件内容的SHA-256，mtime和大小都没变时直接使用已记录的哈希，否则重新计算并刷新元数据
+    """
+    meta_path, digest, meta_fresh, new_meta = _source_meta(file_path)
+    if not meta_fresh:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        _write_meta(meta_path, new_meta)
+    return digest
+
+
+def load_user_data(file_path, use_cache=True):
+    """
+    读取用户导出文件，时间列已解析为datetime64
+
+    首次读取时把解析结果写成Parquet列式缓存（源文件同级的 .cache 目录），
+    缓存文件名包含源文件内容哈希；另存一份元数据记录源文件的mtime和大小。
+    mtime和大小都没变时直接信任已记录的哈希，否则重新计算哈希，
+    内容变化后会生成新缓存并清理旧缓存。未安装pyarrow时退化为直接读取源文件。
+    """
+    if not use_cache:
+        return read_source(file_path)
+
+    file_name = os.path.basename(file_path)
+    cache_dir = source_cache_dir(file_path)
+    meta_path, digest, meta_fresh, new_meta = _source_meta(file_path)
+    cache_path = os.path.join(cache_dir, f"{file_name}.v{CACHE_VERSION}.{digest[:16]}.parquet")
+
+    if os.path.exists(cache_path):
+        try:
+            with stage('读取列式缓存') as record:
+                df = pd.read_parquet(cache_path)
+                record['rows'] = len(df)
+        except ImportError:
+            return read_source(file_path)
+        if not meta_fresh:
+            # 内容没变只是mtime变了，刷新元数据即可
+            _write_meta(meta_path, new_meta)
+        return df
+
+    df = read_source(file_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with stage('写入列式缓存', rows=len(df)):
+            df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    except ImportError:
+        print("未安装pyarrow，跳过列式缓存")
+        return df
+    _remove_stale_caches(cache_dir, file_name, cache_path)
+    _write_meta(meta_path, new_meta)
+    return df
+
@@ -0,0 +1,234 @@
+import itertools
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+from chunked_reader import DEFAULT_CHUNK_SIZE, iter_user_chunks
+from cohort_cube import DEFAULT_DIMENSIONS
+from compact_schema import SECONDS_PER_DAY, USER_ID_COLUMN, compact_user_table
+from data_loader import CACHE_DIR_NAME, file_sha256
+from profiling import stage
+
+# 嵌入式用户事件库（SQLite）：用户导出按时间列的秒数入库，注册时间、首次付费时间和用户ID上建索引，
+# 按注册/付费时间范围的查询只读取范围内的行（如“最近8周”的刷新），读出后转换为紧凑用户表交给原有分析
+# 每个输入文件（source）的行在一个事务内整体替换，内容未变化（SHA-256相同）的文件不会重复入库
+# 用户ID列不声明类型，数字ID和字符串ID按原类型保存，读出后与登录事件等其他数据的ID类型一致
+
+DEFAULT_STORE_PATH = os.path.join('..', 'data', CACHE_DIR_NAME, 'events.sqlite')
+# 每次 executemany 写入的行数
+INSERT_BATCH_ROWS = 50000
+STORE_VERSION = 1
+# 源数据时间列 -> 库中列名（1970-01-01起的秒数，缺失为 NULL）
+TIME_COLUMNS = {
+    '注册时间': 'reg_time',
+    '首次付费时间': 'pay_time',
+    '最后登录时间': 'login_time',
+}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    columns TEXT NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    source TEXT NOT NULL,
+    user_id,
+    reg_time INTEGER NOT NULL,
+    pay_time INTEGER,
+    login_time INTEGER,
+    {', '.join(f'{name} TEXT' for name in DEFAULT_DIMENSIONS)}
+);
+PRAGMA user_version = {STORE_VERSION};
+"""
+# 索引名 -> 定义；库中其他来源的行数较少时，批量入库先删除索引、插入完成后在同一事务内重建，
+# 比逐行维护索引快约2倍；其他来源的行较多时重建代价更大，保留索引逐行维护
+_INDEXES = {
+    'idx_users_reg_time': 'users (source, reg_time)',
+    'idx_users_pay_time': 'users (source, pay_time)',
+    'idx_users_user_id': 'users (user_id)',
+}
+
+
+def _create_indexes(conn):
+    for name, definition in _INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+
+def open_store(path=DEFAULT_STORE_PATH):
+    """
+    打开（不存在时创建）事件库；WAL 模式下读查询不会被入库事务阻塞
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version not in (0, STORE_VERSION):
+        conn.close()
+        raise ValueError(f"事件库版本不符: {version}，请删除 {path} 后重新入库")
+    conn.executescript(_SCHEMA)
+    with conn:
+        _create_indexes(conn)
+    return conn
+
+
+def _with_none(values, missing):
+    # 整列转换为对象数组，缺失位置为 None（写入 NULL）；数值元素为 Python int，sqlite3 直接绑定
+    values = values.astype(object)
+    values[missing] = None
+    return values
+
+
+def _seconds_or_none(series):
+    # datetime64列换算为秒数，NaT 为 None
+    return _with_none(series.to_numpy(dtype='datetime64[s]').view('i8'), pd.isna(series).to_numpy())
+
+
+def _user_ids(series):
+    # openpyxl 只读模式把文本格式的数字ID读成字符串；全部为整数时按整数保存，与 read_excel 整表读取的类型一致
+    missing = series.isna().to_numpy()
+    numbers = pd.to_numeric(series.where(~missing, None), errors='coerce').to_numpy(dtype='f8')
+    valid = numbers[~missing]
+    if (~missing).any() and not np.isnan(valid).any() and (valid % 1 == 0).all():
+        return _with_none(np.where(missing, 0, numbers).astype('i8'), missing)
+    return _with_none(series.to_numpy(), missing)
+
+
+def _chunk_rows(source, chunk):
+    # 用户明细分块按列整体转换（不逐行处理），返回 (行数, 待插入行的迭代器)；
+    # 注册时间为空的行被丢弃（紧凑用户表同样丢弃这些行）
+    chunk = chunk[chunk['注册时间'].notna()] if '注册时间' in chunk.columns else chunk.iloc[0:0]
+    n = len(chunk)
+    empty = np.full(n, None, dtype=object)
+    columns = [np.full(n, source, dtype=object),
+               _user_ids(chunk[USER_ID_COLUMN]) if USER_ID_COLUMN in chunk.columns else empty]
+    for column in TIME_COLUMNS:
+        columns.append(_seconds_or_none(chunk[column]) if column in chunk.columns else empty)
+    for column in DEFAULT_DIMENSIONS.values():
+        if column in chunk.columns:
+            values = chunk[column]
+            columns.append(_with_none(values.astype(str).to_numpy(), values.isna().to_numpy()))
+        else:
+            columns.append(empty)
+    return n, zip(*(column.tolist() for column in columns))
+
+
+def ingest_user_export(conn, file_path, source=None, chunk_size=DEFAULT_CHUNK_SIZE, batch_rows=INSERT_BATCH_ROWS,
+                       force=False):
+    """
+    把用户导出（.xlsx/.csv）分块读入事件库，source 默认为文件名
+    同一 source 的旧行在同一个事务内删除后重新插入，中途失败时库保持入库前的状态；
+    文件 SHA-256 与上次入库相同时跳过（force 时强制重新入库）
+    返回写入的行数（跳过时为 None）
+    """
+    source = source or os.path.basename(file_path)
+    digest = file_sha256(file_path)
+    previous = conn.execute('SELECT sha256, rows FROM sources WHERE source = ?', (source,)).fetchone()
+    if previous and previous[0] == digest and not force:
+        print(f"{source} 未变化，跳过入库")
+        return None
+
+    columns = ['source', 'user_id'] + list(TIME_COLUMNS.values()) + list(DEFAULT_DIMENSIONS)
+    insert = f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    others = conn.execute('SELECT COALESCE(SUM(rows), 0) FROM sources WHERE source != ?', (source,)).fetchone()[0]
+    rebuild_indexes = others <= (previous[1] if previous else 0)
+    rows = 0
+    present = set()
+    with stage(f'入库: {source}') as record:
+        with conn:
+            # 显式开始事务，删除索引等DDL也在事务内，失败时一并回滚
+            conn.execute('BEGIN')
+            if rebuild_indexes:
+                for name in _INDEXES:
+                    conn.execute(f'DROP INDEX IF EXISTS {name}')
+            conn.execute('DELETE FROM users WHERE source = ?', (source,))
+            for chunk in iter_user_chunks(file_path, chunk_size):
+                present.update(column for column in [USER_ID_COLUMN, *TIME_COLUMNS, *DEFAULT_DIMENSIONS.values()]
+                               if column in chunk.columns)
+                n, chunk_rows = _chunk_rows(source, chunk)
+                for _ in range(0, n, batch_rows):
+                    conn.executemany(insert, itertools.islice(chunk_rows, batch_rows))
+                rows += n
+            if rebuild_indexes:
+                _create_indexes(conn)
+            conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)',
+                         (source, digest, rows, json.dumps(sorted(present), ensure_ascii=False), time.time()))
+        record['rows'] = rows
+    print(f"{source} 已入库 {rows} 行")
+    return rows
+
+
+def _time_bound(value):
+    # 日期（字符串/Timestamp）换算为当天0点的秒数
+    return int(pd.Timestamp(value).normalize().value // 10 ** 9)
+
+
+def query_users(conn, source, start=None, end=None, pay_start=None, pay_end=None):
+    """
+    按注册日期范围 [start, end] 和首次付费日期范围 [pay_start, pay_end]（含端点，可省略）读取用户明细，
+    条件在 SQL 中执行并使用索引；返回与 load_user_data 相同列名的 DataFrame（时间列为datetime64），
+    只包含入库时源文件中存在的列
+    """
+    stored = conn.execute('SELECT columns FROM sources WHERE source = ?', (source,)).fetchone()
+    present = set(json.loads(stored[0])) if stored else set()
+    conditions, params = ['source = ?'], [source]
+    for column, low, high in (('reg_time', start, end), ('pay_time', pay_start, pay_end)):
+        if low is not None:
+            conditions.append(f'{column} >= ?')
+            params.append(_time_bound(low))
+        if high is not None:
+            conditions.append(f'{column} < ?')
+            params.append(_time_bound(high) + SECONDS_PER_DAY)
+    select = ['user_id'] + list(TIME_COLUMNS.values()) + list(DEFAULT_DIMENSIONS)
+    sql = f"SELECT {', '.join(select)} FROM users WHERE {' AND '.join(conditions)} ORDER BY reg_time"
+    with stage(f'查询事件库: {source}') as record:
+        raw = pd.read_sql_query(sql, conn, params=params)
+        record['rows'] = len(raw)
+
+    df = pd.DataFrame(index=raw.index)
+    if USER_ID_COLUMN in present:
+        df[USER_ID_COLUMN] = raw['user_id']
+    for column, name in TIME_COLUMNS.items():
+        if column not in present:
+            continue
+        seconds = pd.to_numeric(raw[name]).to_numpy(dtype='f8')
+        times = np.full(len(raw), np.datetime64('NaT'), dtype='datetime64[s]')
+        known = ~np.isnan(seconds)
+        times[known] = seconds[known].astype('i8').astype('datetime64[s]')
+        df[column] = times.astype('datetime64[ns]')
+    for name, column in DEFAULT_DIMENSIONS.items():
+        if column in present:
+            df[column] = raw[name]
+    return df
+
+
+def load_compact(conn, source, start=None, end=None, pay_start=None, pay_end=None):
+    """
+    按时间范围读取并转换为紧凑用户表（含源文件中存在的维度列），参数同 query_users
+    """
+    df = query_users(conn, source, start, end, pay_start, pay_end)
+    return compact_user_table(df, extra_columns=list(DEFAULT_DIMENSIONS.values()))
+
+
+def recent_weeks_start(conn, source, weeks):
+    """
+    最近 weeks 个自然周（含最后注册日所在周）的起始周一，库中没有该 source 时返回 None
+    """
+    last = conn.execute('SELECT MAX(reg_time) FROM users WHERE source = ?', (source,)).fetchone()[0]
+    if last is None:
+        return None
+    last_day = last // SECONDS_PER_DAY
+    monday = (last_day + 3) // 7 * 7 - 3 - (weeks - 1) * 7
+    return str(np.datetime64(monday, 'D'))
+
+
+def list_sources(conn):
+    """
+    已入库的 source 及其行数、SHA-256、入库时间
+    """
+    return pd.read_sql_query('SELECT source, rows, sha256, ingested_at FROM sources ORDER BY source', conn)
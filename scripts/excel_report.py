@@ -0,0 +1,90 @@
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import Reference
+from openpyxl.drawing.image import Image as XLImage
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+from profiling import stage
+
+# 表头样式与 pandas.to_excel 的默认样式一致
+_THIN = Side(style='thin')
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+# 自动列宽的上限（字符数）
+MAX_COLUMN_WIDTH = 50
+# 数据行分块写出，每块转换为Python对象的行数
+WRITE_CHUNK_ROWS = 10000
+
+
+def report_sheet(name, df=None, charts=(), images=(), auto_width=False):
+    """
+    描述报告中的一个工作表
+    df: 写入的数据表（首行为表头），None 表示只放图片/图表
+    charts: [(openpyxl图表对象, 数据起始列, 数据结束列, 锚点)]，数据列含表头行，第1列作为类别
+    images: [(图片文件路径或文件对象, 锚点)]
+    auto_width: 按内容长度设置列宽
+    """
+    return {'name': name, 'df': df, 'charts': list(charts), 'images': list(images), 'auto_width': auto_width}
+
+
+def _column_widths(df):
+    widths = []
+    for position, column in enumerate(df.columns):
+        values = df.iloc[:, position]
+        longest = values[values.notna()].astype(str).str.len().max() if len(values) else 0
+        widths.append(min(max(len(str(column)), 0 if pd.isna(longest) else int(longest)) + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def _write_frame(ws, df, auto_width):
+    # 只写模式下列宽必须在写入第一行之前设置
+    if auto_width:
+        for position, width in enumerate(_column_widths(df), start=1):
+            ws.column_dimensions[get_column_letter(position)].width = width
+
+    header = []
+    for column in df.columns:
+        cell = WriteOnlyCell(ws, value=str(column))
+        cell.font = HEADER_FONT
+        cell.border = HEADER_BORDER
+        cell.alignment = HEADER_ALIGNMENT
+        header.append(cell)
+    ws.append(header)
+
+    # 分块逐行写出，不把整张表转换为对象数组；只检查含缺失值的列，缺失值写为空单元格
+    missing = [position for position in range(df.shape[1]) if df.iloc[:, position].isna().any()]
+    for start in range(0, len(df), WRITE_CHUNK_ROWS):
+        for row in df.iloc[start:start + WRITE_CHUNK_ROWS].itertuples(index=False, name=None):
+            if missing:
+                row = list(row)
+                for position in missing:
+                    if pd.isna(row[position]):
+                        row[position] = None
+            ws.append(row)
+
+
+def write_report(output_path, sheets):
+    """
+    以只写（流式）模式一次性写出整个Excel报告：数据表、原生图表和图片在同一次保存中完成，
+    不再先写数据、再用 load_workbook 重新打开插图并二次保存；内存和耗时与数据行数线性相关
+    sheets: report_sheet 描述的列表，按顺序生成工作表
+    """
+    rows = sum(len(spec['df']) for spec in sheets if spec['df'] is not None)
+    with stage('写入Excel报告', rows=rows):
+        workbook = Workbook(write_only=True)
+        for spec in sheets:
+            ws = workbook.create_sheet(spec['name'])
+            n_rows = 0
+            if spec['df'] is not None:
+                _write_frame(ws, spec['df'], spec['auto_width'])
+                n_rows = len(spec['df'])
+            for chart, min_col, max_col, anchor in spec['charts']:
+                chart.add_data(Reference(ws, min_col=min_col, max_col=max_col, min_row=1, max_row=n_rows + 1),
+                               titles_from_data=True)
+                chart.set_categories(Reference(ws, min_col=1, min_row=2, max_row=n_rows + 1))
+                ws.add_chart(chart, anchor)
+            for source, anchor in spec['images']:
+                ws.add_image(XLImage(source), anchor)
+        workbook.save(output_path)
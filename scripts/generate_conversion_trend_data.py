@@ -1,99 +1,77 @@
-import pandas as pd
-import json
-import datetime
+from cohort_engine import add_conversion_rates, build_conversion_table, stream_cohort_counts
+from cohort_state import build_conversion_table_incremental, stream_conversion_table_incremental
+from compact_schema import ensure_compact, observation_cutoff
+from data_loader import load_user_data
+from periods import cohort_period_quantiles
+from profiling import profile_run, stage
+from publish import publish_json
+from quantiles import BAND_QUANTILES, quantile_label
+from survival import mask_immature_rates
 
-def generate_conversion_trend_data():
+# 趋势图只需要D7、D14、D30三个窗口
+TREND_HORIZONS = [
+    ('D7', 7, 'd'),
+    ('D14', 14, 'd'),
+    ('D30', 30, 'd'),
+]
+
+def generate_conversion_trend_data(file_path='../data/3月以来的付费用户情况.xlsx',
+                                   output_path='../public/conversion_trend_data.json', state_path=None,
+                                   chunk_size=None, period_spec=None):
     """
     生成转化率趋势数据，用于网页展示
+    指定 chunk_size 时分块流式读取，适用于超出内存的导出文件；同时指定 state_path 时分块读取并更新增量状态
+    period_spec 指定趋势周期（见 periods.DEFAULT_PERIOD_SPEC），默认最近11个完整自然周
     """
     
-    # 读取数据
-    file_path = '../data/3月以来的付费用户情况.xlsx'
-    df = pd.read_excel(file_path)
-    
-    # 转换时间列为datetime类型
-    df['注册时间'] = pd.to_datetime(df['注册时间'])
-    df['首次付费时间'] = pd.to_datetime(df['首次付费时间'], errors='coerce')
-    
-    # 只保留有注册时间的用户
-    df = df.dropna(subset=['注册时间'])
-    
-    # 计算注册日期（去掉时间部分）
-    df['注册日期'] = df['注册时间'].dt.date
-    
-    # 计算注册到付费的天数
-    df['注册到付费天数'] = (df['首次付费时间'] - df['注册时间']).dt.days
+    if chunk_size:
+        if state_path:
+            results_df = stream_conversion_table_incremental(file_path, state_path, TREND_HORIZONS, chunk_size)
+        else:
+            results_df = add_conversion_rates(stream_cohort_counts(file_path, TREND_HORIZONS, chunk_size),
+                                              TREND_HORIZONS)
+        return write_conversion_trend_data(results_df, output_path, period_spec)
     
-    # 获取每个注册日期的用户数
-    daily_registrations = df.groupby('注册日期').size().reset_index(name='注册人数')
-    
-    # 计算每个注册日期的转化率
-    conversion_results = []
-    
-    for i, row in daily_registrations.iterrows():
-        reg_date = row['注册日期']
-        reg_count = row['注册人数']
-        
-        # 获取该日期注册的用户
-        date_users = df[df['注册日期'] == reg_date]
-        
-        # 计算该日期注册用户的转化情况
-        d7_paid = len(date_users[(date_users['注册到付费天数'] >= 0) & (date_users['注册到付费天数'] <= 7)])
-        d14_paid = len(date_users[(date_users['注册到付费天数'] >= 0) & (date_users['注册到付费天数'] <= 14)])
-        d30_paid = len(date_users[(date_users['注册到付费天数'] >= 0) & (date_users['注册到付费天数'] <= 30)])
-        
-        d7_rate = d7_paid / reg_count if reg_count > 0 else 0
-        d14_rate = d14_paid / reg_count if reg_count > 0 else 0
-        d30_rate = d30_paid / reg_count if reg_count > 0 else 0
-        
-        conversion_results.append({
-            '注册日期': reg_date,
-            '注册人数': reg_count,
-            'D7付费人数': d7_paid,
-            'D14付费人数': d14_paid,
-            'D30付费人数': d30_paid,
-            'D7转化率': d7_rate,
-            'D14转化率': d14_rate,
-            'D30转化率': d30_rate
-        })
+    # 读取数据
+    df = load_user_data(file_path)
+    return generate_conversion_trend_data_from_frame(df, output_path, state_path, period_spec)
+
+def generate_conversion_trend_data_from_frame(df, output_path='../public/conversion_trend_data.json', state_path=None,
+                                              period_spec=None, workers=None, observed_until=None):
+    """
+    由紧凑用户表（或已加载的用户明细）生成转化率趋势数据并写入 output_path
+    指定 state_path 时使用增量模式，只重新统计尚未过完最长窗口的注册日（读取导出仍是全量的，见 cohort_state）
+    workers 大于1时按注册日期分片多进程统计（非增量模式）
+    observed_until 判断转化率是否成熟的观察截止时间，默认取数据中最晚的事件时间（与生存分析相同）
+    """
     
-    # 转换为DataFrame
-    results_df = pd.DataFrame(conversion_results)
+    # 转换为紧凑用户表（只保留有注册时间的用户）
+    compact = ensure_compact(df)
+    if observed_until is None:
+        observed_until = observation_cutoff(compact)
+    
+    # 按注册日期一次性分组统计D7、D14、D30转化率
+    if state_path:
+        results_df = build_conversion_table_incremental(compact, state_path, TREND_HORIZONS)
+    else:
+        results_df = build_conversion_table(compact, TREND_HORIZONS, workers)
+    return write_conversion_trend_data(results_df, output_path, period_spec, observed_until)
+
+def write_conversion_trend_data(results_df, output_path='../public/conversion_trend_data.json', period_spec=None,
+                                observed_until=None):
+    """
+    由按注册日期的转化明细计算分时间段中位数，写入趋势JSON
+    尚未经过完整窗口的注册日期不参与该窗口的统计（见 survival.mature_mask）
+    """
+    results_df = mask_immature_rates(results_df, TREND_HORIZONS, observed_until)
     
     # ========== 分时间段中位数趋势图 ==========
-    period_labels = [
-        "0623-0629", "0616-0622", "0609-0615", "0602-0608", "0526-0601", "0519-0525", "0512-0518", "0505-0511", "0428-0504", "0421-0427", "0414-0420"
-    ]
-    period_ranges = [
-        ("2025-06-23", "2025-06-29"),
-        ("2025-06-16", "2025-06-22"),
-        ("2025-06-09", "2025-06-15"),
-        ("2025-06-02", "2025-06-08"),
-        ("2025-05-26", "2025-06-01"),
-        ("2025-05-19", "2025-05-25"),
-        ("2025-05-12", "2025-05-18"),
-        ("2025-05-05", "2025-05-11"),
-        ("2025-04-28", "2025-05-04"),
-        ("2025-04-21", "2025-04-27"),
-        ("2025-04-14", "2025-04-20")
-    ]
-    
-    period_ranges = [
-        (datetime.datetime.strptime(start, "%Y-%m-%d").date(), datetime.datetime.strptime(end, "%Y-%m-%d").date())
-        for start, end in period_ranges
-    ]
-    
-    # 只保留D7、D14、D30
+    # 周期按数据实际覆盖的日期范围生成（默认最近11个完整自然周），一次分组计算中位数
+    # 只保留D7、D14、D30；同一次分组同时得到中位数和P25/P75/P90趋势带
     period_conv_types = ['D7转化率', 'D14转化率', 'D30转化率']
-    period_medians = {conv: [] for conv in period_conv_types}
-    period_labels = period_labels[::-1]
-    period_ranges = period_ranges[::-1]
-    
-    for start, end in period_ranges:
-        mask = (results_df['注册日期'] >= start) & (results_df['注册日期'] <= end)
-        for conv in period_conv_types:
-            median_val = results_df.loc[mask, conv].median() if mask.any() else None
-            period_medians[conv].append(median_val)
+    period_labels, period_bands = cohort_period_quantiles(results_df, period_conv_types, BAND_QUANTILES,
+                                                          period_spec)
+    period_medians = {conv: period_bands[conv][0.5] for conv in period_conv_types}
     
     # 生成数据格式
     trend_data = []
@@ -105,18 +83,33 @@ def generate_conversion_trend_data():
             "D30转化率": period_medians['D30转化率'][i] * 100 if period_medians['D30转化率'][i] is not None else None
         })
     
+    # 分位数趋势带：每个时间段各转化率的 P25/P50/P75/P90
+    band_data = []
+    for i, period in enumerate(period_labels):
+        entry = {"period": period}
+        for conv in period_conv_types:
+            entry[conv] = {
+                quantile_label(q): period_bands[conv][q][i] * 100 if period_bands[conv][q][i] is not None else None
+                for q in BAND_QUANTILES
+            }
+        band_data.append(entry)
+    
     # 创建输出数据结构
     conversion_trend_data = {
         "转化率趋势": {
             "title": "D7/D14/D30转化率分时间段中位数趋势",
             "data": trend_data
+        },
+        "转化率分位数带": {
+            "title": "D7/D14/D30转化率分时间段分位数（P25/P50/P75/P90）",
+            "quantiles": [quantile_label(q) for q in BAND_QUANTILES],
+            "data": band_data
         }
     }
     
-    # 保存到JSON文件
-    output_path = '../public/conversion_trend_data.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(conversion_trend_data, f, ensure_ascii=False, indent=2)
+    # 发布为紧凑JSON及预压缩副本（原子写入，内容不变时不重写）
+    with stage('写入JSON'):
+        publish_json(conversion_trend_data, output_path)
     
     print(f"转化率趋势数据已生成并保存到: {output_path}")
     print(f"时间段数量: {len(trend_data)}")
@@ -124,4 +117,5 @@ def generate_conversion_trend_data():
     return conversion_trend_data
 
 if __name__ == "__main__":
-    generate_conversion_trend_data() 
\ No newline at end of file
+    with profile_run('generate_conversion_trend_data'):
+        generate_conversion_trend_data() 
\ No newline at end of file
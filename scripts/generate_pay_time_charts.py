@@ -1,59 +1,71 @@
-import pandas as pd
-import json
-import os
+from compact_schema import NEVER, ensure_compact
+from data_loader import load_user_data
+from histograms import histogram, histogram_counts, histogram_labels, histogram_spec, merge_histograms
+from profiling import profile_run, stage, timed
+from publish import publish_json
 
-def generate_pay_time_data():
+# 天分布只统计0-35天（35天及以上不计入），小时分布只统计24小时内
+MAX_PAY_DAYS = 35
+DAY_HISTOGRAM = histogram_spec('day', bins=MAX_PAY_DAYS)
+HOUR_HISTOGRAM = histogram_spec('hour', bins=24)
+
+def generate_pay_time_data(file_path='../data/Result_10.xlsx', output_path='../public/pay_time_data.json',
+                           chunk_size=None):
     """
     生成付费时长分布数据，用于网页展示
+    指定 chunk_size 时分块流式读取，适用于超出内存的导出文件
     """
     
+    if chunk_size:
+        from chunked_reader import fold_user_chunks
+        day_hist, hour_hist = fold_user_chunks(file_path, pay_time_counts, merge_pay_time_counts, chunk_size)
+        return write_pay_time_data(day_hist, hour_hist, output_path)
+    
     # 读取数据
-    file_path = '../data/Result_10.xlsx'
-    df = pd.read_excel(file_path)
+    df = load_user_data(file_path)
+    return generate_pay_time_data_from_frame(df, output_path)
+
+def generate_pay_time_data_from_frame(df, output_path='../public/pay_time_data.json'):
+    """
+    由紧凑用户表（或已加载的用户明细）生成付费时长分布数据并写入 output_path
+    """
+    day_hist, hour_hist = pay_time_counts(df)
+    return write_pay_time_data(day_hist, hour_hist, output_path)
+
+@timed('付费时长分布统计')
+def pay_time_counts(df):
+    """
+    统计付费时长的天分布（0-35天）和24小时内的小时分布，返回两个直方图（见 histograms.histogram）
+    直方图可以直接相加，分块读取时逐块合并
+    """
+    compact = ensure_compact(df)
     
     # 只保留有首次付费时间的用户
-    paid_df = df.dropna(subset=['首次付费时间']).copy()
-    paid_df['注册时间'] = pd.to_datetime(paid_df['注册时间'])
-    paid_df['首次付费时间'] = pd.to_datetime(paid_df['首次付费时间'])
-    
-    # 1. 所有付费用户：注册到付费时长分布（天）- 限制在35天
-    paid_df['付费时长_天'] = (paid_df['首次付费时间'] - paid_df['注册时间']).dt.days
-    
-    # 限制在35天内，超过35天的归为35天
-    paid_df['付费时长_天_限制'] = paid_df['付费时长_天'].clip(upper=35)
-    
-    # 生成0-35天的分布
-    day_bins = list(range(0, 36))  # 0,1,...,35
-    paid_df['付费时长区间_天'] = pd.cut(paid_df['付费时长_天_限制'], bins=day_bins, right=False, include_lowest=True)
-    day_dist = paid_df['付费时长区间_天'].value_counts().sort_index()
-    
-    # 生成数据格式
-    day_data = []
-    for i in range(35):
-        label = f"{i}-{i+1}天"
-        count = day_dist.get(i, 0)
-        day_data.append({
-            "range": label,
-            "count": int(count)
-        })
+    pay_delta = compact['pay_delta'].to_numpy()
+    pay_delta = pay_delta[pay_delta != NEVER]
     
+    # 1. 所有付费用户：注册到付费时长分布（天）
     # 2. 24小时内付费用户：注册到付费时长分布（小时）
-    paid_df['付费时长_小时'] = (paid_df['首次付费时间'] - paid_df['注册时间']).dt.total_seconds() / 3600
-    within_24h = paid_df[(paid_df['付费时长_小时'] >= 0) & (paid_df['付费时长_小时'] < 24)]
+    return histogram(pay_delta, DAY_HISTOGRAM), histogram(pay_delta, HOUR_HISTOGRAM)
+
+def merge_pay_time_counts(left, right):
+    """
+    合并两份 pay_time_counts 的结果
+    """
+    return tuple(merge_histograms(left_hist, right_hist) for left_hist, right_hist in zip(left, right))
+
+def write_pay_time_data(day_hist, hour_hist, output_path='../public/pay_time_data.json'):
+    """
+    由天/小时直方图生成网页展示用的JSON并写入 output_path
+    """
     
-    hour_bins = list(range(0, 25))
-    within_24h['付费时长区间_小时'] = pd.cut(within_24h['付费时长_小时'], bins=hour_bins, right=False, include_lowest=True)
-    hour_dist = within_24h['付费时长区间_小时'].value_counts().sort_index()
+    # 生成数据格式
+    day_data = [{"range": label, "count": count}
+                for label, count in zip(histogram_labels(day_hist), histogram_counts(day_hist))]
     
     # 生成小时数据格式
-    hour_data = []
-    for i in range(24):
-        label = f"{i}-{i+1}h"
-        count = hour_dist.get(i, 0)
-        hour_data.append({
-            "range": label,
-            "count": int(count)
-        })
+    hour_data = [{"range": label, "count": count}
+                 for label, count in zip(histogram_labels(hour_hist), histogram_counts(hour_hist))]
     
     # 创建输出数据结构
     pay_time_data = {
@@ -67,10 +79,9 @@ def generate_pay_time_data():
         }
     }
     
-    # 保存到JSON文件
-    output_path = '../public/pay_time_data.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(pay_time_data, f, ensure_ascii=False, indent=2)
+    # 发布为紧凑JSON及预压缩副本（原子写入，内容不变时不重写）
+    with stage('写入JSON'):
+        publish_json(pay_time_data, output_path)
     
     print(f"付费时长分布数据已生成并保存到: {output_path}")
     print(f"天分布数据点数量: {len(day_data)}")
@@ -79,4 +90,5 @@ def generate_pay_time_data():
     return pay_time_data
 
 if __name__ == "__main__":
-    generate_pay_time_data() 
\ No newline at end of file
+    with profile_run('generate_pay_time_data'):
+        generate_pay_time_data()
\ No newline at end of file
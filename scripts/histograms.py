@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+# 直方图引擎：时间差（秒）按区间宽度整除为整数分箱编号，再用 np.bincount 一次计数
+# 不生成逐行的 Interval 分类对象；负值计入 underflow，超出分箱范围的值按 overflow 方式处理：
+#   drop   不计入任何分箱（只记录个数）
+#   clip   计入最后一个分箱
+#   bucket 单独计入 “N+” 分箱
+# 计数结果可以直接相加（merge_histograms），分块读取和多进程统计时逐块合并
+
+UNIT_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+UNIT_SUFFIX = {'second': 's', 'minute': 'min', 'hour': 'h', 'day': '天'}
+OVERFLOW_MODES = ('drop', 'clip', 'bucket')
+# 未指定分箱数时按数据最大值自动确定，上限为 MAX_AUTO_BINS；超出上限的值计入 “N+” 分箱（非空时才输出）
+MAX_AUTO_BINS = 3660
+
+
+def histogram_spec(unit='day', width=1, bins=None, overflow='drop', scale='linear', base=2):
+    """
+    直方图分箱定义
+    unit/width: 分箱宽度为 width 个 unit（second/minute/hour/day）
+    bins: 分箱数，None 表示按数据最大值自动确定
+    overflow: 超出分箱范围的处理方式，见 OVERFLOW_MODES
+    scale: linear 等宽分箱；log 对数分箱，第0箱为 [0, 宽度)，第k箱为 [宽度*base^(k-1), 宽度*base^k)
+    """
+    if unit not in UNIT_SECONDS:
+        raise ValueError(f"不支持的时间单位: {unit}，可选: {', '.join(UNIT_SECONDS)}")
+    if overflow not in OVERFLOW_MODES:
+        raise ValueError(f"不支持的溢出方式: {overflow}，可选: {', '.join(OVERFLOW_MODES)}")
+    if scale not in ('linear', 'log'):
+        raise ValueError(f"不支持的分箱刻度: {scale}")
+    if scale == 'log' and bins is None:
+        raise ValueError("对数分箱需要指定分箱数")
+    return {'unit': unit, 'width': width, 'bins': bins, 'overflow': overflow, 'scale': scale, 'base': base}
+
+
+def bin_edges(spec, n_bins):
+    """
+    各分箱的左端点（以 unit 计），最后一项为最后一个分箱的右端点，长度 n_bins + 1
+    """
+    if spec['scale'] == 'log':
+        return np.concatenate([[0], spec['width'] * spec['base'] ** np.arange(n_bins, dtype='f8')])
+    return spec['width'] * np.arange(n_bins + 1)
+
+
+def _bin_index(deltas, spec, n_bins):
+    # 负值返回 -1；对数分箱用 searchsorted 查找右端点
+    step = spec['width'] * UNIT_SECONDS[spec['unit']]
+    if spec['scale'] == 'log':
+        edges = bin_edges(spec, n_bins)[1:] * UNIT_SECONDS[spec['unit']]
+        index = np.searchsorted(edges, deltas, side='right')
+    else:
+        index = np.floor_divide(deltas, step)
+    return np.where(deltas < 0, -1, index)
+
+
+def histogram(deltas, spec):
+    """
+    统计时间差（秒，整数或浮点数组）的直方图
+    返回 {'spec', 'counts': 各分箱计数, 'overflow': 超出范围的个数, 'underflow': 负值个数}；
+    overflow 为 bucket 时 “N+” 分箱的计数即 overflow，clip 时已并入最后一个分箱
+    """
+    deltas = np.asarray(deltas)
+    if deltas.dtype.kind == 'f':
+        deltas = deltas[~np.isnan(deltas)]
+    n_bins = spec['bins']
+    if n_bins is None:
+        top = int(np.floor_divide(deltas.max(), spec['width'] * UNIT_SECONDS[spec['unit']])) if len(deltas) else -1
+        n_bins = min(max(top + 1, 0), MAX_AUTO_BINS)
+    index = _bin_index(deltas, spec, n_bins)
+    underflow = int(np.count_nonzero(index < 0))
+    over = index >= n_bins
+    overflow = int(np.count_nonzero(over))
+    if spec['overflow'] == 'clip' and n_bins:
+        index = np.where(over, n_bins - 1, index)
+    counts = np.bincount(index[(index >= 0) & (index < n_bins)].astype('i8'), minlength=n_bins)[:n_bins]
+    return {'spec': spec, 'counts': counts, 'overflow': overflow, 'underflow': underflow}
+
+
+def merge_histograms(left, right):
+    """
+    合并两份相同分箱定义的直方图；自动分箱数不同时按较长的一份补齐
+    """
+    if left['spec'] != right['spec']:
+        raise ValueError("只能合并分箱定义相同的直方图")
+    n_bins = max(len(left['counts']), len(right['counts']))
+    counts = np.zeros(n_bins, dtype='i8')
+    counts[:len(left['counts'])] += left['counts']
+    counts[:len(right['counts'])] += right['counts']
+    return {
+        'spec': left['spec'],
+        'counts': counts,
+        'overflow': left['overflow'] + right['overflow'],
+        'underflow': left['underflow'] + right['underflow'],
+    }
+
+
+def _format_edge(value):
+    return f"{value:g}"
+
+
+def _has_bucket(hist):
+    spec = hist['spec']
+    return spec['overflow'] == 'bucket' or (spec['bins'] is None and hist['overflow'] > 0)
+
+
+def histogram_labels(hist):
+    """
+    分箱标签，如 0-1天、0-1h、0-5min；有 “N+” 分箱时最后追加如 35天+
+    """
+    spec = hist['spec']
+    suffix = UNIT_SUFFIX[spec['unit']]
+    edges = bin_edges(spec, len(hist['counts']))
+    labels = [f"{_format_edge(lo)}-{_format_edge(hi)}{suffix}" for lo, hi in zip(edges[:-1], edges[1:])]
+    if _has_bucket(hist):
+        labels.append(f"{_format_edge(edges[-1])}{suffix}+")
+    return labels
+
+
+def histogram_counts(hist):
+    """
+    各分箱计数（Python int 列表），有 “N+” 分箱时最后追加其计数
+    """
+    counts = [int(count) for count in hist['counts']]
+    if _has_bucket(hist):
+        counts.append(hist['overflow'])
+    return counts
+
+
+def histogram_frame(hist, label_column, count_column='频数'):
+    """
+    直方图转换为两列的 DataFrame（区间标签、频数），用于写入Excel
+    """
+    return pd.DataFrame({label_column: histogram_labels(hist), count_column: histogram_counts(hist)})
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+from array_store import load_compact_table
+from excel_report import report_sheet, write_report
+from profiling import profile_run, stage
+
+# 基于登录事件日志的真实N日留存：
+# 每个用户一行位图，第n位表示注册后第n天（按自然日，注册当天为第0天）有登录，
+# 内存为 用户数 × ceil(观察天数/64) × 8 字节，与事件条数无关（90天观察期每用户16字节）
+# 事件分块读入后按位或写入位图，同一天的多次登录只占一位
+# 选择定长稠密位图而不是按活跃天数伸缩的稀疏集合（有序的 (用户, 天) 编码数组或 roaring 式压缩位集）：
+# 稀疏编码每个活跃天至少2字节（roaring 数组容器）或8字节（int64 编码），90天观察期下
+# 用户平均活跃超过约2天（int64）/ 8天（roaring）时稠密位图更小，且写入和按周汇总都是整块向量运算；
+# 代价是从不登录的用户同样占16字节，观察期很长而用户普遍不活跃时内存会高于稀疏方案
+
+# 登录事件日志的列名
+EVENT_USER_COLUMN = 'user_id'
+EVENT_TIME_COLUMN = 'timestamp'
+# 默认观察注册后90天（第0-89天）
+DEFAULT_HORIZON_DAYS = 90
+# 事件日志每块读取的行数
+DEFAULT_EVENT_CHUNK_SIZE = 5000000
+# 计算留存矩阵时每次展开为逐日布尔矩阵的用户数，控制峰值内存
+MATRIX_BLOCK_USERS = 1 << 20
+_WORD_BITS = 64
+
+
+def new_activity_bitmap(compact, horizon_days=DEFAULT_HORIZON_DAYS):
+    """
+    由紧凑用户表（需要 user_id 列）建立空的用户×天活跃位图
+    用户按注册周、注册日排序存放，同一注册周的用户连续，便于按周汇总；
+    同一用户ID重复出现时只保留最早注册的一行
+    """
+    if 'user_id' not in compact.columns:
+        raise ValueError("用户表缺少用户ID列，无法与登录事件关联")
+    # 注册周由注册日决定，按注册日排序即同时按周排序
+    users = (compact[['user_id', 'reg_day', 'week']]
+             .sort_values('reg_day', kind='stable')
+             .drop_duplicates('user_id'))
+    n_words = -(-horizon_days // _WORD_BITS)
+    return {
+        'horizon': horizon_days,
+        'user_index': pd.Index(users['user_id'].to_numpy()),
+        'reg_day': users['reg_day'].to_numpy(dtype='i8'),
+        'week': users['week'].to_numpy(dtype='i8'),
+        'bits': np.zeros((len(users), n_words), dtype='u8'),
+        'events': 0,
+        'matched_events': 0,
+        'last_event_day': None,
+    }
+
+
+def add_login_events(bitmap, user_ids, days):
+    """
+    把一批登录事件（用户ID、1970-01-01起的天数）按位或写入位图，返回落在观察期内的事件数
+    未知用户、注册前和超出观察期的事件不计入位图，但会参与观察截止日（最后事件日）的计算
+    """
+    days = np.asarray(days, dtype='i8')
+    bitmap['events'] += len(days)
+    if len(days) == 0:
+        return 0
+    last_day = int(days.max())
+    if bitmap['last_event_day'] is None or last_day > bitmap['last_event_day']:
+        bitmap['last_event_day'] = last_day
+
+    index = bitmap['user_index'].get_indexer(user_ids)
+    known = index >= 0
+    index, days = index[known], days[known]
+    offset = days - bitmap['reg_day'][index]
+    inside = (offset >= 0) & (offset < bitmap['horizon'])
+    index, offset = index[inside], offset[inside]
+
+    n_words = bitmap['bits'].shape[1]
+    flat = index * n_words + offset // _WORD_BITS
+    bits = np.left_shift(np.uint64(1), (offset % _WORD_BITS).astype('u8'))
+    np.bitwise_or.at(bitmap['bits'].reshape(-1), flat, bits)
+    bitmap['matched_events'] += len(offset)
+    return len(offset)
+
+
+def _event_days(times):
+    # 时间列转换为1970-01-01起的天数，无法解析的时间为 NaT 并被丢弃
+    times = pd.to_datetime(pd.Series(times), errors='coerce').to_numpy(dtype='datetime64[ns]')
+    valid = ~np.isnat(times)
+    return valid, times[valid].astype('datetime64[D]').astype('i8')
+
+
+def _event_batches(file_path, chunk_size, user_column, time_column):
+    # 优先用pyarrow流式读取（CSV的时间列由pyarrow直接解析），未安装时退化为pandas分块读取
+    try:
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+    except ImportError:
+        if file_path.lower().endswith('.parquet'):
+            raise
+        for chunk in pd.read_csv(file_path, usecols=[user_column, time_column], chunksize=chunk_size):
+            yield chunk[user_column].to_numpy(), chunk[time_column].to_numpy()
+        return
+
+    if file_path.lower().endswith('.parquet'):
+        batches = pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=[user_column, time_column])
+    else:
+        # 按每行约40字节估算块大小
+        batches = pa_csv.open_csv(file_path, read_options=pa_csv.ReadOptions(block_size=max(chunk_size * 40, 1 << 20)),
+                                  convert_options=pa_csv.ConvertOptions(include_columns=[user_column, time_column]))
+    for batch in batches:
+        yield (batch.column(user_column).to_numpy(zero_copy_only=False),
+               batch.column(time_column).to_numpy(zero_copy_only=False))
+
+
+def iter_login_events(file_path, chunk_size=DEFAULT_EVENT_CHUNK_SIZE, user_column=EVENT_USER_COLUMN,
+                      time_column=EVENT_TIME_COLUMN):
+    """
+    分块读取登录事件日志（.csv 或 .parquet），逐块产出 (用户ID数组, 登录日数组)
+    只读取用户ID和时间两列，无法解析的时间被丢弃
+    """
+    for user_ids, times in _event_batches(file_path, chunk_size, user_column, time_column):
+        valid, days = _event_days(times)
+        yield user_ids[valid], days
+
+
+def build_activity_bitmap(compact, event_path, horizon_days=DEFAULT_HORIZON_DAYS,
+                          chunk_size=DEFAULT_EVENT_CHUNK_SIZE, user_column=EVENT_USER_COLUMN,
+                          time_column=EVENT_TIME_COLUMN):
+    """
+    由紧凑用户表和登录事件日志建立用户×天活跃位图，事件日志分块流式读取
+    """
+    bitmap = new_activity_bitmap(compact, horizon_days)
+    with stage('读取登录事件并写入位图') as record:
+        for user_ids, days in iter_login_events(event_path, chunk_size, user_column, time_column):
+            add_login_events(bitmap, user_ids, days)
+        record['rows'] = bitmap['events']
+    return bitmap
+
+
+def retention_matrices(bitmap, observed_until=None, block_users=MATRIX_BLOCK_USERS):
+    """
+    按注册周计算留存矩阵（行：注册周，列：注册后第0..horizon-1天）：
+    classic[w, n]  第n天有登录的用户数（经典N日留存）
+    rolling[w, n]  第n天及以后有登录的用户数（滚动/回访留存）
+    mature[w, n]   该周最后一个注册日的第n天不晚于观察截止日，即该格数据完整
+    observed_until 默认取事件中的最后一天
+    位图按用户分块展开为逐日布尔矩阵（np.unpackbits），每块内按周用 reduceat 求和，
+    滚动留存由每个用户最后活跃日的直方图逆序累加得到
+    """
+    horizon = bitmap['horizon']
+    week, bits = bitmap['week'], bitmap['bits']
+    weeks, week_starts = np.unique(week, return_index=True)
+    code = np.searchsorted(weeks, week)
+    classic = np.zeros((len(weeks), horizon), dtype='i8')
+    last_active = np.zeros(len(weeks) * horizon, dtype='i8')
+
+    with stage('计算留存矩阵', rows=len(week)):
+        for start in range(0, len(week), block_users):
+            stop = min(start + block_users, len(week))
+            # 按小端字节序展开：第w个字的第i位对应第 w*64+i 天
+            active = np.unpackbits(bits[start:stop].astype('<u8').view('u1'), axis=1, bitorder='little')[:, :horizon]
+            block_code = code[start:stop]
+            segments = np.flatnonzero(np.r_[True, block_code[1:] != block_code[:-1]])
+            classic[block_code[segments]] += np.add.reduceat(active, segments, axis=0, dtype='i8')
+
+            seen = active.any(axis=1)
+            last_day = horizon - 1 - np.argmax(active[seen, ::-1], axis=1)
+            last_active += np.bincount(block_code[seen] * horizon + last_day, minlength=len(last_active))
+
+    rolling = np.cumsum(last_active.reshape(len(weeks), horizon)[:, ::-1], axis=1)[:, ::-1]
+    if observed_until is None:
+        observed_until = bitmap['last_event_day']
+    week_ends = np.r_[week_starts[1:], len(week)] - 1
+    last_reg_day = bitmap['reg_day'][week_ends] if len(week) else np.empty(0, dtype='i8')
+    if observed_until is None:
+        mature = np.zeros(classic.shape, dtype=bool)
+    else:
+        mature = last_reg_day[:, None] + np.arange(horizon)[None, :] <= observed_until
+    return {
+        'weeks': weeks,
+        'cohort_sizes': np.bincount(code, minlength=len(weeks)),
+        'classic': classic,
+        'rolling': rolling,
+        'mature': mature,
+    }
+
+
+def retention_rate_frame(matrices, kind='classic', days=None):
+    """
+    留存矩阵转换为留存率表：自然周（周一日期）、注册人数、D0..Dn 留存率，数据不完整的格为空
+    kind: classic / rolling；days: 只输出指定的天（如 [1, 3, 7, 14, 30, 60]），默认全部
+    """
+    counts = matrices[kind]
+    days = list(range(counts.shape[1])) if days is None else [day for day in days if day < counts.shape[1]]
+    monday = pd.to_datetime((matrices['weeks'] * 7 - 3).astype('datetime64[D]'))
+    frame = pd.DataFrame({'自然周': monday.strftime('%Y-%m-%d'), '注册人数': matrices['cohort_sizes']})
+    rates = counts[:, days] / np.maximum(matrices['cohort_sizes'], 1)[:, None]
+    rates = np.where(matrices['mature'][:, days], rates, np.nan)
+    for i, day in enumerate(days):
+        frame[f'D{day}'] = rates[:, i]
+    return frame
+
+
+def analyze_login_retention(user_file='../data/3月以来的付费用户情况.xlsx', event_file='../data/login_events.csv',
+                            output_path='登录留存矩阵.xlsx', horizon_days=DEFAULT_HORIZON_DAYS,
+                            chunk_size=DEFAULT_EVENT_CHUNK_SIZE):
+    """
+    由用户导出和登录事件日志计算按注册周的经典N日留存和滚动留存矩阵，写入Excel的两个工作表
+    返回 (经典留存率表, 滚动留存率表)
+    """
+    compact = load_compact_table(user_file)
+    bitmap = build_activity_bitmap(compact, event_file, horizon_days, chunk_size)
+    print(f"登录事件: {bitmap['events']} 条，关联到用户且在观察期内: {bitmap['matched_events']} 条")
+    print(f"位图: {len(bitmap['user_index'])} 个用户 × {horizon_days} 天，占用 {bitmap['bits'].nbytes / 2 ** 20:.1f} MB")
+
+    matrices = retention_matrices(bitmap)
+    classic = retention_rate_frame(matrices, 'classic')
+    rolling = retention_rate_frame(matrices, 'rolling')
+    write_report(output_path, [
+        report_sheet('经典N日留存', classic),
+        report_sheet('滚动留存', rolling),
+    ])
+    print(f"登录留存矩阵已保存到: {output_path}")
+    return classic, rolling
+
+
+if __name__ == "__main__":
+    with profile_run('analyze_login_retention'):
+        analyze_login_retention()
@@ -0,0 +1,171 @@
+import os
+import numpy as np
+import pandas as pd
+from compact_schema import USER_ID_COLUMN
+from data_loader import load_user_data
+from profiling import stage
+
+# 合并多份有重叠用户的导出为一张规范用户表：
+# 所有导出按给定顺序（旧 -> 新）拼接后，用 pd.factorize 对用户ID建哈希索引，每行得到用户编号；
+# 每列按合并规则用 ufunc.at 一次归并到用户编号上，总耗时与总行数成线性关系，不排序
+#   last   最后一个非空值（后给出的导出覆盖先给出的）
+#   first  第一个非空值
+#   min    最小值（如首次付费时间取最早的一次）
+#   max    最大值（如最后登录时间取最晚的一次）
+# 没有用户ID的行无法去重，原样保留
+
+MERGE_RULES = ('last', 'first', 'min', 'max')
+# 各列的默认合并规则，未列出的列为 last
+DEFAULT_MERGE_RULES = {
+    '注册时间': 'min',
+    '首次付费时间': 'min',
+    '最后登录时间': 'max',
+}
+
+
+def _fold_positions(codes, valid, n_users, rule):
+    # 每个用户取 valid 行中第一个/最后一个的行号，没有有效行的用户为 -1
+    rows = np.flatnonzero(valid)
+    if rule == 'last':
+        positions = np.full(n_users, -1, dtype='i8')
+        np.maximum.at(positions, codes[rows], rows)
+    else:
+        positions = np.full(n_users, len(codes), dtype='i8')
+        np.minimum.at(positions, codes[rows], rows)
+        positions[positions == len(codes)] = -1
+    return positions
+
+
+def _fold_extreme(values, codes, valid, n_users, rule):
+    # 数值/时间列按用户取最小值或最大值，返回 (结果数组, 用户是否有有效值)
+    numbers = values.view('i8') if values.dtype.kind == 'M' else values
+    if rule == 'min':
+        result = np.full(n_users, np.iinfo('i8').max if numbers.dtype.kind in 'iM' else np.inf, dtype=numbers.dtype)
+        np.minimum.at(result, codes[valid], numbers[valid])
+    else:
+        result = np.full(n_users, np.iinfo('i8').min if numbers.dtype.kind in 'iM' else -np.inf, dtype=numbers.dtype)
+        np.maximum.at(result, codes[valid], numbers[valid])
+    has_value = np.bincount(codes[valid], minlength=n_users) > 0
+    return (result.view(values.dtype) if values.dtype.kind == 'M' else result), has_value
+
+
+def merge_column(series, codes, n_users, rule):
+    """
+    按用户编号合并一列，返回长度为 n_users 的 Series（索引为用户编号）；用户在该列没有非空值时为空
+    """
+    if rule not in MERGE_RULES:
+        raise ValueError(f"不支持的合并规则: {rule}，可选: {', '.join(MERGE_RULES)}")
+    valid = series.notna().to_numpy()
+    values = series.to_numpy()
+    if rule in ('min', 'max') and values.dtype.kind in 'iufM':
+        result, has_value = _fold_extreme(values, codes, valid, n_users, rule)
+        merged = pd.Series(result, dtype=series.dtype)
+        return merged.where(has_value)
+    if rule in ('min', 'max'):
+        # 非数值列（如文本格式的时间）退化为 pandas 分组，仍为哈希分组、线性时间
+        grouped = series[valid].groupby(codes[valid])
+        return (grouped.min() if rule == 'min' else grouped.max()).reindex(range(n_users))
+    positions = _fold_positions(codes, valid, n_users, rule)
+    merged = series.iloc[np.maximum(positions, 0)].reset_index(drop=True)
+    return merged.where(positions >= 0)
+
+
+def merge_user_frames(frames, rules=None, user_id_column=USER_ID_COLUMN):
+    """
+    合并多份用户明细（按旧 -> 新的顺序给出）为每个用户一行的规范用户表
+    rules: {列名: 合并规则}，覆盖 DEFAULT_MERGE_RULES，未指定的列为 last
+    返回 (合并后的 DataFrame, 合并报告)；用户按首次出现的顺序排列，没有用户ID的行追加在最后
+    报告包括：总行数、用户数、重复行数（同一用户的第二行及以后）、
+    被后续导出更新的用户数，以及各列值被更新（该用户第一行有值，合并结果与之不同）的用户数；
+    第一行为空、由其他行补上的值记为填充，单独统计
+    """
+    rules = {**DEFAULT_MERGE_RULES, **(rules or {})}
+    with stage('合并去重导出') as record:
+        merged, report = _merge_frames(pd.concat(frames, ignore_index=True, sort=False), rules, user_id_column)
+        record['rows'] = report['输入行数']
+    return merged, report
+
+
+def _merge_frames(combined, rules, user_id_column):
+    columns = list(combined.columns)
+    if user_id_column not in combined.columns:
+        raise ValueError(f"导出缺少用户ID列: {user_id_column}")
+
+    codes, uniques = pd.factorize(combined[user_id_column])
+    keyed = codes >= 0
+    n_users = len(uniques)
+    key_codes = codes[keyed]
+    keyed_rows = combined[keyed].reset_index(drop=True)
+    first_rows = _fold_positions(key_codes, np.ones(len(key_codes), dtype=bool), n_users, 'first')
+
+    merged = pd.DataFrame({user_id_column: keyed_rows[user_id_column].iloc[first_rows].to_numpy()})
+    updated = np.zeros(n_users, dtype=bool)
+    filled = np.zeros(n_users, dtype=bool)
+    column_updates = {}
+    column_fills = {}
+    for column in columns:
+        if column == user_id_column:
+            continue
+        with stage(f'合并列: {column}', rows=len(keyed_rows)):
+            values = merge_column(keyed_rows[column], key_codes, n_users, rules.get(column, 'last'))
+        first_values = keyed_rows[column].iloc[first_rows].reset_index(drop=True)
+        present = values.notna() & first_values.notna()
+        changed = (values.ne(first_values) & present).to_numpy()
+        fill = (values.notna() & first_values.isna()).to_numpy()
+        column_updates[column] = int(changed.sum())
+        column_fills[column] = int(fill.sum())
+        updated |= changed
+        filled |= fill
+        merged[column] = values.to_numpy()
+
+    unkeyed = combined[~keyed]
+    if len(unkeyed):
+        merged = pd.concat([merged, unkeyed[columns]], ignore_index=True)
+    report = {
+        '输入行数': len(combined),
+        '合并后行数': len(merged),
+        '用户数': n_users,
+        '无用户ID行数': int(len(unkeyed)),
+        '重复行数': int(len(key_codes) - n_users),
+        '更新用户数': int(updated.sum()),
+        '各列更新用户数': column_updates,
+        '填充用户数': int(filled.sum()),
+        '各列填充用户数': column_fills,
+    }
+    return merged[columns], report
+
+
+def merge_user_exports(file_paths, output_path=None, rules=None, user_id_column=USER_ID_COLUMN):
+    """
+    读取多个用户导出（按旧 -> 新给出）并合并去重，指定 output_path（.csv/.xlsx）时写出合并结果
+    返回 (合并后的 DataFrame, 合并报告)
+    """
+    frames = []
+    for path in file_paths:
+        with stage(f'读取: {os.path.basename(path)}'):
+            frames.append(load_user_data(path))
+    merged, report = merge_user_frames(frames, rules, user_id_column)
+    report['各文件行数'] = {os.path.basename(path): len(frame) for path, frame in zip(file_paths, frames)}
+
+    if output_path:
+        # 临时文件保留扩展名，pandas 据此选择写出格式
+        root, extension = os.path.splitext(output_path)
+        tmp_path = f'{root}.tmp{extension}'
+        with stage('写入合并结果', rows=len(merged)):
+            if output_path.lower().endswith('.csv'):
+                merged.to_csv(tmp_path, index=False)
+            else:
+                merged.to_excel(tmp_path, index=False)
+            os.replace(tmp_path, output_path)
+        print(f"合并结果已保存到: {output_path}")
+
+    print(f"输入 {report['输入行数']} 行，合并为 {report['合并后行数']} 行（{report['用户数']} 个用户），"
+          f"重复 {report['重复行数']} 行，被更新的用户 {report['更新用户数']} 个，"
+          f"被补全空值的用户 {report['填充用户数']} 个")
+    for column, count in report['各列更新用户数'].items():
+        if count:
+            print(f"  {column}: {count} 个用户的值被更新")
+    for column, count in report['各列填充用户数'].items():
+        if count:
+            print(f"  {column}: {count} 个用户的空值被补全")
+    return merged, report
@@ -0,0 +1,158 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from array_store import mapped_file
+from cohort_engine import DEFAULT_HORIZONS, cohort_histogram, compute_cohort_counts, counts_from_histogram
+from retention import DEFAULT_RETENTION_THRESHOLDS, merge_retention_partials, retention_partials
+
+# 每个分片至少的行数，数据量太小时进程启动和拷贝的开销超过计算本身，直接走串行
+MIN_SHARD_ROWS = 100000
+
+
+def default_workers():
+    """
+    默认进程数：本机CPU核数
+    """
+    return os.cpu_count() or 1
+
+
+def shard_row_bounds(reg_day, n_shards):
+    """
+    按行数把已按注册日升序排列的用户均分为 n_shards 段，分段边界对齐到注册日变化处，
+    保证同一注册日的用户只落在一个分片里
+    返回 [(起始行, 结束行)]，结束行不含
+    """
+    targets = np.linspace(0, len(reg_day), n_shards + 1).astype('i8')[1:-1]
+    cuts = np.searchsorted(reg_day, reg_day[targets], side='left')
+    bounds = np.unique(np.concatenate([[0], cuts, [len(reg_day)]]))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _release(blocks, unlink=False):
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
+
+
+def _share_columns(compact, columns):
+    """
+    把紧凑用户表的若干整数列按注册日排序后拷贝到共享内存；
+    已按注册日排序且来自派生数组文件映射（见 array_store）的列不再拷贝，子进程直接映射同一文件
+    返回 (共享内存块列表, 列描述 {列名: (类型, 位置, dtype, 行数)})，子进程凭列描述直接映射，不经过pickle
+    类型为 'shm' 时位置是共享内存名，为 'file' 时位置是 (文件路径, 字节偏移)
+    """
+    reg_day = compact['reg_day'].to_numpy()
+    # 导出通常已按注册时间排序，此时省去排序
+    order = None if np.all(reg_day[1:] >= reg_day[:-1]) else np.argsort(reg_day, kind='stable')
+
+    blocks = []
+    spec = {}
+    try:
+        for column in columns:
+            values = compact[column].to_numpy()
+            location = mapped_file(values) if order is None else None
+            if location is not None:
+                spec[column] = ('file', location, values.dtype.str, len(values))
+                continue
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            blocks.append(block)
+            target = np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+            if order is None:
+                target[:] = values
+            else:
+                np.take(values, order, out=target)
+            del target
+            spec[column] = ('shm', block.name, values.dtype.str, len(values))
+    except Exception:
+        _release(blocks, unlink=True)
+        raise
+    return blocks, spec
+
+
+def _attach_columns(spec, start, stop):
+    """
+    子进程按列描述映射共享内存或派生数组文件，返回 (共享内存块列表, {列名: 本分片的零拷贝视图})
+    """
+    blocks = []
+    columns = {}
+    for column, (kind, location, dtype, length) in spec.items():
+        if kind == 'file':
+            path, offset = location
+            columns[column] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length,))[start:stop]
+            continue
+        block = shared_memory.SharedMemory(name=location)
+        blocks.append(block)
+        columns[column] = np.ndarray(length, dtype=dtype, buffer=block.buf)[start:stop]
+    return blocks, columns
+
+
+def _cohort_shard(spec, start, stop, horizons):
+    blocks, columns = _attach_columns(spec, start, stop)
+    try:
+        return cohort_histogram(columns['reg_day'], columns['pay_delta'], horizons)
+    finally:
+        del columns
+        _release(blocks)
+
+
+def _retention_shard(spec, start, stop, thresholds):
+    blocks, columns = _attach_columns(spec, start, stop)
+    try:
+        return retention_partials(pd.DataFrame(columns, copy=False), thresholds)
+    finally:
+        del columns
+        _release(blocks)
+
+
+def _map_shards(compact, columns, task, workers, task_args=(), min_shard_rows=MIN_SHARD_ROWS):
+    """
+    按注册日期分片，在进程池中对每个分片执行 task(列描述, 起始行, 结束行, *task_args)
+    返回按注册日期升序排列的各分片结果；分片数不足2时返回 None，由调用方走串行
+    """
+    workers = workers or default_workers()
+    n_shards = min(workers, len(compact) // max(min_shard_rows, 1))
+    if n_shards <= 1:
+        return None
+
+    blocks, spec = _share_columns(compact, columns)
+    try:
+        attached, sorted_columns = _attach_columns({'reg_day': spec['reg_day']}, 0, None)
+        bounds = shard_row_bounds(sorted_columns['reg_day'], n_shards)
+        del sorted_columns
+        _release(attached)
+        with ProcessPoolExecutor(max_workers=min(workers, len(bounds))) as pool:
+            futures = [pool.submit(task, spec, start, stop, *task_args) for start, stop in bounds]
+            return [future.result() for future in futures]
+    finally:
+        _release(blocks, unlink=True)
+
+
+def parallel_cohort_counts(compact, horizons=DEFAULT_HORIZONS, workers=None, min_shard_rows=MIN_SHARD_ROWS):
+    """
+    多进程计算按注册日期的转化计数，结果与 compute_cohort_counts 完全一致
+    各分片的注册日互不重叠，按分片顺序拼接直方图即为整表结果
+    workers: 进程数，默认CPU核数
+    """
+    parts = _map_shards(compact, ['reg_day', 'pay_delta'], _cohort_shard, workers, (horizons,), min_shard_rows)
+    if parts is None:
+        return compute_cohort_counts(compact, horizons)
+    days, reg_counts, hists = zip(*parts)
+    return counts_from_histogram(np.concatenate(days), np.concatenate(reg_counts), np.concatenate(hists), horizons)
+
+
+def parallel_retention_partials(compact, thresholds=DEFAULT_RETENTION_THRESHOLDS, workers=None,
+                                min_shard_rows=MIN_SHARD_ROWS):
+    """
+    多进程计算留存部分聚合，结果与 retention_partials 完全一致
+    跨分片的同一注册周由 merge_retention_partials 合并
+    workers: 进程数，默认CPU核数
+    """
+    columns = ['reg_day', 'pay_delta', 'login_delta', 'week']
+    parts = _map_shards(compact, columns, _retention_shard, workers, (thresholds,), min_shard_rows)
+    if parts is None:
+        return retention_partials(compact, thresholds)
+    return reduce(merge_retention_partials, parts)
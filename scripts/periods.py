@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from compact_schema import dates_to_days, days_to_dates
+from quantiles import EXACT_LIMIT, DEFAULT_EPSILON, group_quantiles
+
+# 固定长度的周期（天）
+PERIOD_DAYS = {'weekly': 7, 'biweekly': 14}
+# 周/双周周期默认的对齐锚点：1970-01-05 是周一，即周期从周一开始
+DEFAULT_WEEK_ANCHOR = '1970-01-05'
+# 默认取数据范围内最近11个完整自然周
+DEFAULT_PERIOD_SPEC = {'freq': 'weekly', 'count': 11, 'anchor': None}
+
+
+def to_epoch_day(value):
+    """
+    日期（字符串、date、Timestamp）换算为1970-01-01起的天数
+    """
+    return int(pd.Timestamp(value).to_datetime64().astype('datetime64[D]').astype('i8'))
+
+
+def _month_boundaries(first_day, last_day, anchor):
+    # 月度周期从锚点日期的“日”开始，逐月推进（月末日期由pandas自动截断到当月最后一天）
+    anchor = pd.Timestamp(anchor) if anchor else pd.Timestamp('1970-01-01')
+    first = pd.Timestamp(days_to_dates([first_day])[0])
+    last = pd.Timestamp(days_to_dates([last_day])[0])
+    start_offset = (first.year - anchor.year) * 12 + (first.month - anchor.month) - 1
+    end_offset = (last.year - anchor.year) * 12 + (last.month - anchor.month) + 2
+    return np.array([to_epoch_day(anchor + pd.DateOffset(months=k)) for k in range(start_offset, end_offset)])
+
+
+def generate_periods(first_day, last_day, freq='weekly', anchor=None, count=None):
+    """
+    在 [first_day, last_day]（1970-01-01起的天数，含端点）范围内生成完整周期，
+    落在数据范围外或只覆盖一部分的周期会被丢弃
+
+    freq: weekly / biweekly / monthly
+    anchor: 周期对齐的任意日期；周/双周默认从周一开始，月度默认每月1日开始
+    count: 只保留最近的 count 个周期，None 表示全部
+    返回 DataFrame，列：label（如 0623-0629）、start、end（天数，含端点），按时间升序
+    """
+    if freq in PERIOD_DAYS:
+        length = PERIOD_DAYS[freq]
+        anchor_day = to_epoch_day(anchor or DEFAULT_WEEK_ANCHOR)
+        # 第一个不早于 first_day 的周期起点
+        first_start = anchor_day + -((anchor_day - first_day) // length) * length
+        starts = np.arange(first_start, last_day - length + 2, length, dtype='i8')
+        ends = starts + length - 1
+    elif freq == 'monthly':
+        boundaries = _month_boundaries(first_day, last_day, anchor)
+        starts = boundaries[:-1]
+        ends = boundaries[1:] - 1
+        complete = (starts >= first_day) & (ends <= last_day)
+        starts, ends = starts[complete], ends[complete]
+    else:
+        raise ValueError(f"不支持的周期类型: {freq}")
+
+    if count is not None:
+        starts, ends = starts[-count:], ends[-count:]
+    start_dates = pd.to_datetime(starts.astype('datetime64[D]'))
+    end_dates = pd.to_datetime(ends.astype('datetime64[D]'))
+    return pd.DataFrame({
+        'label': np.asarray(start_dates.strftime('%m%d') + '-' + end_dates.strftime('%m%d'), dtype=object),
+        'start': starts,
+        'end': ends,
+    })
+
+
+def resolve_periods(days, period_spec=None):
+    """
+    按周期配置在数据实际覆盖的日期范围上生成周期
+    days: 数据中出现的日期（天数数组）
+    period_spec: {'freq', 'count', 'anchor'}，缺省项取 DEFAULT_PERIOD_SPEC
+    """
+    spec = dict(DEFAULT_PERIOD_SPEC, **(period_spec or {}))
+    days = np.asarray(days)
+    if len(days) == 0:
+        return generate_periods(0, -1, spec['freq'], spec['anchor'], spec['count'])
+    return generate_periods(int(days.min()), int(days.max()), spec['freq'], spec['anchor'], spec['count'])
+
+
+def assign_periods(days, periods):
+    """
+    一次 searchsorted 把每个日期分配到所属周期，返回周期下标，不属于任何周期为 -1
+    """
+    days = np.asarray(days)
+    if len(periods) == 0:
+        return np.full(len(days), -1)
+    starts = periods['start'].to_numpy()
+    ends = periods['end'].to_numpy()
+    index = np.searchsorted(starts, days, side='right') - 1
+    inside = (index >= 0) & (days <= ends[np.maximum(index, 0)])
+    return np.where(inside, index, -1)
+
+
+def period_quantiles(table, days, periods, columns, qs, exact_limit=EXACT_LIMIT, epsilon=DEFAULT_EPSILON):
+    """
+    按周期计算各列的分位数：每个周期的样本不超过 exact_limit 时精确计算，否则用草图近似（见 quantiles）
+    table: 每行一个日期的结果表；days: 对应行的日期（天数）；各列的空值被忽略
+    返回 {列名: 形状为 (周期数, len(qs)) 的数组}，按 periods 顺序排列，没有数据的周期为 NaN
+    """
+    index = assign_periods(days, periods)
+    result = {}
+    for column in columns:
+        # 空值（如尚未成熟的转化率）不参与分位数计算
+        values = table[column].to_numpy(dtype='f8')
+        groups = np.where(np.isnan(values), -1, index)
+        result[column] = group_quantiles(values, groups, len(periods), qs, exact_limit, epsilon)
+    return result
+
+
+def period_medians(table, days, periods, columns):
+    """
+    按周期计算各列中位数
+    返回按 periods 顺序排列的 DataFrame，没有数据的周期为 NaN
+    """
+    values = period_quantiles(table, days, periods, columns, [0.5])
+    return pd.DataFrame({column: values[column][:, 0] for column in columns}, columns=columns)
+
+
+def _none_for_nan(values):
+    return [None if pd.isna(value) else value for value in values]
+
+
+def cohort_period_medians(results_df, columns, period_spec=None):
+    """
+    按注册日期的转化明细在数据实际范围上划分周期，并计算各列的周期中位数
+    返回 (周期标签列表, {列名: 中位数列表})，没有数据的周期为 None
+    """
+    labels, values = cohort_period_quantiles(results_df, columns, [0.5], period_spec)
+    return labels, {column: values[column][0.5] for column in columns}
+
+
+def cohort_period_quantiles(results_df, columns, qs, period_spec=None, exact_limit=EXACT_LIMIT,
+                            epsilon=DEFAULT_EPSILON):
+    """
+    与 cohort_period_medians 相同的周期划分，计算任意分位数（如 P25/P75/P90 趋势带）
+    样本超过 exact_limit 的周期用秩误差不超过 epsilon 的草图近似（见 period_quantiles）
+    返回 (周期标签列表, {列名: {分位数: 各周期数值列表}})，没有数据的周期为 None
+    """
+    days = dates_to_days(results_df['注册日期'])
+    periods = resolve_periods(days, period_spec)
+    values = period_quantiles(results_df, days, periods, columns, qs, exact_limit, epsilon)
+    return periods['label'].tolist(), {
+        column: {q: _none_for_nan(values[column][:, i]) for i, q in enumerate(qs)}
+        for column in columns
+    }
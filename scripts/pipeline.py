@@ -0,0 +1,129 @@
+import os
+import sys
+import pandas as pd
+from array_store import load_compact_table
+from data_loader import CACHE_DIR_NAME
+from profiling import TIMINGS_DIR, profile_run, stage
+from calculate_conversion_rates import calculate_conversion_rates_from_frame
+from generate_conversion_trend_data import generate_conversion_trend_data_from_frame
+from generate_pay_time_charts import generate_pay_time_data_from_frame
+from retention_analysis import analyze_retention_from_frame
+from survival_analysis import analyze_survival_from_frame
+
+# 看板产物定义：产物名 -> (输入文件, 输出目录类型, 输出文件名, 分析函数)
+ARTIFACTS = {
+    'conversion_trend': ('3月以来的付费用户情况.xlsx', 'public', 'conversion_trend_data.json',
+                         generate_conversion_trend_data_from_frame),
+    'pay_time': ('Result_10.xlsx', 'public', 'pay_time_data.json',
+                 generate_pay_time_data_from_frame),
+    'retention': ('3月以来的付费用户情况.xlsx', 'report', '付费用户留存分析.xlsx',
+                  analyze_retention_from_frame),
+    'conversion_rates': ('Result_10.xlsx', 'report', 'conversion_rates_detailed.xlsx',
+                         calculate_conversion_rates_from_frame),
+    'survival': ('Result_10.xlsx', 'report', '付费生存分析.xlsx',
+                 analyze_survival_from_frame),
+}
+
+# 支持增量模式的产物（按注册日的转化队列）
+INCREMENTAL_ARTIFACTS = {'conversion_trend', 'conversion_rates'}
+# 输出分时间段中位数的产物
+PERIOD_ARTIFACTS = {'conversion_trend', 'conversion_rates'}
+# 支持多进程分片计算的产物
+PARALLEL_ARTIFACTS = {'conversion_trend', 'conversion_rates', 'retention'}
+# 报告中带有可选图表模式（PNG/原生图表/图表描述JSON）的产物
+CHART_ARTIFACTS = {'conversion_rates'}
+
+
+def dependent_artifacts(sources, artifacts=None):
+    """
+    依赖给定输入文件（文件名）的产物名列表，按 ARTIFACTS 的顺序；artifacts 限定候选范围
+    """
+    candidates = ARTIFACTS if artifacts is None else artifacts
+    return [name for name in ARTIFACTS if name in candidates and ARTIFACTS[name][0] in sources]
+
+
+def run_pipeline(data_dir='../data', public_dir='../public', report_dir='.', artifacts=None, incremental=False,
+                 period_spec=None, workers=None, profile=False, trace_memory=False, timings_dir=TIMINGS_DIR,
+                 chart_mode=None, frames=None, store_path=None, start=None, weeks=None):
+    """
+    一次运行生成全部看板产物
+    每个输入文件只读取一次并转换为紧凑用户表（注册日、付费/登录时间差、注册周），
+    转换结果保存为派生数组文件，之后的运行直接内存映射（见 array_store），
+    再把同一张紧凑表分发给各个分析，原始明细随即释放
+    artifacts: 需要生成的产物名列表，默认全部
+    incremental: 转化队列类产物使用增量状态（保存在 data_dir/.cache 下），只重新统计受影响的注册日，读取导出仍是全量的
+    period_spec: 分时间段中位数的周期配置（见 periods.DEFAULT_PERIOD_SPEC）
+    workers: 大于1时转化队列和周留存按注册日期分片多进程计算，结果与串行一致
+    profile / trace_memory: 额外采集 cProfile 和 tracemalloc（见 profiling.start_run）
+    chart_mode: 报告图表输出方式 image / native / spec（见 charts.CHART_MODES），默认 image
+    frames: {输入文件名: 紧凑用户表} 缓存，传入时复用已有的表并写回新读取的表（watch 模式在多次运行间保留）
+    store_path: 从事件库（见 event_store，需先用 store-ingest 入库）读取，而不是读取输入文件；
+    start / weeks: 只读取注册日期不早于 start 或最近 weeks 个自然周的用户，筛选在库中按索引执行
+    每次运行结束打印阶段耗时汇总表，并在 timings_dir 下写出阶段耗时文件
+    返回 {产物名: 分析函数的返回值}
+    """
+    if artifacts is None:
+        artifacts = list(ARTIFACTS)
+    output_dirs = {'public': public_dir, 'report': report_dir}
+
+    if frames is None:
+        frames = {}
+    loaded = 0
+    results = {}
+    store = None
+    if store_path:
+        from event_store import open_store
+        store = open_store(store_path)
+    try:
+        with profile_run('pipeline', profile, trace_memory, timings_dir):
+            for name in artifacts:
+                source, output_kind, output_name, analysis = ARTIFACTS[name]
+                if source not in frames:
+                    with stage(f'读取并转换: {source}'):
+                        if store is not None:
+                            frames[source] = _load_from_store(store, source, start, weeks)
+                        else:
+                            frames[source] = load_compact_table(os.path.join(data_dir, source))
+                    loaded += 1
+                kwargs = {}
+                if incremental and name in INCREMENTAL_ARTIFACTS:
+                    kwargs['state_path'] = os.path.join(data_dir, CACHE_DIR_NAME, f"{name}.cohort_state.npz")
+                if period_spec and name in PERIOD_ARTIFACTS:
+                    kwargs['period_spec'] = period_spec
+                if workers and workers > 1 and name in PARALLEL_ARTIFACTS:
+                    kwargs['workers'] = workers
+                if chart_mode and name in CHART_ARTIFACTS:
+                    kwargs['chart_mode'] = chart_mode
+                with stage(f'生成: {name}', rows=len(frames[source])):
+                    output_path = os.path.join(output_dirs[output_kind], output_name)
+                    results[name] = analysis(frames[source], output_path, **kwargs)
+
+            print(f"\n全部产物生成完成，共读取 {loaded} 个输入文件，生成 {len(results)} 个产物")
+    finally:
+        if store is not None:
+            store.close()
+    return results
+
+
+def _load_from_store(store, source, start=None, weeks=None):
+    # 从事件库读取一个输入文件的紧凑用户表，weeks 换算为起始周一
+    from event_store import list_sources, load_compact, recent_weeks_start
+    if source not in set(list_sources(store)['source']):
+        raise ValueError(f"事件库中没有 {source}，请先运行 store-ingest")
+    if weeks:
+        bounds = [pd.Timestamp(value) for value in (start, recent_weeks_start(store, source, weeks)) if value]
+        start = max(bounds).date() if bounds else None
+    return load_compact(store, source, start)
+
+
+if __name__ == "__main__":
+    # 可在命令行指定只生成部分产物，如: python pipeline.py conversion_trend pay_time
+    # 加 --incremental 使用增量模式，加 --workers=N 使用N个进程并行计算
+    # 加 --profile 采集 cProfile，加 --trace-memory 记录各阶段内存分配峰值
+    # 加 --charts=native 或 --charts=spec 不渲染matplotlib图片
+    args = sys.argv[1:]
+    names = [arg for arg in args if not arg.startswith('--')]
+    workers = next((int(arg.split('=', 1)[1]) for arg in args if arg.startswith('--workers=')), None)
+    chart_mode = next((arg.split('=', 1)[1] for arg in args if arg.startswith('--charts=')), None)
+    run_pipeline(artifacts=names or None, incremental='--incremental' in args, workers=workers,
+                 profile='--profile' in args, trace_memory='--trace-memory' in args, chart_mode=chart_mode)
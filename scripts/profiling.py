@@ -0,0 +1,198 @@
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+
+# 每次运行的阶段耗时文件默认保存目录（相对当前工作目录）
+TIMINGS_DIR = 'timings'
+
+# 当前运行的状态：运行名、已完成的阶段记录、嵌套深度及可选的 cProfile/tracemalloc 采集
+_run = None
+
+
+def current_rss():
+    """
+    当前进程常驻内存（字节）
+    Linux 读取 /proc/self/statm；其他平台有 psutil 时使用 psutil，否则退化为历史峰值 ru_maxrss
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    记录一个阶段的墙钟时间、CPU时间、处理行数和RSS变化，可作为上下文管理器或装饰器使用：
+
+        with stage('写入Excel', rows=len(df)) as record:
+            ...
+            record['rows'] = n    # 行数在阶段内才知道时可以补记
+
+    开启了 tracemalloc 采集时额外记录阶段内的内存分配峰值
+    没有正在进行的运行（start_run）时只计时不保存
+    """
+    record = {'stage': name, 'rows': rows, 'depth': _run['depth'] if _run else 0}
+    if _run:
+        _run['depth'] += 1
+    trace_memory = bool(_run and _run['trace_memory'])
+    if trace_memory:
+        tracemalloc.reset_peak()
+    rss_before = current_rss()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['wall_seconds'] = round(time.perf_counter() - wall_start, 4)
+        record['cpu_seconds'] = round(time.process_time() - cpu_start, 4)
+        record['rss_delta_mb'] = round((current_rss() - rss_before) / 2 ** 20, 2)
+        if trace_memory:
+            record['peak_alloc_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        if _run:
+            _run['depth'] -= 1
+            _run['stages'].append(record)
+
+
+def timed(name):
+    """
+    阶段装饰器：第一个参数有长度时（如DataFrame）自动记为处理行数
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = len(args[0]) if args and hasattr(args[0], '__len__') else None
+            with stage(name, rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_run(name, profile=False, trace_memory=False):
+    """
+    开始一次运行，之后的 stage 都记录到这次运行中
+    profile: 用 cProfile 采集整次运行，结束时保存 .prof 文件
+    trace_memory: 用 tracemalloc 记录每个阶段的内存分配峰值（有额外开销）
+    """
+    global _run
+    _run = {
+        'name': name,
+        'started': datetime.now(),
+        'stages': [],
+        'depth': 0,
+        'trace_memory': trace_memory,
+        'profiler': cProfile.Profile() if profile else None,
+        'wall_start': time.perf_counter(),
+        'cpu_start': time.process_time(),
+    }
+    if trace_memory:
+        tracemalloc.start()
+    if _run['profiler']:
+        _run['profiler'].enable()
+
+
+def finish_run(timings_dir=TIMINGS_DIR):
+    """
+    结束当前运行：打印阶段耗时汇总表，并把阶段记录写入 timings_dir 下的
+    {运行名}_{开始时间}.timings.json（开启 profile 时另存同名 .prof），返回运行记录
+    """
+    global _run
+    run, _run = _run, None
+    if run is None:
+        return None
+    if run['profiler']:
+        run['profiler'].disable()
+    if run['trace_memory']:
+        tracemalloc.stop()
+
+    # 阶段在结束时记录，按开始顺序（嵌套阶段排在外层之后）重新排列便于阅读
+    stages = _in_start_order(run['stages'])
+    result = {
+        'run': run['name'],
+        'started': run['started'].isoformat(timespec='seconds'),
+        'wall_seconds': round(time.perf_counter() - run['wall_start'], 4),
+        'cpu_seconds': round(time.process_time() - run['cpu_start'], 4),
+        'stages': stages,
+    }
+    print(summary_table(result))
+
+    os.makedirs(timings_dir, exist_ok=True)
+    base_path = os.path.join(timings_dir, f"{run['name']}_{run['started']:%Y%m%d_%H%M%S}")
+    if run['profiler']:
+        run['profiler'].dump_stats(base_path + '.prof')
+        result['profile'] = base_path + '.prof'
+    with open(base_path + '.timings.json', 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return result
+
+
+@contextmanager
+def profile_run(name, profile=False, trace_memory=False, timings_dir=TIMINGS_DIR):
+    """
+    start_run / finish_run 的上下文管理器形式，出错时也会写出已完成阶段的记录
+    已经在一次运行中时（如脚本入口调用了 run_pipeline）只作为其中的一个阶段记录
+    """
+    if _run is not None:
+        with stage(name):
+            yield
+        return
+    start_run(name, profile, trace_memory)
+    try:
+        yield
+    finally:
+        finish_run(timings_dir)
+
+
+def _in_start_order(stages):
+    # 子阶段先于父阶段结束；按“父阶段 + 其后紧跟的子阶段”重新排列
+    ordered = []
+    pending = []
+    for record in stages:
+        children = [child for child in pending if child['depth'] > record['depth']]
+        pending = [child for child in pending if child['depth'] <= record['depth']]
+        pending.append(dict(record, children=children))
+
+    def flatten(records):
+        for record in records:
+            children = record.pop('children')
+            ordered.append(record)
+            flatten(children)
+
+    flatten(pending)
+    return ordered
+
+
+def _pad(text, width):
+    # 中文字符在终端占两列，按显示宽度补齐
+    display_width = sum(2 if unicodedata.east_asian_width(char) in 'WF' else 1 for char in text)
+    return text + ' ' * max(width - display_width, 0)
+
+
+def summary_table(run):
+    """
+    生成阶段耗时汇总表文本，嵌套阶段按层级缩进
+    """
+    lines = [f"\n=== 阶段耗时汇总: {run['run']} ===",
+             f"{_pad('阶段', 40)}{'耗时(s)':>10}{'CPU(s)':>10}{'行数':>12}{'RSS变化(MB)':>14}"]
+    for record in run['stages']:
+        label = '  ' * record['depth'] + record['stage']
+        rows = '' if record['rows'] is None else record['rows']
+        lines.append(f"{_pad(label, 40)}{record['wall_seconds']:>10.3f}{record['cpu_seconds']:>10.3f}"
+                     f"{rows:>12}{record['rss_delta_mb']:>14.2f}")
+    lines.append(f"{_pad('合计', 40)}{run['wall_seconds']:>10.3f}{run['cpu_seconds']:>10.3f}")
+    return '\n'.join(lines)
@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+# 网页数据发布：紧凑JSON + 预压缩的 .gz/.br 副本 + 内容哈希清单
+# 所有文件都先写临时文件再重命名，刷新过程中网页服务器不会读到写了一半的文件；
+# 内容没有变化时不重写文件，修改时间和 ETag 保持不变，浏览器重新验证时得到 304
+
+# 清单文件名，与数据文件放在同一目录
+MANIFEST_NAME = 'manifest.json'
+# 预压缩格式；br 需要安装 brotli 包，未安装时跳过
+COMPRESSIONS = ('gz', 'br')
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def atomic_write(path, payload):
+    """
+    原子写入字节内容：在目标目录写临时文件并 fsync，再用 os.replace 覆盖目标文件
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp 创建的文件权限为600，改为普通文件权限以便网页服务器读取
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def json_payload(data, minify=True):
+    """
+    序列化为UTF-8字节；minify 时去掉缩进和分隔符后的空格
+    """
+    if minify:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def compress_payload(payload, fmt):
+    """
+    预压缩内容；gzip 固定 mtime=0，同样的内容总是得到同样的压缩结果
+    brotli 未安装时返回 None
+    """
+    if fmt == 'gz':
+        return gzip.compress(payload, compresslevel=GZIP_LEVEL, mtime=0)
+    if fmt == 'br':
+        try:
+            import brotli
+        except ImportError:
+            return None
+        return brotli.compress(payload, quality=BROTLI_QUALITY)
+    raise ValueError(f"不支持的压缩格式: {fmt}")
+
+
+def content_etag(payload):
+    """
+    由内容SHA-256生成强ETag（带引号），返回 (ETag, 完整十六进制摘要)
+    """
+    digest = hashlib.sha256(payload).hexdigest()
+    return f'"{digest[:32]}"', digest
+
+
+def load_manifest(directory):
+    """
+    读取目录下的发布清单，不存在或损坏时返回空清单
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _read_bytes(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def publish_json(data, output_path, minify=True, compressions=COMPRESSIONS):
+    """
+    发布网页数据JSON：写出紧凑JSON及其 .gz/.br 预压缩副本，并在同目录的 manifest.json 中
+    记录 ETag、SHA-256 和各版本的字节数；全部原子写入
+    内容与已发布的文件相同时不重写任何文件
+    返回该文件在清单中的记录
+    """
+    payload = json_payload(data, minify)
+    etag, digest = content_etag(payload)
+    directory = os.path.dirname(os.path.abspath(output_path))
+    name = os.path.basename(output_path)
+    manifest = load_manifest(directory)
+    previous = manifest.get(name)
+
+    entry = {'etag': etag, 'sha256': digest, 'bytes': len(payload)}
+    unchanged = _read_bytes(output_path) == payload
+    if not unchanged:
+        atomic_write(output_path, payload)
+    for fmt in compressions:
+        sibling = f'{output_path}.{fmt}'
+        if unchanged and previous and previous.get(fmt) is not None and os.path.exists(sibling):
+            entry[fmt] = previous[fmt]
+            continue
+        compressed = compress_payload(payload, fmt)
+        if compressed is None:
+            # 没有该压缩库时删除过期的副本，避免网页服务器发出与JSON不一致的内容
+            if os.path.exists(sibling):
+                os.remove(sibling)
+            continue
+        atomic_write(sibling, compressed)
+        entry[fmt] = len(compressed)
+
+    if entry != previous:
+        manifest[name] = entry
+        atomic_write(os.path.join(directory, MANIFEST_NAME), json_payload(dict(sorted(manifest.items())), minify=False))
+    return entry
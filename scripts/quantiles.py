@@ -0,0 +1,229 @@
+import io
+import math
+import numpy as np
+
+# 分位数引擎：
+#   样本数不超过 EXACT_LIMIT 的分组用选择算法（np.partition，线性时间）精确计算；
+#   更大的分组或流式输入使用 KLL 草图，近似误差以“秩误差”衡量：
+#   返回值在全部数据中的秩与目标秩相差不超过 epsilon * n（高概率）
+#   草图可以合并、可以序列化为JSON或二进制（不含pickle的 .npz 字节），便于增量状态保存和多进程结果汇总
+
+# 精确计算的分组大小上限
+EXACT_LIMIT = 100000
+# 草图默认的秩误差上限（1%）
+DEFAULT_EPSILON = 0.01
+# 趋势带使用的分位数
+BAND_QUANTILES = (0.25, 0.5, 0.75, 0.9)
+# KLL 每层容量按 2/3 逐层递减，最低层容量不小于 MIN_CAPACITY
+_CAPACITY_DECAY = 2 / 3
+_MIN_CAPACITY = 2
+
+
+def quantile_label(q):
+    """
+    分位数的显示名，如 0.25 -> P25
+    """
+    return f"P{q * 100:g}"
+
+
+def exact_quantiles(values, qs):
+    """
+    用选择算法精确计算分位数（线性插值，与 numpy/pandas 默认口径一致），忽略 NaN
+    中位数在偶数个样本时取中间两个数的平均值，与 pandas median 结果逐位相同
+    没有有效数据时返回全 NaN
+    """
+    values = np.asarray(values, dtype='f8')
+    values = values[~np.isnan(values)]
+    qs = np.asarray(qs, dtype='f8')
+    if len(values) == 0:
+        return np.full(len(qs), np.nan)
+    positions = qs * (len(values) - 1)
+    lower = np.floor(positions).astype('i8')
+    upper = np.minimum(lower + 1, len(values) - 1)
+    # 只对需要的秩做一次部分排序
+    selected = np.partition(values, np.unique(np.concatenate([lower, upper])))
+    a, b = selected[lower], selected[upper]
+    fraction = positions - lower
+    result = a + (b - a) * fraction
+    midpoint = fraction == 0.5
+    result[midpoint] = (a[midpoint] + b[midpoint]) / 2
+    return result
+
+
+def _capacity(k, level, n_levels):
+    return max(_MIN_CAPACITY, int(math.ceil(k * _CAPACITY_DECAY ** (n_levels - 1 - level))))
+
+
+def epsilon_to_k(epsilon):
+    """
+    由目标秩误差换算 KLL 顶层容量 k（经验公式 epsilon ≈ 2.296 / k^0.9723）
+    """
+    if not 0 < epsilon < 1:
+        raise ValueError(f"epsilon 必须在 (0, 1) 之间: {epsilon}")
+    return max(8, int(math.ceil((2.296 / epsilon) ** (1 / 0.9723))))
+
+
+def new_sketch(epsilon=DEFAULT_EPSILON):
+    """
+    空的 KLL 分位数草图
+    levels[h] 中的每个样本代表 2**h 个原始样本
+    """
+    return {'k': epsilon_to_k(epsilon), 'n': 0, 'min': math.inf, 'max': -math.inf, 'levels': [np.empty(0)]}
+
+
+def _compress(sketch):
+    # 自底向上压缩超出容量的层：排序后隔一个取一个晋升到上一层，奇数个时留下一个
+    # 取奇数位还是偶数位由已处理的样本数决定，保证同样的输入得到同样的草图
+    levels = sketch['levels']
+    level = 0
+    while level < len(levels):
+        if len(levels[level]) > _capacity(sketch['k'], level, len(levels)):
+            items = np.sort(levels[level])
+            keep = items[:1] if len(items) % 2 else items[:0]
+            items = items[len(keep):]
+            offset = (sketch['n'] + level) % 2
+            if level + 1 == len(levels):
+                levels.append(np.empty(0))
+            levels[level + 1] = np.concatenate([levels[level + 1], items[offset::2]])
+            levels[level] = keep
+        level += 1
+    return sketch
+
+
+def sketch_update(sketch, values):
+    """
+    向草图批量加入样本（忽略 NaN），返回草图本身
+    """
+    values = np.asarray(values, dtype='f8').ravel()
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return sketch
+    sketch['n'] += len(values)
+    sketch['min'] = min(sketch['min'], float(values.min()))
+    sketch['max'] = max(sketch['max'], float(values.max()))
+    sketch['levels'][0] = np.concatenate([sketch['levels'][0], values])
+    return _compress(sketch)
+
+
+def sketch_merge(left, right):
+    """
+    合并两个草图（如各分片或各批次分别构建的草图），返回新草图；k 取两者较小值
+    """
+    n_levels = max(len(left['levels']), len(right['levels']))
+    empty = np.empty(0)
+    merged = {
+        'k': min(left['k'], right['k']),
+        'n': left['n'] + right['n'],
+        'min': min(left['min'], right['min']),
+        'max': max(left['max'], right['max']),
+        'levels': [np.concatenate([left['levels'][h] if h < len(left['levels']) else empty,
+                                   right['levels'][h] if h < len(right['levels']) else empty])
+                   for h in range(n_levels)],
+    }
+    return _compress(merged)
+
+
+def sketch_quantiles(sketch, qs):
+    """
+    由草图估计分位数：按样本权重累计，取累计权重首次达到 q*n 的样本；空草图返回全 NaN
+    q 为 0/1 时返回精确的最小/最大值
+    """
+    qs = np.asarray(qs, dtype='f8')
+    if sketch['n'] == 0:
+        return np.full(len(qs), np.nan)
+    items = np.concatenate(sketch['levels'])
+    weights = np.concatenate([np.full(len(level), 2 ** h, dtype='i8') for h, level in enumerate(sketch['levels'])])
+    order = np.argsort(items, kind='stable')
+    items, cumulative = items[order], np.cumsum(weights[order])
+    index = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+    result = items[np.minimum(index, len(items) - 1)]
+    result[qs <= 0] = sketch['min']
+    result[qs >= 1] = sketch['max']
+    return result
+
+
+def sketch_rank_error(sketch):
+    """
+    草图当前 k 对应的秩误差上限（与 epsilon_to_k 互逆）
+    """
+    return 2.296 / sketch['k'] ** 0.9723
+
+
+def sketch_to_dict(sketch):
+    """
+    草图转换为可JSON序列化的字典
+    """
+    return {
+        'k': sketch['k'],
+        'n': sketch['n'],
+        'min': None if sketch['n'] == 0 else sketch['min'],
+        'max': None if sketch['n'] == 0 else sketch['max'],
+        'levels': [level.tolist() for level in sketch['levels']],
+    }
+
+
+def sketch_from_dict(data):
+    """
+    sketch_to_dict 的逆运算
+    """
+    return {
+        'k': int(data['k']),
+        'n': int(data['n']),
+        'min': math.inf if data['min'] is None else float(data['min']),
+        'max': -math.inf if data['max'] is None else float(data['max']),
+        'levels': [np.asarray(level, dtype='f8') for level in data['levels']],
+    }
+
+
+def sketch_to_bytes(sketch):
+    """
+    草图序列化为二进制（.npz 格式，各层样本拼接保存并记录每层长度），比JSON紧凑且不丢精度
+    """
+    buffer = io.BytesIO()
+    np.savez(buffer, k=sketch['k'], n=sketch['n'], bounds=np.array([sketch['min'], sketch['max']]),
+             items=np.concatenate(sketch['levels']),
+             lengths=np.array([len(level) for level in sketch['levels']], dtype='i8'))
+    return buffer.getvalue()
+
+
+def sketch_from_bytes(data):
+    """
+    sketch_to_bytes 的逆运算
+    """
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        items = arrays['items']
+        offsets = np.cumsum(arrays['lengths'])[:-1]
+        return {
+            'k': int(arrays['k']),
+            'n': int(arrays['n']),
+            'min': float(arrays['bounds'][0]),
+            'max': float(arrays['bounds'][1]),
+            'levels': list(np.split(items, offsets)),
+        }
+
+
+def quantiles(values, qs, exact_limit=EXACT_LIMIT, epsilon=DEFAULT_EPSILON):
+    """
+    计算一组样本的分位数：有效样本不超过 exact_limit 时精确计算，否则用草图近似
+    """
+    values = np.asarray(values, dtype='f8')
+    values = values[~np.isnan(values)]
+    if len(values) <= exact_limit:
+        return exact_quantiles(values, qs)
+    return sketch_quantiles(sketch_update(new_sketch(epsilon), values), qs)
+
+
+def group_quantiles(values, groups, n_groups, qs, exact_limit=EXACT_LIMIT, epsilon=DEFAULT_EPSILON):
+    """
+    按分组编号（0..n_groups-1）计算各组分位数，编号为负的样本被忽略
+    先按组号一次稳定排序再逐组切片，返回形状为 (n_groups, len(qs)) 的数组，空组为 NaN
+    """
+    values = np.asarray(values, dtype='f8')
+    groups = np.asarray(groups)
+    keep = groups >= 0
+    values, groups = values[keep], groups[keep]
+    order = np.argsort(groups, kind='stable')
+    bounds = np.searchsorted(groups[order], np.arange(n_groups + 1))
+    values = values[order]
+    return np.array([quantiles(values[bounds[g]:bounds[g + 1]], qs, exact_limit, epsilon)
+                     for g in range(n_groups)]).reshape(n_groups, len(qs))
@@ -0,0 +1,416 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from array_store import load_compact_table
+from cohort_cube import DATE_GRAINS, DEFAULT_DIMENSIONS, build_cohort_cube, cube_query, grain_start_days
+from cohort_engine import DEFAULT_HORIZONS
+from compact_schema import NEVER, dates_to_days, days_to_dates
+from histograms import histogram, histogram_counts, histogram_labels, histogram_spec
+from publish import compress_payload, content_etag, json_payload
+from retention import DEFAULT_RETENTION_THRESHOLDS, retained_column, retention_partials
+from survival import mature_mask
+from watch import input_snapshot
+
+# 本地聚合查询服务：紧凑用户表常驻内存，按请求参数即时计算聚合结果，不再为每种视图重新生成静态JSON
+#   GET /api/conversion  按注册日/周/月的转化队列，可指定日期范围、转化窗口和维度过滤
+#   GET /api/pay-time    注册到付费时长直方图，分箱参数同 histograms.histogram_spec
+#   GET /api/retention   按注册周的留存人数和留存率，可指定留存阈值
+#   GET /api/datasets    可查询的数据集及缓存状态
+# 查询结果（JSON字节及其 gzip 压缩结果）和转化队列立方体放在同一个 LRU 缓存中，按字节数限制总内存，超过 TTL 的条目失效；
+# 输入文件的 (mtime, 大小) 变化时重新读取并丢弃该数据集的全部缓存
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# 结果缓存的内存上限和有效期
+DEFAULT_CACHE_BYTES = 64 * 2 ** 20
+DEFAULT_CACHE_TTL = 300.0
+# 超过该字节数的响应在客户端支持时用 gzip 压缩
+GZIP_MIN_BYTES = 1024
+# 数据集名 -> data 目录下的输入文件名；未在此列出的 .xlsx/.csv 文件以去掉扩展名的文件名作为数据集名
+DATASETS = {
+    'users': '3月以来的付费用户情况.xlsx',
+    'result': 'Result_10.xlsx',
+}
+DEFAULT_DATASET = 'users'
+
+
+def new_cache(max_bytes=DEFAULT_CACHE_BYTES, ttl=DEFAULT_CACHE_TTL):
+    """
+    建立 LRU/TTL 缓存：条目按最近使用排序，总字节数超过 max_bytes 时从最久未用的条目开始淘汰
+    """
+    return {'entries': OrderedDict(), 'bytes': 0, 'max_bytes': max_bytes, 'ttl': ttl,
+            'hits': 0, 'misses': 0, 'evictions': 0, 'lock': threading.Lock()}
+
+
+def _cache_remove(cache, key):
+    _, size, _ = cache['entries'].pop(key)
+    cache['bytes'] -= size
+
+
+def cache_get(cache, key):
+    """
+    读取缓存条目，不存在或已过期时返回 None
+    """
+    with cache['lock']:
+        entry = cache['entries'].get(key)
+        if entry is not None and time.monotonic() - entry[2] > cache['ttl']:
+            _cache_remove(cache, key)
+            entry = None
+        if entry is None:
+            cache['misses'] += 1
+            return None
+        cache['entries'].move_to_end(key)
+        cache['hits'] += 1
+        return entry[0]
+
+
+def cache_put(cache, key, value, size):
+    """
+    写入缓存条目（size 为其占用字节数）；单个条目超过上限时不缓存
+    """
+    with cache['lock']:
+        if key in cache['entries']:
+            _cache_remove(cache, key)
+        if size > cache['max_bytes']:
+            return value
+        cache['entries'][key] = (value, size, time.monotonic())
+        cache['bytes'] += size
+        while cache['bytes'] > cache['max_bytes']:
+            _cache_remove(cache, next(iter(cache['entries'])))
+            cache['evictions'] += 1
+    return value
+
+
+def cache_discard(cache, dataset):
+    """
+    丢弃某个数据集的全部缓存条目（键的第一项为数据集名）
+    """
+    with cache['lock']:
+        for key in [key for key in cache['entries'] if key[0] == dataset]:
+            _cache_remove(cache, key)
+
+
+def cache_stats(cache):
+    with cache['lock']:
+        return {'entries': len(cache['entries']), 'bytes': cache['bytes'], 'max_bytes': cache['max_bytes'],
+                'ttl': cache['ttl'], 'hits': cache['hits'], 'misses': cache['misses'],
+                'evictions': cache['evictions']}
+
+
+def parse_horizons(text):
+    """
+    解析转化窗口参数，如 '12h,24h,7d,30d' -> [('D12h', 12, 'h'), ('D24h', 24, 'h'), ('D7', 7, 'd'), ('D30', 30, 'd')]
+    """
+    horizons = []
+    for item in text.split(','):
+        item = item.strip().lower()
+        if not item:
+            continue
+        unit = item[-1]
+        if unit not in ('h', 'd') or not item[:-1].isdigit():
+            raise ValueError(f"无法解析的转化窗口: {item}，格式如 12h、7d")
+        value = int(item[:-1])
+        horizons.append((f'D{value}h' if unit == 'h' else f'D{value}', value, unit))
+    if not horizons:
+        raise ValueError("至少需要一个转化窗口")
+    return horizons
+
+
+def _date_bound(value):
+    # 日期参数换算为1970-01-01起的天数，空值返回 None
+    if not value:
+        return None
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype('i8'))
+
+
+def filter_registration(compact, start=None, end=None):
+    """
+    按注册日期范围（含端点，任一端可为 None）筛选紧凑用户表
+    """
+    low, high = _date_bound(start), _date_bound(end)
+    if low is None and high is None:
+        return compact
+    reg_day = compact['reg_day'].to_numpy()
+    mask = np.ones(len(reg_day), dtype=bool)
+    if low is not None:
+        mask &= reg_day >= low
+    if high is not None:
+        mask &= reg_day <= high
+    return compact[mask]
+
+
+def _records(frame):
+    # DataFrame 转换为JSON记录列表：日期转为字符串，缺失值为 null
+    frame = frame.copy()
+    for column in frame.columns:
+        if frame[column].dtype == object and len(frame) and hasattr(frame[column].iloc[0], 'isoformat'):
+            frame[column] = [value.isoformat() for value in frame[column]]
+    frame = frame.astype(object).where(frame.notna(), None)
+    return [{key: (value.item() if isinstance(value, np.generic) else value) for key, value in row.items()}
+            for row in frame.to_dict('records')]
+
+
+def new_service(data_dir='../data', max_bytes=DEFAULT_CACHE_BYTES, ttl=DEFAULT_CACHE_TTL, datasets=None):
+    """
+    建立查询服务状态：数据目录、已载入的紧凑用户表及其文件签名、结果缓存
+    """
+    return {
+        'data_dir': data_dir,
+        'datasets': dict(DATASETS if datasets is None else datasets),
+        'frames': {},
+        'signatures': {},
+        'cache': new_cache(max_bytes, ttl),
+        'lock': threading.Lock(),
+    }
+
+
+def _dataset_file(service, dataset):
+    if dataset in service['datasets']:
+        return service['datasets'][dataset]
+    for name in input_snapshot(service['data_dir']):
+        if os.path.splitext(name)[0] == dataset:
+            return name
+    raise KeyError(f"未知的数据集: {dataset}")
+
+
+def dataset_frame(service, dataset):
+    """
+    返回数据集的紧凑用户表（含 DEFAULT_DIMENSIONS 中存在的维度列）
+    输入文件签名变化时重新读取，并丢弃该数据集的缓存结果
+    """
+    file_name = _dataset_file(service, dataset)
+    path = os.path.join(service['data_dir'], file_name)
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with service['lock']:
+        if service['signatures'].get(dataset) != signature:
+            service['frames'][dataset] = load_compact_table(path, extra_columns=list(DEFAULT_DIMENSIONS.values()))
+            service['signatures'][dataset] = signature
+            cache_discard(service['cache'], dataset)
+        return service['frames'][dataset]
+
+
+def _dataset_cube(service, dataset, horizons):
+    # 每个数据集 × 转化窗口组合的立方体缓存在结果缓存中，不同日期范围和分组的查询共用
+    key = (dataset, 'cube', tuple(horizons))
+    cube = cache_get(service['cache'], key)
+    if cube is None:
+        compact = dataset_frame(service, dataset)
+        dimensions = {name: column for name, column in DEFAULT_DIMENSIONS.items() if column in compact.columns}
+        cube = build_cohort_cube(compact, dimensions, horizons)
+        size = cube['counts'].nbytes if cube['storage'] == 'dense' else cube['coords'].nbytes + cube['values'].nbytes
+        cache_put(service['cache'], key, cube, size)
+    return cube
+
+
+def _param(params, name, default=None):
+    values = params.get(name)
+    return values[-1] if values else default
+
+
+# 由日/周/月分组的起始日跳到下一组内的天数，用于求组内最后一天
+_NEXT_GROUP_DAYS = {'date': 1, 'week': 7, 'month': 31}
+
+
+def _mask_immature(result, cube, group_by, end=None):
+    # 与报告、趋势JSON、生存分析同一口径（见 survival.mature_mask）：以立方体记录的观察截止时间（最晚事件时间）为准，
+    # 组内最后一个注册日尚未过完窗口的转化率置为空；不按日期分组时以查询范围内的最后注册日为准
+    last_day = cube['first_day'] + cube['shape'][0] - 1
+    end_day = _date_bound(end)
+    range_end = last_day if end_day is None else min(last_day, end_day)
+    grain = next((name for name in group_by if name in DATE_GRAINS), None)
+    if grain and len(result):
+        starts = dates_to_days(result[DATE_GRAINS[grain]])
+        group_end = np.minimum(grain_start_days(starts + _NEXT_GROUP_DAYS[grain], grain) - 1, range_end)
+    else:
+        group_end = np.full(len(result), range_end, dtype='i8')
+    mature = mature_mask(pd.DataFrame({'注册日期': days_to_dates(group_end)}), cube['horizons'], cube['observed_until'])
+    for prefix, flags in mature.items():
+        result[f'{prefix}转化率'] = result[f'{prefix}转化率'].where(flags)
+    return result
+
+
+def _parse_group(value, cube):
+    # 分组维度：至多一个日期粒度，其余为立方体的维度；未知或重复的名字报错
+    group_by = [name for name in value.split(',') if name]
+    unknown = [name for name in group_by if name not in DATE_GRAINS and name not in cube['dimensions']]
+    if unknown:
+        raise ValueError(f"未知的分组: {', '.join(unknown)}，可选: {', '.join(list(DATE_GRAINS) + cube['dimensions'])}")
+    if len(set(group_by)) < len(group_by):
+        raise ValueError(f"分组重复: {value}")
+    if sum(name in DATE_GRAINS for name in group_by) > 1:
+        raise ValueError(f"只能指定一个日期粒度: {value}")
+    return group_by
+
+
+def query_conversion(service, dataset, params):
+    """
+    转化队列查询：group=date/week/month（可追加维度，逗号分隔），horizons=12h,7d,...，
+    start/end 注册日期范围，维度名=值1,值2 过滤维度
+    尚未过完窗口的分组转化率为 null，付费人数照常返回
+    """
+    horizons = parse_horizons(_param(params, 'horizons', '')) if _param(params, 'horizons') else DEFAULT_HORIZONS
+    cube = _dataset_cube(service, dataset, horizons)
+    group_by = _parse_group(_param(params, 'group', 'date'), cube)
+    filters = {name: _param(params, name).split(',') for name in cube['dimensions'] if _param(params, name)}
+    result = cube_query(cube, group_by, filters, (_param(params, 'start'), _param(params, 'end')))
+    result = _mask_immature(result, cube, group_by, _param(params, 'end'))
+    return {'dataset': dataset, 'group': group_by, 'horizons': [prefix for prefix, _, _ in horizons],
+            'dimensions': {name: list(cube['labels'][name]) for name in cube['dimensions']},
+            'data': _records(result)}
+
+
+def query_pay_time(service, dataset, params):
+    """
+    付费时长直方图查询：unit/width/bins/overflow/scale/base 同 histogram_spec，start/end 注册日期范围
+    """
+    bins = _param(params, 'bins')
+    spec = histogram_spec(_param(params, 'unit', 'day'), float(_param(params, 'width', 1)),
+                          int(bins) if bins else None, _param(params, 'overflow', 'drop'),
+                          _param(params, 'scale', 'linear'), float(_param(params, 'base', 2)))
+    compact = filter_registration(dataset_frame(service, dataset), _param(params, 'start'), _param(params, 'end'))
+    pay_delta = compact['pay_delta'].to_numpy()
+    hist = histogram(pay_delta[pay_delta != NEVER], spec)
+    return {'dataset': dataset, 'spec': spec, 'overflow': hist['overflow'], 'underflow': hist['underflow'],
+            'data': [{'range': label, 'count': count}
+                     for label, count in zip(histogram_labels(hist), histogram_counts(hist))]}
+
+
+def query_retention(service, dataset, params):
+    """
+    按注册周留存查询：thresholds=1,7,30，start/end 注册日期范围
+    """
+    thresholds = _param(params, 'thresholds')
+    thresholds = [int(t) for t in thresholds.split(',') if t] if thresholds else DEFAULT_RETENTION_THRESHOLDS
+    compact = filter_registration(dataset_frame(service, dataset), _param(params, 'start'), _param(params, 'end'))
+    if 'login_delta' not in compact.columns:
+        raise ValueError(f"数据集 {dataset} 没有最后登录时间，无法计算留存")
+    partials = retention_partials(compact, thresholds)
+    weekly = partials['weekly']
+    frame = pd.DataFrame({'自然周': (weekly.index.to_numpy() * 7 - 3).astype('datetime64[D]').astype(str),
+                          '注册人数': weekly['注册人数'].to_numpy()})
+    for t in partials['thresholds']:
+        frame[retained_column(t)] = weekly[retained_column(t)].to_numpy()
+        frame[f'D{t}留存率'] = frame[retained_column(t)] / frame['注册人数']
+    return {'dataset': dataset, 'thresholds': partials['thresholds'], 'valid_users': partials['有效留存数据用户数'],
+            'data': _records(frame)}
+
+
+QUERIES = {
+    '/api/conversion': query_conversion,
+    '/api/pay-time': query_pay_time,
+    '/api/retention': query_retention,
+}
+
+
+def list_datasets(service):
+    names = dict(service['datasets'])
+    for file_name in input_snapshot(service['data_dir']):
+        if file_name not in names.values():
+            names[os.path.splitext(file_name)[0]] = file_name
+    return {'datasets': names, 'loaded': sorted(service['frames']), 'grains': list(DATE_GRAINS),
+            'cache': cache_stats(service['cache'])}
+
+
+def _response(payload):
+    # (JSON字节, ETag, gzip压缩字节)；小于 GZIP_MIN_BYTES 的响应不压缩，压缩字节为 None
+    compressed = compress_payload(payload, 'gz') if len(payload) >= GZIP_MIN_BYTES else None
+    return payload, content_etag(payload)[0], compressed
+
+
+def handle_query(service, path, query_string):
+    """
+    执行一次查询，返回 (HTTP状态码, JSON字节, ETag, gzip压缩字节或 None)；
+    相同参数的结果连同压缩字节从缓存读取，每次请求不再重新压缩
+    未知接口或数据集返回404，参数错误返回400，其他异常记录到标准错误并返回500
+    """
+    if path == '/api/datasets':
+        return (200,) + _response(json_payload(list_datasets(service)))
+    if path not in QUERIES:
+        return 404, json_payload({'error': f'未知的接口: {path}'}), None, None
+
+    params = parse_qs(query_string)
+    dataset = _param(params, 'dataset', DEFAULT_DATASET)
+    try:
+        # 先确认数据文件未变化（变化时会丢弃旧缓存），再查缓存
+        dataset_frame(service, dataset)
+        key = (dataset, path, tuple(sorted((name, tuple(values)) for name, values in params.items())))
+        cached = cache_get(service['cache'], key)
+        if cached is None:
+            cached = _response(json_payload(QUERIES[path](service, dataset, params)))
+            cached = cache_put(service['cache'], key, cached, len(cached[0]) + len(cached[2] or b''))
+    except KeyError as error:
+        return 404, json_payload({'error': str(error.args[0])}), None, None
+    except (ValueError, FileNotFoundError) as error:
+        return 400, json_payload({'error': str(error)}), None, None
+    except Exception as error:
+        # 其他异常（如畸形参数触发的 numpy/pandas 错误）记录堆栈后返回500，处理线程和客户端连接不受影响
+        sys.stderr.write(f"查询失败: {path}?{query_string}\n{traceback.format_exc()}")
+        return 500, json_payload({'error': f'服务器内部错误: {type(error).__name__}'}), None, None
+    return (200,) + cached
+
+
+def _handler_class(service):
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            status, payload, etag, compressed = handle_query(service, url.path.rstrip('/') or '/', url.query)
+            if etag is not None and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            encoding = None
+            if compressed is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                payload, encoding = compressed, 'gzip'
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            if etag is not None:
+                self.send_header('ETag', etag)
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+    return QueryHandler
+
+
+def serve(data_dir='../data', host=DEFAULT_HOST, port=DEFAULT_PORT, max_bytes=DEFAULT_CACHE_BYTES,
+          ttl=DEFAULT_CACHE_TTL, preload=True):
+    """
+    启动查询服务（多线程），preload 时先载入默认数据集；Ctrl+C 退出
+    """
+    service = new_service(data_dir, max_bytes, ttl)
+    if preload:
+        for dataset, file_name in service['datasets'].items():
+            if os.path.exists(os.path.join(data_dir, file_name)):
+                dataset_frame(service, dataset)
+    server = ThreadingHTTPServer((host, port), _handler_class(service))
+    print(f"查询服务运行在 http://{host}:{port}/api/datasets（缓存上限 {max_bytes / 2 ** 20:.0f} MB，TTL {ttl:g} 秒）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("查询服务已停止")
+    finally:
+        server.server_close()
+    return service
+
+
+if __name__ == "__main__":
+    serve()
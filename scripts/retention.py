@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from compact_schema import NEVER, SECONDS_PER_DAY, ensure_compact
+from profiling import timed
+
+# 默认统计的留存阈值（天）：Dn留存 = 注册后最后登录距注册不少于n天
+DEFAULT_RETENTION_THRESHOLDS = (1, 7, 30)
+
+# 留存天数分类：(分类名, 起始天数, 结束天数(含))，None 表示不设上限；各分类首尾相接
+RETENTION_DAY_CATEGORIES = [
+    ('当天', 0, 0),
+    ('次日', 1, 1),
+    ('2-7天', 2, 7),
+    ('8-30天', 8, 30),
+    ('30天以上', 31, None),
+]
+
+# 按周部分聚合中注册日范围两列的合并方式，其余计数列相加
+_RANGE_AGG = {'首次注册日': 'min', '末次注册日': 'max'}
+
+
+def retained_column(threshold):
+    """
+    按周部分聚合中Dn留存人数的列名
+    """
+    return f'D{threshold}留存人数'
+
+
+def weekly_retention_counts(week, reg_day, days, thresholds=DEFAULT_RETENTION_THRESHOLDS):
+    """
+    按注册周编号统计注册人数、各阈值留存人数和周内注册日范围，全部为整数运算，不逐周过滤：
+    1. 每个用户的留存档位 = 不超过其留存天数的阈值个数（searchsorted）
+    2. 一次 bincount 得到 周 × 档位 的人数，逆序累加即为各阈值的留存人数
+    3. 一次 bincount 得到 周 × 周内第几天 的人数，首个/末个非零位置即周内首次/末次注册日
+    返回以周编号为索引的 DataFrame，只包含有用户的周
+    """
+    thresholds = sorted(thresholds)
+    week = np.asarray(week, dtype='i8')
+    reg_day = np.asarray(reg_day, dtype='i8')
+    columns = ['注册人数'] + [retained_column(t) for t in thresholds] + list(_RANGE_AGG)
+    if len(week) == 0:
+        return pd.DataFrame(columns=columns, dtype='i8').rename_axis('周编号')
+
+    first_week = week.min()
+    code = week - first_week
+    n_weeks = int(code.max()) + 1
+    n_levels = len(thresholds) + 1
+    level = np.searchsorted(thresholds, days, side='right')
+    by_level = np.bincount(code * n_levels + level, minlength=n_weeks * n_levels).reshape(n_weeks, n_levels)
+    at_least = np.cumsum(by_level[:, ::-1], axis=1)[:, ::-1]
+
+    # 周编号以周一为起点：周一为 1970-01-01 前3天起每7天
+    week_start = week * 7 - 3
+    by_weekday = np.bincount(code * 7 + (reg_day - week_start), minlength=n_weeks * 7).reshape(n_weeks, 7) > 0
+
+    present = at_least[:, 0] > 0
+    weeks = np.flatnonzero(present) + first_week
+    weekly = pd.DataFrame({'注册人数': at_least[present, 0]}, index=pd.Index(weeks, name='周编号'))
+    for i, threshold in enumerate(thresholds):
+        weekly[retained_column(threshold)] = at_least[present, i + 1]
+    weekly['首次注册日'] = weeks * 7 - 3 + by_weekday[present].argmax(axis=1)
+    weekly['末次注册日'] = weeks * 7 + 3 - by_weekday[present, ::-1].argmax(axis=1)
+    return weekly
+
+
+@timed('留存部分聚合')
+def retention_partials(df, thresholds=DEFAULT_RETENTION_THRESHOLDS):
+    """
+    计算可合并的留存部分聚合：
+    有效用户数、按注册周编号的注册/各阈值留存人数及注册日范围、留存天数的频数直方图
+    """
+    compact = ensure_compact(df)
+
+    # 只保留有最后登录时间的用户
+    login_delta = compact['login_delta'].to_numpy()
+    has_login = login_delta != NEVER
+    valid_users = int(has_login.sum())
+
+    # 确保留存天数非负
+    retained = has_login & (login_delta >= 0)
+    days = login_delta[retained] // SECONDS_PER_DAY
+
+    return {
+        '有效付费用户数': valid_users,
+        '有效留存数据用户数': len(days),
+        'thresholds': sorted(thresholds),
+        'weekly': weekly_retention_counts(compact['week'].to_numpy()[retained], compact['reg_day'].to_numpy()[retained],
+                                          days, thresholds),
+        'days_hist': np.bincount(days),
+    }
+
+
+def merge_retention_partials(left, right):
+    """
+    合并两份 retention_partials 的结果（阈值必须相同）
+    """
+    if left['thresholds'] != right['thresholds']:
+        raise ValueError("只能合并留存阈值相同的部分聚合")
+    weekly_agg = {column: _RANGE_AGG.get(column, 'sum') for column in left['weekly'].columns}
+    size = max(len(left['days_hist']), len(right['days_hist']))
+    return {
+        '有效付费用户数': left['有效付费用户数'] + right['有效付费用户数'],
+        '有效留存数据用户数': left['有效留存数据用户数'] + right['有效留存数据用户数'],
+        'thresholds': left['thresholds'],
+        'weekly': pd.concat([left['weekly'], right['weekly']]).groupby(level=0).agg(weekly_agg),
+        'days_hist': (np.pad(left['days_hist'], (0, size - len(left['days_hist'])))
+                      + np.pad(right['days_hist'], (0, size - len(right['days_hist'])))),
+    }
+
+
+def categorize_retention_days(days):
+    """
+    留存天数（整数数组）按 RETENTION_DAY_CATEGORIES 分类，返回分类下标数组；一次 searchsorted，不逐个调用函数
+    """
+    starts = np.array([start for _, start, _ in RETENTION_DAY_CATEGORIES])
+    return np.searchsorted(starts, days, side='right') - 1
+
+
+def retention_day_distribution(days_hist):
+    """
+    由留存天数直方图按分类汇总用户数，只保留有用户的分类，返回 (分类名列表, 用户数列表)
+    """
+    index = categorize_retention_days(np.arange(len(days_hist)))
+    counts = np.bincount(index, weights=days_hist, minlength=len(RETENTION_DAY_CATEGORIES)).astype('i8')
+    return ([label for (label, _, _), count in zip(RETENTION_DAY_CATEGORIES, counts) if count > 0],
+            [int(count) for count in counts if count > 0])
+
+
+def histogram_median(hist):
+    """
+    由整数频数直方图计算中位数（与 Series.median 口径一致）
+    """
+    cumulative = np.cumsum(hist)
+    total = cumulative[-1]
+    lower = np.searchsorted(cumulative, (total - 1) // 2, side='right')
+    upper = np.searchsorted(cumulative, total // 2, side='right')
+    return (lower + upper) / 2
@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+from cohort_cube import DATE_GRAINS, grain_start_days
+from cohort_engine import DEFAULT_HORIZONS, assign_horizon_bins, horizon_upper_bound, sorted_horizon_order
+from compact_schema import SECONDS_PER_DAY, dates_to_days, days_to_dates, ensure_compact, observation_cutoff
+from profiling import stage
+
+# 注册到首次付费的生存分析（Kaplan–Meier）：
+# 每个用户的观察时长为注册到付费的秒数（已付费），或注册到观察截止时间（导出时间）的秒数（未付费，右删失）；
+# 截止时间之后才发生的付费视为尚未观察到。所有队列一次排序（队列、时长、付费在前）后，
+# 在每个有付费的时间点 t 计算 1 - 付费人数/风险人数，再按队列分段累乘得到生存曲线 S(t)，
+# 窗口转化率 = 1 - S(窗口上界前最后一个付费时间点)
+# 成熟：队列中最晚注册的用户在截止时间前已经过完整个窗口，此时 KM 估计与直接计数的转化率完全相同
+
+# 同一次运行的转化报告、趋势JSON、查询服务和 KM 都以 observation_cutoff（最晚事件时间）为截止时间，由调用方显式传入；
+# 只有按注册日期的计数结果、拿不到事件时间时（如分块读取），才退回到最后一个注册日的结束时刻
+_DAY_END = SECONDS_PER_DAY - 1
+
+
+def _segment_cumprod(factors, segments, n_segments):
+    # 按分段编号（非降序）分段累乘；用对数累加实现，因子为0的位置单独计数
+    zero = factors <= 0
+    log_sum = np.cumsum(np.log(np.where(zero, 1.0, factors)))
+    zero_count = np.cumsum(zero)
+    starts = np.searchsorted(segments, np.arange(n_segments))
+    base_log = np.r_[0.0, log_sum][starts][segments]
+    base_zero = np.r_[0, zero_count][starts][segments]
+    return np.where(zero_count - base_zero > 0, 0.0, np.exp(log_sum - base_log))
+
+
+def kaplan_meier(df, grain='week', observed_until=None):
+    """
+    按注册日/周/月队列计算注册到首次付费的 KM 生存曲线，全部队列一次排序、一次分段累乘
+    observed_until: 观察截止时间（1970-01-01起的秒数或可被 pd.Timestamp 解析的时间），默认取 observation_cutoff
+    返回 {'grain', 'observed_until', 'cohorts': 队列起始日, 'sizes': 各队列人数, 'paid': 截止前付费人数,
+          'first_registration' / 'last_registration': 各队列最早/最晚注册时间(秒),
+          'offsets': 各队列曲线在 times/survival 中的起止位置,
+          'times': 有付费发生的时长(秒), 'survival': 该时长之后的 S(t)}
+    """
+    if grain not in DATE_GRAINS:
+        raise ValueError(f"不支持的日期粒度: {grain}，可选: {', '.join(DATE_GRAINS)}")
+    compact = ensure_compact(df)
+    if observed_until is None:
+        observed_until = observation_cutoff(compact)
+    elif not isinstance(observed_until, (int, np.integer)):
+        observed_until = int(pd.Timestamp(observed_until).value // 10 ** 9)
+
+    reg_day = compact['reg_day'].to_numpy(dtype='i8')
+    reg_seconds = reg_day * SECONDS_PER_DAY + compact['reg_second'].to_numpy(dtype='i8')
+    pay_delta = compact['pay_delta'].to_numpy(dtype='i8')
+    # 截止时间之后注册的用户不在观察范围内
+    observed = reg_seconds <= (observed_until if observed_until is not None else np.iinfo('i8').max)
+    reg_day, reg_seconds, pay_delta = reg_day[observed], reg_seconds[observed], pay_delta[observed]
+
+    with stage('KM生存曲线', rows=len(reg_day)):
+        cohorts, code = np.unique(grain_start_days(reg_day, grain), return_inverse=True)
+        n_cohorts = len(cohorts)
+        paid = (pay_delta >= 0) & (reg_seconds + pay_delta <= observed_until) if len(reg_day) else pay_delta >= 0
+        duration = np.where(paid, pay_delta, observed_until - reg_seconds if len(reg_day) else 0)
+
+        # 一次排序：队列、时长升序，同一时长付费排在删失之前（删失用户仍计入该时刻的风险人数）
+        order = np.lexsort((~paid, duration, code))
+        code, duration, paid = code[order], duration[order], paid[order]
+        sizes = np.bincount(code, minlength=n_cohorts)
+        first_row = np.r_[0, np.cumsum(sizes)[:-1]]
+        at_risk = sizes[code] - (np.arange(len(code)) - first_row[code])
+
+        # 相同 (队列, 时长) 的行合并为一个时间点，只保留有付费的时间点
+        new_point = np.r_[True, (code[1:] != code[:-1]) | (duration[1:] != duration[:-1])] if len(code) else np.zeros(0, bool)
+        points = np.flatnonzero(new_point)
+        events = np.add.reduceat(paid.astype('i8'), points) if len(points) else np.zeros(0, dtype='i8')
+        has_event = events > 0
+        points, events = points[has_event], events[has_event]
+        point_code = code[points]
+        survival = _segment_cumprod(1.0 - events / at_risk[points], point_code, n_cohorts)
+
+        first_registration = np.full(n_cohorts, np.iinfo('i8').max)
+        np.minimum.at(first_registration, code, reg_seconds[order])
+        last_registration = np.full(n_cohorts, np.iinfo('i8').min)
+        np.maximum.at(last_registration, code, reg_seconds[order])
+    return {
+        'grain': grain,
+        'observed_until': observed_until,
+        'cohorts': cohorts,
+        'sizes': sizes,
+        'paid': np.bincount(code, weights=paid, minlength=n_cohorts).astype('i8'),
+        'first_registration': first_registration,
+        'last_registration': last_registration,
+        'offsets': np.searchsorted(point_code, np.arange(n_cohorts + 1)),
+        'times': duration[points],
+        'survival': survival,
+    }
+
+
+def km_conversion(km, bound):
+    """
+    各队列在时长上界 bound（秒，开区间）内的 KM 累计转化率 1 - S(bound 之前最后一个付费时间点)
+    """
+    n_cohorts = len(km['cohorts'])
+    times, offsets = km['times'], km['offsets']
+    # 在每个队列自己的区段内查找，区段按队列顺序拼接，用 (队列, 时长) 组合键一次 searchsorted
+    span = int(max(times.max() if len(times) else 0, bound)) + 1
+    keys = np.repeat(np.arange(n_cohorts, dtype='i8'), np.diff(offsets)) * span + times
+    position = np.searchsorted(keys, np.arange(n_cohorts, dtype='i8') * span + bound, side='left') - 1
+    inside = position >= offsets[:-1]
+    survival = np.where(inside, km['survival'][np.maximum(position, 0)] if len(times) else 1.0, 1.0)
+    return 1.0 - survival
+
+
+def survival_table(df, horizons=DEFAULT_HORIZONS, grain='week', observed_until=None, km=None):
+    """
+    按队列输出各转化窗口的 KM 转化率和只在成熟队列上给出的直接计数转化率
+    km: 已由 kaplan_meier 计算好的同一粒度、同一截止时间的结果，不传时重新计算
+    返回列：注册日期/注册周/注册月, 注册人数, 已付费人数, {前缀}KM转化率..., {前缀}成熟转化率...（未成熟为空）
+    """
+    compact = ensure_compact(df)
+    if km is None:
+        km = kaplan_meier(compact, grain, observed_until)
+    table = pd.DataFrame({
+        DATE_GRAINS[grain]: days_to_dates(km['cohorts']),
+        '注册人数': km['sizes'],
+        '已付费人数': km['paid'],
+    })
+
+    # 直接计数：按队列、窗口编号一次 bincount，再沿窗口方向累加
+    reg_day = compact['reg_day'].to_numpy(dtype='i8')
+    reg_seconds = reg_day * SECONDS_PER_DAY + compact['reg_second'].to_numpy(dtype='i8')
+    observed = reg_seconds <= km['observed_until'] if km['observed_until'] is not None else np.ones(len(reg_day), bool)
+    code = np.searchsorted(km['cohorts'], grain_start_days(reg_day[observed], grain))
+    n_bins = len(horizons) + 1
+    hist = np.bincount(code * n_bins + assign_horizon_bins(compact['pay_delta'].to_numpy()[observed], horizons),
+                       minlength=len(km['cohorts']) * n_bins).reshape(-1, n_bins)
+    order, bounds = sorted_horizon_order(horizons)
+    cumulative = hist[:, :len(horizons)].cumsum(axis=1)
+    sizes = np.maximum(km['sizes'], 1)
+
+    naive = {}
+    for position, h in enumerate(order):
+        prefix = horizons[h][0]
+        mature = km['last_registration'] + bounds[position] - 1 <= km['observed_until']
+        naive[prefix] = np.where(mature, cumulative[:, position] / sizes, np.nan)
+    for prefix, value, unit in horizons:
+        table[f'{prefix}KM转化率'] = km_conversion(km, horizon_upper_bound(value, unit))
+    for prefix, _, _ in horizons:
+        table[f'{prefix}成熟转化率'] = naive[prefix]
+    return table
+
+
+def mature_mask(results_df, horizons=DEFAULT_HORIZONS, observed_until=None):
+    """
+    按注册日期的转化明细中各窗口是否成熟：该日最后一刻注册的用户在截止时间前已经过完整个窗口
+    observed_until: 观察截止时间，应与 kaplan_meier 使用同一个值（observation_cutoff）；
+                    缺省时只能取最后一个注册日的结束时刻
+    返回 {前缀: 布尔数组}
+    """
+    days = dates_to_days(results_df['注册日期']) if len(results_df) else np.zeros(0, dtype='i8')
+    if observed_until is None:
+        observed_until = int(days.max()) * SECONDS_PER_DAY + _DAY_END if len(days) else 0
+    elif not isinstance(observed_until, (int, np.integer)):
+        observed_until = int(pd.Timestamp(observed_until).value // 10 ** 9)
+    day_end = days * SECONDS_PER_DAY + _DAY_END
+    return {prefix: day_end + horizon_upper_bound(value, unit) - 1 <= observed_until
+            for prefix, value, unit in horizons}
+
+
+def mask_immature_rates(results_df, horizons=DEFAULT_HORIZONS, observed_until=None):
+    """
+    把尚未成熟的注册日期的 {前缀}转化率 置为空（付费人数保留），避免近期日期的D30/D90等转化率被低估
+    """
+    result = results_df.copy()
+    for prefix, mature in mature_mask(results_df, horizons, observed_until).items():
+        result[f'{prefix}转化率'] = result[f'{prefix}转化率'].where(mature)
+    return result
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+from cohort_cube import DATE_GRAINS
+from cohort_engine import DEFAULT_HORIZONS
+from compact_schema import SECONDS_PER_DAY, days_to_dates, ensure_compact
+from data_loader import load_user_data
+from excel_report import report_sheet, write_report
+from profiling import profile_run
+from survival import kaplan_meier, km_conversion, observation_cutoff, survival_table
+
+# 生存曲线表输出注册后第0..CURVE_DAYS天的累计转化率
+CURVE_DAYS = 90
+
+def analyze_survival(file_path, output_path='付费生存分析.xlsx', grain='week', observed_until=None):
+    """
+    读取用户导出文件并计算注册到首次付费的KM生存分析，详见 analyze_survival_from_frame
+    """
+    df = load_user_data(file_path)
+    return analyze_survival_from_frame(df, output_path, grain, observed_until)
+
+def analyze_survival_from_frame(df, output_path='付费生存分析.xlsx', grain='week', observed_until=None):
+    """
+    按注册日/周/月队列计算注册到首次付费的 Kaplan–Meier 转化率，未付费用户在观察截止时间右删失，结果写入 output_path
+    1. KM转化率：各转化窗口的KM估计，以及只在成熟队列上给出的直接计数转化率
+    2. 生存曲线：各队列注册后第0..90天的KM累计转化率，超出该队列最长观察时长的天为空
+    observed_until 默认取数据中最晚的事件时间
+    """
+    compact = ensure_compact(df)
+    if observed_until is None:
+        observed_until = observation_cutoff(compact)
+    km = kaplan_meier(compact, grain, observed_until)
+    table = survival_table(compact, DEFAULT_HORIZONS, grain, observed_until, km)
+    cutoff = km['observed_until']
+    print(f"观察截止时间: {pd.Timestamp(cutoff, unit='s') if cutoff is not None else '无'}")
+    print(f"队列数: {len(table)}，注册人数: {table['注册人数'].sum()}，已付费人数: {table['已付费人数'].sum()}")
+    
+    # 第d天的累计转化率 = 付费时长不足 d+1 天的KM估计，与D{d}窗口口径一致
+    curve = pd.DataFrame({DATE_GRAINS[grain]: days_to_dates(km['cohorts']), '注册人数': km['sizes']})
+    longest = cutoff - km['first_registration'] if cutoff is not None else np.zeros(len(km['cohorts']), dtype='i8')
+    for day in range(CURVE_DAYS + 1):
+        bound = (day + 1) * SECONDS_PER_DAY
+        curve[f'D{day}'] = np.where(longest >= bound - 1, km_conversion(km, bound), np.nan)
+    
+    write_report(output_path, [
+        report_sheet('KM转化率', table),
+        report_sheet('生存曲线', curve),
+    ])
+    print(f"生存分析已保存到: {output_path}")
+    return table, curve
+
+if __name__ == "__main__":
+    with profile_run('analyze_survival'):
+        analyze_survival('Result_10.xlsx')
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# 合成数据的分布参数，量级参照真实导出（Result_10.xlsx、3月以来的付费用户情况.xlsx）
+SYNTHETIC_START = '2024-11-01'
+SYNTHETIC_DAYS = 240
+PAY_RATE = 0.35               # 最终付费的用户比例
+FAST_PAY_SHARE = 0.45         # 付费用户中24小时内付费的比例
+FAST_PAY_MEAN_HOURS = 3       # 24小时内付费的平均时长（指数分布）
+SLOW_PAY_MEDIAN_DAYS = 6      # 其余付费用户付费时长的中位数（对数正态）
+MAX_PAY_DAYS = 180
+LOGIN_RATE = 0.9              # 有最后登录时间的比例
+LOGIN_MEAN_DAYS = 25          # 注册到最后登录的平均天数（指数分布）
+RESUME_RATE = 0.6             # 上传简历的比例
+LOGINS_PER_USER = 8           # 登录事件日志中每个用户的平均登录次数（泊松分布）
+
+
+def _seconds(values):
+    return pd.to_timedelta(np.round(values).astype('i8'), unit='s')
+
+
+def generate_user_export(n_rows, seed=0, start=SYNTHETIC_START, days=SYNTHETIC_DAYS):
+    """
+    生成与真实用户导出列结构一致的合成数据：
+    id, 新用户手机号, 注册时间, 上传简历时间, 首次付费时间, 最后登录时间
+    注册时间按白天高峰分布，付费时长为“24小时内指数分布 + 长尾对数正态”的混合分布，
+    未付费、未登录、未上传简历的用户对应列为 NaT
+    """
+    rng = np.random.default_rng(seed)
+
+    # 注册时间：日期均匀分布，一天内集中在 8-23 点
+    reg_day = rng.integers(0, days, n_rows)
+    reg_hour = np.clip(rng.normal(15, 4, n_rows), 0, 23.999)
+    reg_time = pd.Timestamp(start) + pd.to_timedelta(reg_day, unit='D') + _seconds(reg_hour * 3600)
+
+    # 首次付费时间
+    paid = rng.random(n_rows) < PAY_RATE
+    fast = rng.random(n_rows) < FAST_PAY_SHARE
+    fast_delay = np.minimum(rng.exponential(FAST_PAY_MEAN_HOURS * 3600, n_rows), 24 * 3600)
+    slow_delay = np.minimum(rng.lognormal(np.log(SLOW_PAY_MEDIAN_DAYS), 1.0, n_rows) + 1, MAX_PAY_DAYS) * 86400
+    pay_time = reg_time + _seconds(np.where(fast, fast_delay, slow_delay))
+
+    # 最后登录时间，付费用户更活跃
+    has_login = rng.random(n_rows) < LOGIN_RATE
+    login_delay = rng.exponential(LOGIN_MEAN_DAYS * 86400, n_rows) * np.where(paid, 1.5, 1.0)
+    login_time = reg_time + _seconds(login_delay)
+
+    resume = rng.random(n_rows) < RESUME_RATE
+    resume_time = reg_time + _seconds(rng.exponential(2 * 86400, n_rows))
+
+    return pd.DataFrame({
+        'id': np.arange(1, n_rows + 1),
+        '新用户手机号': 13000000000 + rng.permutation(n_rows),
+        '注册时间': reg_time,
+        '上传简历时间': resume_time.where(resume),
+        '首次付费时间': pay_time.where(paid),
+        '最后登录时间': login_time.where(has_login),
+    })
+
+
+def write_user_export(n_rows, output_path, seed=0):
+    """
+    生成合成用户导出并写入CSV（时间列格式与Excel导出的文本一致），返回行数
+    """
+    df = generate_user_export(n_rows, seed)
+    df.to_csv(output_path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+    return len(df)
+
+
+def generate_login_events(users, seed=0, logins_per_user=LOGINS_PER_USER):
+    """
+    为合成用户导出生成登录事件日志：user_id（新用户手机号）, timestamp
+    每个用户的登录次数服从泊松分布，登录时间在注册后按指数分布展开（付费用户更活跃），事件按时间排序
+    """
+    rng = np.random.default_rng(seed)
+    paid = users['首次付费时间'].notna().to_numpy()
+    n_logins = rng.poisson(logins_per_user * np.where(paid, 1.5, 1.0))
+    owner = np.repeat(np.arange(len(users)), n_logins)
+    delay = rng.exponential(LOGIN_MEAN_DAYS * 86400, len(owner)) * np.where(paid[owner], 1.5, 1.0)
+    events = pd.DataFrame({
+        'user_id': users['新用户手机号'].to_numpy()[owner],
+        'timestamp': users['注册时间'].to_numpy()[owner] + _seconds(delay).to_numpy(),
+    })
+    return events.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def write_login_events(users, output_path, seed=0):
+    """
+    生成登录事件日志并写入CSV，返回事件条数
+    """
+    events = generate_login_events(users, seed)
+    events.to_csv(output_path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+    return len(events)
@@ -0,0 +1,132 @@
+import fnmatch
+import os
+import sys
+import time
+from pipeline import ARTIFACTS, dependent_artifacts, run_pipeline
+
+# 监视 data 目录，输入文件变化后只重新生成依赖它的产物
+# 检测方式：每隔 POLL_INTERVAL 秒比较文件的 (mtime, 大小)；安装了 inotify_simple 时
+# 用 inotify 在文件写入时立即唤醒，不必等到下一次轮询
+# 去抖：文件的 (mtime, 大小) 连续 DEBOUNCE_SECONDS 秒不再变化才认为上传完成，避免读到 scp 写了一半的文件
+# 已读取的紧凑用户表保存在内存中，未变化的输入文件在之后的运行中直接复用
+
+POLL_INTERVAL = 1.0
+DEBOUNCE_SECONDS = 2.0
+# 监视的输入文件；Excel 打开时产生的 ~$ 锁文件和隐藏/临时文件被忽略
+WATCH_PATTERNS = ('*.xlsx', '*.csv')
+
+
+def input_snapshot(data_dir, patterns=WATCH_PATTERNS):
+    """
+    data_dir 下输入文件的 {文件名: (mtime_ns, 大小)}
+    """
+    snapshot = {}
+    try:
+        entries = list(os.scandir(data_dir))
+    except FileNotFoundError:
+        return snapshot
+    for entry in entries:
+        name = entry.name
+        if name.startswith(('.', '~$')) or name.endswith('.tmp') or not entry.is_file():
+            continue
+        if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            stat = entry.stat()
+            snapshot[name] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def _inotify_waiter(data_dir):
+    # 返回 wait(timeout)：有文件事件时提前返回；没有 inotify_simple 或不支持时返回 None
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        return None
+    try:
+        inotify = INotify()
+        inotify.add_watch(data_dir, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE | flags.MODIFY)
+    except OSError:
+        return None
+
+    def wait(timeout):
+        inotify.read(timeout=int(timeout * 1000))
+    return wait
+
+
+def changed_inputs(previous, current):
+    """
+    比较两次快照，返回 (新增或修改的文件名集合, 删除的文件名集合)
+    """
+    changed = {name for name, signature in current.items() if previous.get(name) != signature}
+    return changed, set(previous) - set(current)
+
+
+def watch(data_dir='../data', public_dir='../public', report_dir='.', artifacts=None, poll_interval=POLL_INTERVAL,
+          debounce=DEBOUNCE_SECONDS, run_initial=True, max_runs=None, **pipeline_kwargs):
+    """
+    持续监视 data_dir，输入文件变化并稳定 debounce 秒后只重新生成依赖它的产物
+    artifacts: 监视范围内的产物名，默认全部
+    run_initial: 启动时先完整生成一次（同时把输入文件载入内存）
+    max_runs: 完成指定次数的生成后退出，None 表示一直运行直到 Ctrl+C
+    其余参数原样传给 run_pipeline（incremental、workers、chart_mode 等）
+    """
+    artifacts = list(ARTIFACTS) if artifacts is None else list(artifacts)
+    wait = _inotify_waiter(data_dir)
+    print(f"开始监视 {os.path.abspath(data_dir)}（{'inotify' if wait else '轮询'}，去抖 {debounce} 秒），Ctrl+C 退出")
+    if wait is None:
+        wait = time.sleep
+
+    # frames 在多次运行间保留已读取的紧凑用户表
+    frames = {}
+    runs = 0
+    published = input_snapshot(data_dir)
+    pending = {}
+
+    def rebuild(names):
+        nonlocal runs
+        runs += 1
+        try:
+            run_pipeline(data_dir, public_dir, report_dir, names, frames=frames, **pipeline_kwargs)
+        except Exception as error:
+            # 单次生成失败（如上传了损坏的文件）不退出，等待下一次变化
+            print(f"生成失败: {type(error).__name__}: {error}", file=sys.stderr)
+
+    try:
+        if run_initial:
+            rebuild(artifacts)
+        while max_runs is None or runs < max_runs:
+            wait(poll_interval)
+            current = input_snapshot(data_dir)
+            changed, removed = changed_inputs(published, current)
+            for name in removed:
+                frames.pop(name, None)
+                published.pop(name, None)
+                print(f"输入文件已删除: {name}")
+
+            # 记录每个变化文件最近一次签名变化的时间，签名稳定 debounce 秒后才处理
+            now = time.monotonic()
+            for name in changed:
+                if name not in pending or pending[name][0] != current[name]:
+                    pending[name] = (current[name], now)
+            ready = {name for name, (signature, since) in pending.items()
+                     if current.get(name) == signature and now - since >= debounce}
+            for name in set(pending) - set(current):
+                del pending[name]
+            if not ready:
+                continue
+
+            for name in ready:
+                del pending[name]
+                published[name] = current[name]
+                frames.pop(name, None)
+            names = dependent_artifacts(ready, artifacts)
+            print(f"\n检测到输入变化: {', '.join(sorted(ready))}，重新生成: {', '.join(names) or '无'}")
+            if names:
+                rebuild(names)
+    except KeyboardInterrupt:
+        print("停止监视")
+    return runs
+
+
+if __name__ == "__main__":
+    # 用法: python watch.py [产物名 ...]，如 python watch.py conversion_trend pay_time
+    watch(artifacts=sys.argv[1:] or None)
@@ -0,0 +1,52 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# 分析脚本是 scripts 目录下的平铺模块，测试时按脚本目录导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+
+def make_users(n=400, days=40, seed=0, start='2025-03-01'):
+    """
+    小型用户明细：随机注册/付费/登录时间，加上各窗口边界、未付费和付费早于注册的用户
+    """
+    rng = np.random.default_rng(seed)
+    reg = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 86400, n), unit='s')
+    pay = reg + pd.to_timedelta(rng.integers(-86400, 100 * 86400, n), unit='s')
+    pay = pay.where(rng.random(n) < 0.6)
+    login = reg + pd.to_timedelta(rng.integers(0, 60 * 86400, n), unit='s')
+    login = login.where(rng.random(n) < 0.8)
+    base = pd.Timestamp(start) + pd.Timedelta(hours=10)
+    hours = pd.Timedelta(hours=1)
+    edges = [
+        (base, base + 12 * hours),                                   # 12小时窗口边界（含）
+        (base, base + 12 * hours + pd.Timedelta(seconds=1)),         # 刚超出12小时
+        (base, base + 24 * hours),                                   # 24小时窗口边界（含）
+        (base, base + pd.Timedelta(days=8) - pd.Timedelta(seconds=1)),  # 向下取整仍为7天
+        (base, base + pd.Timedelta(days=8)),                         # 8天，超出D7
+        (base, base + pd.Timedelta(days=91) - pd.Timedelta(seconds=1)),
+        (base, base - pd.Timedelta(seconds=1)),                      # 付费早于注册
+        (base, pd.NaT),                                              # 未付费
+    ]
+    frame = pd.DataFrame({
+        '新用户手机号': np.arange(n).astype(str),
+        '注册时间': reg,
+        '首次付费时间': pay,
+        '最后登录时间': login,
+        '渠道': rng.choice(['a', 'b', 'c'], n),
+    })
+    edge_frame = pd.DataFrame({
+        '新用户手机号': [f'e{i}' for i in range(len(edges))],
+        '注册时间': [reg_time for reg_time, _ in edges],
+        '首次付费时间': [pay_time for _, pay_time in edges],
+        '最后登录时间': [reg_time + pd.Timedelta(days=3) for reg_time, _ in edges],
+        '渠道': 'a',
+    })
+    return pd.concat([frame, edge_frame], ignore_index=True)
+
+
+@pytest.fixture
+def users():
+    return make_users()
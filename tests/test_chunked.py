@@ -0,0 +1,38 @@
+import pandas as pd
+from cohort_engine import add_conversion_rates, build_conversion_table, compute_cohort_counts, merge_cohort_counts, \
+    stream_cohort_counts
+from cohort_state import build_conversion_table_incremental, stream_conversion_table_incremental
+from compact_schema import compact_user_table
+
+
+def test_merged_partial_counts_match_whole_table(users):
+    compact = compact_user_table(users)
+    half = len(compact) // 2
+    merged = merge_cohort_counts(compute_cohort_counts(compact.iloc[:half]), compute_cohort_counts(compact.iloc[half:]))
+    pd.testing.assert_frame_equal(merged, compute_cohort_counts(compact), check_dtype=False)
+
+
+def test_stream_counts_match_whole_table(users, tmp_path):
+    path = str(tmp_path / 'users.csv')
+    users.to_csv(path, index=False)
+    streamed = stream_cohort_counts(path, chunk_size=37)
+    pd.testing.assert_frame_equal(streamed, compute_cohort_counts(compact_user_table(users)), check_dtype=False)
+
+
+def test_stream_header_only_file_gives_empty_table(users, tmp_path):
+    path = str(tmp_path / 'empty.csv')
+    users.iloc[:0].to_csv(path, index=False)
+    counts = stream_cohort_counts(path, chunk_size=10)
+    assert len(counts) == 0
+    assert list(add_conversion_rates(counts).columns) == list(build_conversion_table(compact_user_table(users)).columns)
+
+
+def test_stream_incremental_matches_frame_incremental(users, tmp_path):
+    path = str(tmp_path / 'users.csv')
+    users.to_csv(path, index=False)
+    streamed = stream_conversion_table_incremental(path, str(tmp_path / 'a.npz'), chunk_size=50)
+    in_memory = build_conversion_table_incremental(compact_user_table(users), str(tmp_path / 'b.npz'))
+    pd.testing.assert_frame_equal(streamed, in_memory)
+    # 第二次运行使用已保存的状态，结果不变
+    again = stream_conversion_table_incremental(path, str(tmp_path / 'a.npz'), chunk_size=50)
+    pd.testing.assert_frame_equal(again, in_memory)
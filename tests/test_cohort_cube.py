@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+from cohort_cube import build_cohort_cube, cube_query, grain_start_days, load_cube, save_cube
+from cohort_engine import build_conversion_table
+from compact_schema import compact_user_table
+
+DIMENSIONS = {'channel': '渠道'}
+
+
+@pytest.fixture(params=['dense', 'sparse'])
+def cube(request, users):
+    compact = compact_user_table(users, extra_columns=['渠道'])
+    return build_cohort_cube(compact, DIMENSIONS, dense_cell_limit=0 if request.param == 'sparse' else 10 ** 8)
+
+
+def test_date_rollup_matches_conversion_table(cube, users):
+    pd.testing.assert_frame_equal(cube_query(cube, ['date']), build_conversion_table(compact_user_table(users)),
+                                  check_dtype=False)
+
+
+def test_filter_matches_subset(cube, users):
+    subset = users[users['渠道'] == 'b']
+    result = cube_query(cube, ['date'], filters={'channel': 'b'}, date_range=('2025-03-05', '2025-03-20'))
+    expected = build_conversion_table(compact_user_table(subset))
+    dates = pd.to_datetime(expected['注册日期'])
+    expected = expected[(dates >= '2025-03-05') & (dates <= '2025-03-20')].reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_channel_by_week_matches_groupby(cube, users):
+    result = cube_query(cube, ['channel', 'week'])
+    assert list(result.columns[:2]) == ['注册周', 'channel']
+    compact = compact_user_table(users, extra_columns=['渠道'])
+    week = grain_start_days(compact['reg_day'].to_numpy(), 'week')
+    paid = (compact['pay_delta'] >= 0) & (compact['pay_delta'] < 8 * 86400)
+    expected = pd.DataFrame({'channel': compact['渠道'], 'week': week, 'paid': paid}).groupby(
+        ['week', 'channel'])['paid'].agg(['size', 'sum']).reset_index()
+    assert result['注册人数'].tolist() == expected['size'].tolist()
+    assert result['D7付费人数'].tolist() == expected['sum'].tolist()
+
+
+def test_total_without_grouping(cube, users):
+    result = cube_query(cube, [])
+    assert len(result) == 1 and result['注册人数'].iloc[0] == len(users)
+
+
+def test_save_and_load_round_trip(cube, tmp_path):
+    path = str(tmp_path / 'cube.npz')
+    loaded = load_cube(save_cube(cube, path))
+    pd.testing.assert_frame_equal(cube_query(loaded, ['channel', 'month']), cube_query(cube, ['channel', 'month']))
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from cohort_engine import DEFAULT_HORIZONS, assign_horizon_bins, build_conversion_table
+from compact_schema import NEVER, compact_user_table
+
+
+def baseline_conversion_table(df):
+    # 原先逐日期扫描全表的实现：小时窗口按小时数、天窗口按向下取整的天数，均含边界且要求 >= 0
+    df = df.dropna(subset=['注册时间']).copy()
+    df['注册日期'] = df['注册时间'].dt.date
+    delta = df['首次付费时间'] - df['注册时间']
+    df['天数'] = delta.dt.days
+    df['小时数'] = delta.dt.total_seconds() / 3600
+    rows = []
+    for reg_date, users in df.groupby('注册日期'):
+        row = {'注册日期': reg_date, '注册人数': len(users)}
+        for prefix, value, unit in DEFAULT_HORIZONS:
+            column = '小时数' if unit == 'h' else '天数'
+            row[f'{prefix}付费人数'] = int(((users[column] >= 0) & (users[column] <= value)).sum())
+        rows.append(row)
+    result = pd.DataFrame(rows)
+    for prefix, _, _ in DEFAULT_HORIZONS:
+        result[f'{prefix}转化率'] = result[f'{prefix}付费人数'] / result['注册人数']
+    return result
+
+
+def test_matches_baseline_per_day_loop(users):
+    expected = baseline_conversion_table(users)
+    result = build_conversion_table(compact_user_table(users))
+    assert result['注册日期'].tolist() == expected['注册日期'].tolist()
+    for column in expected.columns[1:]:
+        assert np.allclose(result[column].to_numpy(dtype='f8'), expected[column].to_numpy(dtype='f8')), column
+
+
+def test_horizon_bins_edges():
+    horizons = [('D12h', 12, 'h'), ('D7', 7, 'd')]
+    deltas = np.array([0, 12 * 3600, 12 * 3600 + 1, 8 * 86400 - 1, 8 * 86400, -1, NEVER])
+    assert assign_horizon_bins(deltas, horizons).tolist() == [0, 0, 1, 1, 2, 2, 2]
+
+
+def test_edge_users_counted_once_per_window(users):
+    edges = users[users['新用户手机号'].str.startswith('e')]
+    result = build_conversion_table(compact_user_table(edges))
+    assert len(result) == 1
+    row = result.iloc[0]
+    assert row['注册人数'] == 8
+    assert (row['D12h付费人数'], row['D24h付费人数'], row['D7付费人数'], row['D14付费人数'],
+            row['D30付费人数'], row['D90付费人数']) == (1, 3, 4, 5, 5, 6)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from cohort_engine import build_conversion_table
+from cohort_state import build_conversion_table_incremental, load_cohort_state
+from compact_schema import compact_user_table
+from conftest import make_users
+
+
+def snapshot(users, until):
+    # 截至 until 的导出：之后注册的用户不在导出中，之后发生的付费尚未发生
+    until = pd.Timestamp(until)
+    frame = users[users['注册时间'] <= until].copy()
+    frame['首次付费时间'] = frame['首次付费时间'].where(frame['首次付费时间'] <= until)
+    return frame
+
+
+def test_incremental_runs_match_full_recompute(tmp_path):
+    users = make_users(n=3000, days=300, seed=4)
+    state_path = str(tmp_path / 'state.npz')
+    for until in ['2025-04-01', '2025-07-15', '2025-10-01', '2025-12-20', '2026-02-01']:
+        export = snapshot(users, until)
+        incremental = build_conversion_table_incremental(compact_user_table(export), state_path)
+        pd.testing.assert_frame_equal(incremental, build_conversion_table(compact_user_table(export)))
+    # 最后几次运行确实冻结了早期注册日
+    assert load_cohort_state(state_path)['watermark'] > compact_user_table(users)['reg_day'].min()
+
+
+def test_appended_batches_match_full_table(users, tmp_path):
+    state_path = str(tmp_path / 'state.npz')
+    compact = compact_user_table(users)
+    for batch in np.array_split(np.arange(len(compact)), 3):
+        result = build_conversion_table_incremental(compact.iloc[batch], state_path, snapshot=False)
+    pd.testing.assert_frame_equal(result, build_conversion_table(compact))
+
+
+def test_changed_horizons_reset_state(users, tmp_path):
+    state_path = str(tmp_path / 'state.npz')
+    compact = compact_user_table(users)
+    build_conversion_table_incremental(compact, state_path)
+    horizons = [('D3', 3, 'd')]
+    result = build_conversion_table_incremental(compact, state_path, horizons)
+    pd.testing.assert_frame_equal(result, build_conversion_table(compact, horizons))
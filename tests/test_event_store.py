@@ -0,0 +1,25 @@
+import pandas as pd
+from compact_schema import compact_user_table
+from event_store import ingest_user_export, load_compact, open_store
+
+
+def test_ingested_rows_round_trip(users, tmp_path):
+    users = users.copy()
+    users.loc[users.index[:3], '注册时间'] = pd.NaT
+    users.loc[users.index[3:6], '渠道'] = None
+    path = str(tmp_path / 'users.csv')
+    users.to_csv(path, index=False)
+    conn = open_store(str(tmp_path / 'events.db'))
+    try:
+        # 分块和批次大小都不整除行数
+        assert ingest_user_export(conn, path, chunk_size=70, batch_rows=30) == len(users) - 3
+        assert ingest_user_export(conn, path) is None
+        stored = load_compact(conn, 'users.csv')
+    finally:
+        conn.close()
+    expected = compact_user_table(users.dropna(subset=['注册时间']).astype({'新用户手机号': str}),
+                                  extra_columns=['渠道'])
+    stored = stored.sort_values('user_id', key=lambda ids: ids.astype(str), kind='stable').reset_index(drop=True)
+    expected = expected.sort_values('user_id', kind='stable').reset_index(drop=True)
+    stored['user_id'] = stored['user_id'].astype(str)
+    pd.testing.assert_frame_equal(stored[expected.columns], expected, check_dtype=False)
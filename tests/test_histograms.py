@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from histograms import histogram, histogram_counts, histogram_labels, histogram_spec, merge_histograms
+
+DELTAS = np.random.default_rng(5).integers(-86400, 60 * 86400, 2000)
+
+
+def cut_counts(deltas, n_bins, step):
+    # 逐行分类的参考实现：左闭右开区间，超出范围的值不计入
+    bins = pd.cut(deltas / step, bins=np.arange(n_bins + 1), right=False)
+    return pd.Series(bins).value_counts().sort_index().to_numpy()
+
+
+def test_drop_matches_interval_cut():
+    hist = histogram(DELTAS, histogram_spec('day', bins=35))
+    assert np.array_equal(hist['counts'], cut_counts(DELTAS, 35, 86400))
+    assert hist['underflow'] == np.count_nonzero(DELTAS < 0)
+    assert hist['overflow'] == np.count_nonzero(DELTAS >= 35 * 86400)
+    assert len(histogram_counts(hist)) == 35
+
+
+def test_clip_folds_overflow_into_last_bin():
+    drop = histogram(DELTAS, histogram_spec('day', bins=35))
+    clip = histogram(DELTAS, histogram_spec('day', bins=35, overflow='clip'))
+    assert np.array_equal(clip['counts'][:-1], drop['counts'][:-1])
+    assert clip['counts'][-1] == drop['counts'][-1] + drop['overflow']
+
+
+def test_bucket_adds_overflow_bin():
+    hist = histogram(DELTAS, histogram_spec('day', bins=35, overflow='bucket'))
+    assert histogram_labels(hist)[-1] == '35天+'
+    assert histogram_counts(hist)[-1] == np.count_nonzero(DELTAS >= 35 * 86400)
+    assert sum(histogram_counts(hist)) == np.count_nonzero(DELTAS >= 0)
+
+
+def test_hour_bins_within_day():
+    hist = histogram(DELTAS, histogram_spec('hour', bins=24))
+    assert np.array_equal(hist['counts'], cut_counts(DELTAS, 24, 3600))
+    assert histogram_labels(hist)[:2] == ['0-1h', '1-2h']
+
+
+def test_log_scale_edges():
+    hist = histogram([0, 3599, 3600, 7199, 7200, 14400, 10 ** 7], histogram_spec('hour', bins=4, scale='log'))
+    # 分箱 [0,1) [1,2) [2,4) [4,8) 小时
+    assert hist['counts'].tolist() == [2, 2, 1, 1]
+    assert hist['overflow'] == 1
+
+
+def test_merged_chunks_match_whole():
+    spec = histogram_spec('day', overflow='bucket')
+    merged = merge_histograms(histogram(DELTAS[:700], spec), histogram(DELTAS[700:], spec))
+    whole = histogram(DELTAS, spec)
+    assert np.array_equal(merged['counts'], whole['counts'])
+    assert (merged['overflow'], merged['underflow']) == (whole['overflow'], whole['underflow'])
+
+
+def test_invalid_overflow_mode():
+    with pytest.raises(ValueError):
+        histogram_spec(overflow='wrap')
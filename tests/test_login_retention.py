@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from compact_schema import compact_user_table
+from login_retention import build_activity_bitmap, retention_matrices, retention_rate_frame
+
+HORIZON = 10
+
+
+def test_matrices_match_hand_built_log(tmp_path):
+    # 第一周（2025-03-03 周一）注册 u1、u2，第二周注册 u3
+    users = pd.DataFrame({
+        '新用户手机号': ['u1', 'u2', 'u3'],
+        '注册时间': pd.to_datetime(['2025-03-03 09:00', '2025-03-05 20:00', '2025-03-10 08:00']),
+    })
+    events = pd.DataFrame([
+        ('u1', '2025-03-03 10:00'), ('u1', '2025-03-04 08:00'), ('u1', '2025-03-04 22:00'),
+        ('u1', '2025-03-10 12:00'),
+        ('u2', '2025-03-06 01:00'), ('u2', '2025-03-02 12:00'),   # 注册前的登录不计入
+        ('u3', '2025-03-12 18:00'),
+        ('u9', '2025-03-13 07:00'),                               # 未知用户只推进观察截止日
+    ], columns=['user_id', 'timestamp'])
+    event_path = tmp_path / 'events.csv'
+    events.to_csv(event_path, index=False)
+
+    bitmap = build_activity_bitmap(compact_user_table(users), str(event_path), HORIZON, chunk_size=3)
+    assert (bitmap['events'], bitmap['matched_events']) == (8, 6)
+    matrices = retention_matrices(bitmap, block_users=2)
+
+    classic = np.zeros((2, HORIZON), dtype='i8')
+    classic[0, [0, 1, 7]] = [1, 2, 1]
+    classic[1, 2] = 1
+    assert matrices['cohort_sizes'].tolist() == [2, 1]
+    assert np.array_equal(matrices['classic'], classic)
+
+    # 滚动留存：最后活跃日 u1=第7天、u2=第1天、u3=第2天
+    rolling = np.zeros((2, HORIZON), dtype='i8')
+    rolling[0, :2], rolling[0, 2:8] = 2, 1
+    rolling[1, :3] = 1
+    assert np.array_equal(matrices['rolling'], rolling)
+
+    # 观察截止日 03-13：第一周最后注册日 03-05 成熟到第8天，第二周 03-10 成熟到第3天
+    assert matrices['mature'].sum(axis=1).tolist() == [9, 4]
+    frame = retention_rate_frame(matrices, 'classic', days=[1, 7, 9])
+    assert frame['自然周'].tolist() == ['2025-03-03', '2025-03-10']
+    assert frame['D1'].tolist()[0] == 1.0 and np.isnan(frame['D9'].tolist()[0])
+    assert frame['D7'].isna().tolist() == [False, True]
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from conftest import make_users
+from merge_exports import merge_user_frames
+
+
+def exports():
+    users = make_users(n=300, seed=6)
+    rng = np.random.default_rng(6)
+    old = users.sample(200, random_state=1).copy()
+    new = users.sample(200, random_state=2).copy()
+    # 新导出中部分用户的付费、登录、渠道发生变化，部分值缺失
+    new['最后登录时间'] = new['最后登录时间'] + pd.to_timedelta(rng.integers(-3, 5, len(new)), unit='D')
+    new['渠道'] = np.where(rng.random(len(new)) < 0.2, 'd', new['渠道'])
+    new.loc[new.index[:20], '渠道'] = None
+    old.loc[old.index[:5], '新用户手机号'] = None
+    return [old, new]
+
+
+def test_merge_matches_groupby_reference():
+    frames = exports()
+    merged, report = merge_user_frames(frames)
+    combined = pd.concat(frames, ignore_index=True)
+    keyed = combined[combined['新用户手机号'].notna()]
+    expected = keyed.groupby('新用户手机号', sort=False).agg({
+        '注册时间': 'min', '首次付费时间': 'min', '最后登录时间': 'max', '渠道': 'last'}).reset_index()
+    result = merged[merged['新用户手机号'].notna()].reset_index(drop=True)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+    # 没有用户ID的行原样保留在最后
+    assert merged['新用户手机号'].isna().sum() == 5
+    assert report['用户数'] == keyed['新用户手机号'].nunique()
+    assert report['重复行数'] == len(keyed) - report['用户数']
+    assert report['合并后行数'] == report['用户数'] + 5
+
+
+def test_report_counts_updates_and_fills():
+    first = pd.DataFrame({'新用户手机号': ['a', 'b', 'c'], '渠道': ['x', None, 'y'], '套餐': [1, 2, None]})
+    second = pd.DataFrame({'新用户手机号': ['a', 'b', 'c'], '渠道': ['z', 'w', None], '套餐': [1, 2, 3]})
+    merged, report = merge_user_frames([first, second])
+    assert merged['渠道'].tolist() == ['z', 'w', 'y']
+    assert report['各列更新用户数'] == {'渠道': 1, '套餐': 0}
+    assert report['各列填充用户数'] == {'渠道': 1, '套餐': 1}
+    assert (report['更新用户数'], report['填充用户数']) == (1, 2)
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from cohort_engine import compute_cohort_counts
+from compact_schema import compact_user_table
+from parallel_cohorts import parallel_cohort_counts, parallel_retention_partials, shard_row_bounds
+from retention import retention_partials
+
+
+def test_shards_do_not_split_a_registration_day():
+    reg_day = np.array([1, 1, 1, 2, 2, 3, 3, 3, 3, 4])
+    bounds = shard_row_bounds(reg_day, 3)
+    assert bounds[0][0] == 0 and bounds[-1][1] == len(reg_day)
+    for start, stop in bounds[1:]:
+        assert reg_day[start] != reg_day[start - 1]
+
+
+def test_parallel_counts_match_serial(users):
+    compact = compact_user_table(users)
+    parallel = parallel_cohort_counts(compact, workers=3, min_shard_rows=1)
+    pd.testing.assert_frame_equal(parallel, compute_cohort_counts(compact))
+
+
+def test_parallel_retention_partials_match_serial(users):
+    compact = compact_user_table(users)
+    parallel = parallel_retention_partials(compact, workers=3, min_shard_rows=1)
+    serial = retention_partials(compact)
+    assert parallel.keys() == serial.keys()
+    for key, value in serial.items():
+        if isinstance(value, pd.DataFrame):
+            pd.testing.assert_frame_equal(parallel[key].reset_index(drop=True), value.reset_index(drop=True),
+                                          check_dtype=False)
+        elif isinstance(value, np.ndarray):
+            assert np.array_equal(parallel[key], value), key
+        else:
+            assert parallel[key] == value, key
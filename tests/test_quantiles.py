@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from periods import generate_periods, period_quantiles
+from quantiles import (exact_quantiles, new_sketch, sketch_from_bytes, sketch_merge, sketch_quantiles,
+                       sketch_to_bytes, sketch_update)
+
+QS = np.array([0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99])
+EPSILON = 0.01
+
+
+def _rank_error(data, estimates, qs):
+    # 估计值在全部数据中的秩区间与目标秩 q*n 的最小距离，按 n 归一化
+    data = np.sort(data)
+    lower = np.searchsorted(data, estimates, side='left')
+    upper = np.searchsorted(data, estimates, side='right')
+    target = qs * len(data)
+    return np.maximum(np.maximum(lower - target, target - upper), 0) / len(data)
+
+
+def test_sketch_within_epsilon_rank_error():
+    data = np.random.default_rng(0).lognormal(size=200000)
+    sketch = new_sketch(EPSILON)
+    for batch in np.array_split(data, 37):
+        sketch_update(sketch, batch)
+    assert sketch['n'] == len(data)
+    assert _rank_error(data, sketch_quantiles(sketch, QS), QS).max() <= EPSILON
+    assert sketch_quantiles(sketch, [0, 1]).tolist() == [data.min(), data.max()]
+
+
+def test_merged_sketches_match_single_sketch():
+    rng = np.random.default_rng(1)
+    parts = [rng.normal(loc, 1, size) for loc, size in [(0, 50000), (3, 80000), (-2, 30000)]]
+    data = np.concatenate(parts)
+    single = sketch_update(new_sketch(EPSILON), data)
+    merged = new_sketch(EPSILON)
+    for part in parts:
+        merged = sketch_merge(merged, sketch_update(new_sketch(EPSILON), part))
+    assert (merged['n'], merged['min'], merged['max']) == (single['n'], single['min'], single['max'])
+    assert _rank_error(data, sketch_quantiles(merged, QS), QS).max() <= EPSILON
+    assert _rank_error(data, sketch_quantiles(single, QS), QS).max() <= EPSILON
+
+
+def test_sketch_bytes_round_trip():
+    sketch = sketch_update(new_sketch(EPSILON), np.random.default_rng(2).random(30000))
+    restored = sketch_from_bytes(sketch_to_bytes(sketch))
+    assert np.array_equal(sketch_quantiles(restored, QS), sketch_quantiles(sketch, QS))
+    # 还原后的草图可以继续合并
+    assert sketch_merge(restored, sketch)['n'] == 2 * sketch['n']
+    empty = sketch_from_bytes(sketch_to_bytes(new_sketch(EPSILON)))
+    assert empty['n'] == 0 and np.isnan(sketch_quantiles(empty, QS)).all()
+
+
+def test_period_quantiles_routes_large_groups_to_sketch():
+    periods = generate_periods(0, 13, 'weekly', anchor='1970-01-01')
+    rng = np.random.default_rng(3)
+    days = np.repeat([0, 7], [50, 5000])
+    table = pd.DataFrame({'rate': rng.random(len(days))})
+    sketched = period_quantiles(table, days, periods, ['rate'], QS, exact_limit=1000, epsilon=0.05)['rate']
+    small = table['rate'].to_numpy()[:50]
+    large = table['rate'].to_numpy()[50:]
+    # 小于上限的周期精确计算，超过上限的周期误差在 epsilon 以内
+    assert np.array_equal(sketched[0], exact_quantiles(small, QS))
+    assert _rank_error(large, sketched[1], QS).max() <= 0.05
@@ -0,0 +1,36 @@
+import gzip
+import json
+import pytest
+import query_service
+from query_service import handle_query, new_service
+
+
+@pytest.fixture
+def service(users, tmp_path):
+    users.to_csv(tmp_path / 'users.csv', index=False)
+    return new_service(str(tmp_path), datasets={'users': 'users.csv'})
+
+
+def test_conversion_query_is_cached_with_gzip(service):
+    status, payload, etag, compressed = handle_query(service, '/api/conversion', 'group=week,channel')
+    assert status == 200 and etag
+    assert json.loads(payload)['group'] == ['week', 'channel']
+    assert gzip.decompress(compressed) == payload
+    assert handle_query(service, '/api/conversion', 'group=week,channel')[3] is compressed
+
+
+@pytest.mark.parametrize('group', ['date,week', 'channel,channel', 'date,colour'])
+def test_invalid_group_is_rejected(service, group):
+    status, payload, etag, _ = handle_query(service, '/api/conversion', f'group={group}')
+    assert status == 400 and etag is None
+    assert 'error' in json.loads(payload)
+
+
+def test_unexpected_error_returns_500(service, monkeypatch):
+    def broken(*args, **kwargs):
+        raise IndexError('boom')
+
+    monkeypatch.setattr(query_service, 'cube_query', broken)
+    status, payload, etag, compressed = handle_query(service, '/api/conversion', 'group=date')
+    assert (status, etag, compressed) == (500, None, None)
+    assert json.loads(payload)['error']
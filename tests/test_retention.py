@@ -0,0 +1,22 @@
+import pandas as pd
+from compact_schema import compact_user_table
+from retention import merge_retention_partials, retention_partials
+from retention_analysis import report_retention
+
+
+def test_merged_partials_match_whole_table(users):
+    compact = compact_user_table(users)
+    half = len(compact) // 2
+    merged = merge_retention_partials(retention_partials(compact.iloc[:half]), retention_partials(compact.iloc[half:]))
+    whole = retention_partials(compact)
+    pd.testing.assert_frame_equal(merged['weekly'].sort_index(), whole['weekly'].sort_index(), check_dtype=False)
+    assert merged['days_hist'].tolist() == whole['days_hist'].tolist()
+
+
+def test_report_without_retained_users(users, tmp_path):
+    # 没有注册后的登录记录：留存表和分布都为空，仍然写出报告
+    users = users.assign(最后登录时间=pd.NaT)
+    weekly, distribution = report_retention(retention_partials(compact_user_table(users)),
+                                            str(tmp_path / 'retention.xlsx'))
+    assert len(weekly) == 0 and distribution['用户数'].sum() == 0
+    assert (tmp_path / 'retention.xlsx').exists()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from cohort_engine import build_conversion_table
+from compact_schema import compact_user_table, observation_cutoff
+from survival import kaplan_meier, km_conversion, mask_immature_rates, survival_table
+
+HOUR = pd.Timedelta(hours=1)
+START = pd.Timestamp('2025-01-01')
+
+
+def test_kaplan_meier_matches_hand_computed_curve():
+    frame = pd.DataFrame({
+        '注册时间': [START] * 5 + [START + 2 * HOUR],
+        '首次付费时间': [START + HOUR, START + 3 * HOUR, START + 3 * HOUR, pd.NaT, START + 5 * HOUR, pd.NaT],
+    })
+    # 截止于第4小时：第5小时的付费尚未发生，与未付费用户一起在截止时间删失；最后一名用户在第2小时删失
+    km = kaplan_meier(compact_user_table(frame), 'date', START + 4 * HOUR)
+    assert km['sizes'].tolist() == [6] and km['paid'].tolist() == [3]
+    # t=1h: 风险6人付费1人 -> 5/6；t=3h: 风险4人付费2人 -> 5/6 * 2/4
+    assert km['times'].tolist() == [3600, 3 * 3600]
+    assert np.allclose(km['survival'], [5 / 6, 5 / 12])
+    assert np.allclose(km_conversion(km, 3600), 0)
+    assert np.allclose(km_conversion(km, 3 * 3600), 1 / 6)
+    assert np.allclose(km_conversion(km, 3 * 3600 + 1), 7 / 12)
+
+
+def test_report_and_km_share_observation_cutoff(users):
+    compact = compact_user_table(users)
+    cutoff = observation_cutoff(compact)
+    table = survival_table(compact, grain='date', observed_until=cutoff)
+    masked = mask_immature_rates(build_conversion_table(compact), observed_until=cutoff)
+    assert table['注册日期'].tolist() == masked['注册日期'].tolist()
+    for prefix in ['D12h', 'D7', 'D30', 'D90']:
+        reported = masked[f'{prefix}转化率'].to_numpy(dtype='f8')
+        km_mature = table[f'{prefix}成熟转化率'].to_numpy(dtype='f8')
+        # 报告中成熟的日期在生存分析中也成熟，且直接计数的转化率相同
+        mature = ~np.isnan(reported)
+        assert not np.isnan(km_mature[mature]).any()
+        assert np.allclose(reported[mature], km_mature[mature])
+        # 成熟队列的 KM 估计等于直接计数
+        assert np.allclose(table[f'{prefix}KM转化率'].to_numpy()[mature], reported[mature])